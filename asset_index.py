@@ -0,0 +1,344 @@
+"""Índice precalculado de las imágenes del proyecto.
+
+Asocia cada nombre lógico (tal como aparece en elementos.json / steps.json) con su ruta, tamaño,
+mtime, dimensiones, formato y hash de contenido. Se construye una vez (al arrancar o con
+`python asset_index.py`) y se guarda en .cache/asset_index.json; las búsquedas de
+paths.first_existing()/all_existing() lo consultan en lugar de hacer Path.exists() en cada rerun.
+
+El hash también deduplica: imágenes con bytes idénticos en images/ e 'imagenes montaje/' comparten
+derivados en todas las cachés (content_id) y `python asset_index.py --duplicates [--hardlink]`
+informa del ahorro y, si se pide, deja una sola copia en disco mediante enlaces duros.
+
+Las altas, bajas y renombrados se detectan por el mtime de las carpetas indexadas (una llamada
+stat por carpeta, como mucho cada INDEX_RECHECK_SECONDS). Sobrescribir una imagen sin cambiar su
+nombre no cambia el mtime de la carpeta, así que by_path() -lo que usan content_id(),
+stat_signature() y las claves de derivados- compara además la entrada con os.stat del fichero y,
+si el tamaño o el mtime no coinciden, la vuelve a describir y hashear y guarda el índice.
+
+En disco las rutas van relativas a la raíz del proyecto: un índice copiado con el proyecto a otra
+carpeta sigue valiendo (y, si las fechas no se conservaron, se rehace reutilizando los hashes de los
+ficheros que no han cambiado).
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from bundle import Member, get_bundle
+from paths import BASE_DIR, ELEMENTS_IMG_DIR, STEPS_IMG_DIR
+
+# ===================== Parámetros (ajustables) =====================
+INDEX_PATH = BASE_DIR / ".cache" / "asset_index.json"
+INDEX_RECHECK_SECONDS = 5.0  # frecuencia máxima del chequeo de mtimes de carpeta
+INDEXED_DIRS = (ELEMENTS_IMG_DIR, STEPS_IMG_DIR)
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+INDEX_VERSION = 3  # 3: rutas relativas a BASE_DIR en disco
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class AssetInfo:
+    name: str      # ruta relativa a su carpeta, en formato POSIX (el nombre que usan los JSON)
+    path: str      # ruta absoluta tal como la construyen las apps (carpeta / nombre)
+    size: int
+    mtime_ns: int
+    width: int
+    height: int
+    format: str
+    sha256: str
+    orientation: int = 1  # etiqueta EXIF Orientation (5-8: la foto se ve con ancho y alto intercambiados)
+
+    @property
+    def display_size(self) -> Tuple[int, int]:
+        """(ancho, alto) tal como se ve la foto, una vez aplicada la orientación EXIF."""
+        return (self.height, self.width) if self.orientation in (5, 6, 7, 8) else (self.width, self.height)
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _describe(path: Path, name: str, previous: Optional[AssetInfo]) -> Optional[AssetInfo]:
+    st_ = path.stat()
+    if previous is not None and (previous.size, previous.mtime_ns) == (st_.st_size, st_.st_mtime_ns):
+        return previous  # sin cambios: no se vuelve a leer ni a hashear
+    try:
+        with Image.open(path) as im:  # solo cabecera: no decodifica píxeles
+            width, height = im.size
+            fmt = (im.format or "").lower()
+            orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+    except OSError:
+        return None  # no es una imagen legible: para las apps es como si no existiera
+    return AssetInfo(name, str(path), st_.st_size, st_.st_mtime_ns, width, height, fmt, _sha256(path), orientation)
+
+
+class AssetIndex:
+    """Búsquedas en memoria: nombre lógico -> AssetInfo, por carpeta."""
+
+    def __init__(self, dirs: Dict[str, Dict[str, AssetInfo]], dir_mtimes: Dict[str, int]):
+        self.dirs = dirs
+        self.dir_mtimes = dir_mtimes
+        self._by_path: Dict[str, AssetInfo] = {a.path: a for assets in dirs.values() for a in assets.values()}
+        self._lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.built_at = time.time_ns()  # cambia también si se rehace una entrada: los índices derivados se renuevan
+
+    def covers(self, dir_path: Path) -> bool:
+        return str(dir_path) in self.dirs
+
+    def lookup(self, dir_path: Path, name: str) -> Optional[AssetInfo]:
+        return self.dirs.get(str(dir_path), {}).get(name)
+
+    def by_path(self, path: Path) -> Optional[AssetInfo]:
+        """Entrada de una ruta, comprobada contra os.stat: el hash nunca es el de una versión anterior."""
+        info = self._by_path.get(str(path))
+        if info is None:
+            return None
+        try:
+            st_ = os.stat(info.path)
+        except FileNotFoundError:
+            return None
+        if (st_.st_size, st_.st_mtime_ns) == (info.size, info.mtime_ns):
+            return info
+        return self._redescribe(info)
+
+    def _redescribe(self, stale: AssetInfo) -> Optional[AssetInfo]:
+        """Imagen sobrescrita en su sitio: nueva entrada (o ninguna si ya no se puede leer), guardada en disco."""
+        fresh = _describe(Path(stale.path), stale.name, None)
+        with self._lock:
+            for assets in self.dirs.values():
+                if assets.get(stale.name) is stale:
+                    if fresh is None:
+                        del assets[stale.name]
+                    else:
+                        assets[stale.name] = fresh
+            if fresh is None:
+                self._by_path.pop(stale.path, None)
+            else:
+                self._by_path[stale.path] = fresh
+            self.built_at = time.time_ns()
+            self.save()  # también para el próximo arranque
+        return fresh
+
+    def is_current(self) -> bool:
+        """True si ninguna carpeta indexada ha cambiado (una llamada stat por carpeta)."""
+        for root in INDEXED_DIRS:
+            if str(root) not in self.dirs and root.exists():
+                return False  # carpeta que no existía al indexar (o de otra configuración)
+        for d, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    def assets(self) -> Iterable[AssetInfo]:
+        return self._by_path.values()
+
+    def duplicates(self) -> List[List[AssetInfo]]:
+        """Grupos de imágenes con bytes idénticos (dos o más rutas por hash), de mayor a menor ahorro."""
+        groups: Dict[str, List[AssetInfo]] = {}
+        for a in self.assets():
+            groups.setdefault(a.sha256, []).append(a)
+        dups = [sorted(g, key=lambda a: a.path) for g in groups.values() if len(g) > 1]
+        return sorted(dups, key=lambda g: (-g[0].size * (len(g) - 1), g[0].path))
+
+    # ---------- persistencia ----------
+    def save(self, path: Path = INDEX_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": INDEX_VERSION,
+            "dir_mtimes": {_relative(d): mtime for d, mtime in self.dir_mtimes.items()},
+            "dirs": {
+                _relative(d): [dict(asdict(a), path=_relative(a.path)) for a in assets.values()]
+                for d, assets in self.dirs.items()
+            },
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH) -> Optional["AssetIndex"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        dirs = {
+            _absolute(d): {a["name"]: AssetInfo(**dict(a, path=_absolute(a["path"]))) for a in assets}
+            for d, assets in data["dirs"].items()
+        }
+        return cls(dirs, {_absolute(d): mtime for d, mtime in data["dir_mtimes"].items()})
+
+
+def _relative(path: str) -> str:
+    return Path(path).relative_to(BASE_DIR).as_posix()
+
+
+def _absolute(rel: str) -> str:
+    return str(BASE_DIR / rel)
+
+
+def build_index(previous: Optional[AssetIndex] = None) -> AssetIndex:
+    """Recorre las carpetas de imágenes; reutiliza las entradas de `previous` que no han cambiado."""
+    dirs: Dict[str, Dict[str, AssetInfo]] = {}
+    dir_mtimes: Dict[str, int] = {}
+    for root in dict.fromkeys(INDEXED_DIRS):  # sin duplicados si ambas rutas coinciden
+        if not root.exists():
+            continue
+        assets: Dict[str, AssetInfo] = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            dir_mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            for fn in sorted(filenames):
+                p = Path(dirpath) / fn
+                if p.suffix.lower() not in IMAGE_EXTS:
+                    continue
+                name = p.relative_to(root).as_posix()
+                prev = previous.lookup(root, name) if previous is not None else None
+                info = _describe(p, name, prev)
+                if info is not None:
+                    assets[name] = info
+        dirs[str(root)] = assets
+    return AssetIndex(dirs, dir_mtimes)
+
+
+_index: Optional[AssetIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_asset_index() -> AssetIndex:
+    """Índice vigente del proceso: se carga de disco o se construye, y se renueva si cambian las carpetas."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = AssetIndex.load()
+            if _index is not None and not _index.is_current():
+                _index = build_index(_index)
+                _index.save()
+            elif _index is None:
+                _index = build_index()
+                _index.save()
+        elif time.monotonic() - _index.checked_at > INDEX_RECHECK_SECONDS:
+            if _index.is_current():
+                _index.checked_at = time.monotonic()
+            else:
+                _index = build_index(_index)
+                _index.save()
+        return _index
+
+
+def refresh_index() -> AssetIndex:
+    """Reconstruye el índice comprobando cada fichero (detecta también imágenes sobrescritas)."""
+    global _index
+    with _index_lock:
+        _index = build_index(AssetIndex.load())
+        _index.save()
+        return _index
+
+
+def _bundle_member(path: Path) -> Optional[Member]:
+    bundle = get_bundle()
+    return bundle.info(path) if bundle is not None else None
+
+
+def content_id(path: Path) -> str:
+    """Identidad del contenido de una imagen: su hash si está indexada o empaquetada (las copias
+    idénticas comparten identidad y, por tanto, derivados); si no, ruta + mtime + tamaño."""
+    info = get_asset_index().by_path(path)
+    if info is not None:
+        return f"sha256:{info.sha256}"
+    member = _bundle_member(path)
+    if member is not None:
+        return f"sha256:{member.sha256}"
+    st_ = os.stat(path)
+    return f"{os.path.abspath(path)}|{st_.st_mtime_ns}|{st_.st_size}"
+
+
+def hardlink_duplicates(index: AssetIndex) -> int:
+    """Sustituye cada copia por un enlace duro a la primera de su grupo; devuelve los bytes liberados."""
+    freed = 0
+    for group in index.duplicates():
+        keep = group[0]
+        for dup in group[1:]:
+            if os.path.samefile(keep.path, dup.path):
+                continue  # ya enlazados
+            tmp = f"{dup.path}.{os.getpid()}.lnk"
+            os.link(keep.path, tmp)
+            os.replace(tmp, dup.path)  # atómico: la ruta nunca deja de existir
+            freed += dup.size
+    return freed
+
+
+def print_duplicate_report(index: AssetIndex) -> None:
+    """Espacio que ocupan las copias en disco y lo que dejan de ocupar en las cachés al deduplicar."""
+    from derivative_cache import get_cache  # import diferido: derivative_cache depende de este módulo
+
+    groups = index.duplicates()
+    copies = sum(len(g) - 1 for g in groups)
+    disk = sum(g[0].size * (len(g) - 1) for g in groups)
+    print(f"{len(groups)} grupos de imágenes idénticas, {copies} copias, {disk / 2**20:.1f} MB repetidos en disco")
+    for g in groups:
+        names = ", ".join(str(Path(a.path).relative_to(BASE_DIR)) for a in g)
+        print(f"  {g[0].size / 2**10:7.0f} KB x{len(g)}  {names}")
+    # Cada copia habría tenido su propio derivado en disco y sus bytes de pantalla en memoria;
+    # ahora comparten clave. Se estima con el tamaño medio de lo que hay en la caché de disco.
+    disk_cache = get_cache().stats()
+    if disk_cache["entries"]:
+        avg = disk_cache["bytes"] / disk_cache["entries"]
+        print(f"caché de derivados: ~{copies * avg / 2**20:.1f} MB evitados por caja de pantalla "
+              f"({copies} derivados menos, media {avg / 2**10:.0f} KB)")
+
+
+def stat_signature(path: Path) -> Tuple[int, int]:
+    """(mtime_ns, tamaño) de una imagen: del índice o del paquete si está, si no con os.stat."""
+    info = get_asset_index().by_path(path)
+    if info is not None:
+        return info.mtime_ns, info.size
+    member = _bundle_member(path)
+    if member is not None:
+        return member.mtime_ns, member.length
+    st_ = os.stat(path)
+    return st_.st_mtime_ns, st_.st_size
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Construye el índice de imágenes (.cache/asset_index.json).")
+    ap.add_argument("--duplicates", action="store_true", help="informe de imágenes con bytes idénticos")
+    ap.add_argument("--hardlink", action="store_true", help="convertir las copias idénticas en enlaces duros")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    index = refresh_index()
+    assets = list(index.assets())
+    print(f"{len(assets)} imágenes indexadas en {time.perf_counter() - t0:.2f} s -> {INDEX_PATH}")
+    for d, entries in index.dirs.items():
+        total = sum(a.size for a in entries.values())
+        print(f"  {Path(d).relative_to(BASE_DIR)}: {len(entries)} imágenes, {total / 2**20:.1f} MB")
+    if args.duplicates or args.hardlink:
+        print()
+        print_duplicate_report(index)
+    if args.hardlink:
+        freed = hardlink_duplicates(index)
+        refresh_index()
+        print(f"enlaces duros creados: {freed / 2**20:.1f} MB liberados en disco")
+
+
+if __name__ == "__main__":
+    main()
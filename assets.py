@@ -0,0 +1,408 @@
+"""Acceso en tiempo de ejecución a los derivados precalculados por build_assets.py."""
+import base64
+import html
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from asset_index import stat_signature
+from bundle import get_bundle, image_source
+from engines import DEFAULT_ENGINE, ENGINES_DIR, engine_for_path
+from imaging import (
+    DISPLAY_ENCODER, DOWNSCALE_MAX_H, DOWNSCALE_MAX_W, QUALITY_TIERS, display_bytes, tier_for_device,
+)
+from memory_cache import get_memory_cache
+
+# ===================== Rutas y preferencias =====================
+BASE_DIR = Path(__file__).parent
+STATIC_DIR = BASE_DIR / "static"  # carpeta que Streamlit publica en /app/static/ (enableStaticServing)
+ASSETS_DIR = STATIC_DIR / "derivados"  # salida de build_assets.py (no versionada)
+MANIFEST_PATH = ASSETS_DIR / "manifest.json"
+PREFERRED_FORMATS = ("avif", "webp")  # un <source> por formato en el <picture>, por orden de preferencia
+FALLBACK_FORMAT = "webp"  # el del src del <img> y de st.image: lo entiende cualquier navegador sin AVIF
+
+# Cómo llega la variante al navegador:
+#   "streamlit": URL /app/static/... servida por el propio Streamlit. No deja fijar Cache-Control:
+#                responde con ETag y Last-Modified pero sin esa cabecera, así que el navegador
+#                revalida según su heurística (una petición 304 por imagen, sin volver a descargarla).
+#                La caché inmutable de un año necesita el modo "server" o un proxy que añada
+#                "Cache-Control: public, max-age=31536000, immutable" a /app/static/derivados/ (todos
+#                los nombres llevan el hash del contenido).
+#   "server":    URL del servidor de static_server.py (Cache-Control inmutable de un año). Requiere
+#                MOTOR_STATIC_BASE_URL: la URL con la que el navegador de los alumnos llega a él (p. ej.
+#                una ruta del mismo proxy que la app, "/derivados"). Sin ella, o si el servidor no
+#                responde, se sirve como en "streamlit" y la app lo avisa (image_serving_problem()).
+#   "inline":    data URL dentro del mensaje de Streamlit (sin caché del navegador)
+IMAGE_SERVING = os.environ.get("MOTOR_IMAGE_SERVING", "streamlit")
+STATIC_BASE_URL = os.environ.get("MOTOR_STATIC_BASE_URL", "")
+# Miniatura de carga: se estira al tamaño final y se desenfoca; feFuncA evita el halo transparente del borde
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">'
+    '<filter id="b" color-interpolation-filters="sRGB"><feGaussianBlur stdDeviation="{blur:.0f}"/>'
+    '<feComponentTransfer><feFuncA type="discrete" tableValues="1 1"/></feComponentTransfer></filter>'
+    '<image width="100%" height="100%" preserveAspectRatio="none" filter="url(#b)" href="{href}"/></svg>'
+)
+# show_image(): la miniatura es el fondo del hueco y la imagen buena se pinta encima cuando el navegador
+# la tiene decodificada; hasta entonces (descarga incluida) se ve la miniatura. La clase .lqip permite a
+# cada página limitar la altura como hace con st.image.
+LQIP_HTML = (
+    '<div class="lqip" style="width:{width};aspect-ratio:{w}/{h};margin:0 auto;'
+    "background:url('{background}') center/contain no-repeat\">{img}</div>"
+)
+LQIP_IMG_HTML = (
+    '<img src="{src}" alt="{alt}" decoding="async" '
+    'style="display:block;width:100%;height:100%;object-fit:contain;border-radius:6px">'
+)
+PICTURE_HTML = '<picture style="display:contents">{sources}{img}</picture>'
+PICTURE_SOURCE_HTML = '<source type="{type}" srcset="{srcset}" sizes="{sizes}">'
+
+# ===================== Presupuesto de transferencia =====================
+# Tope de bytes de imagen por página (MOTOR_PAGE_BUDGET_KB; 0 = sin tope). Las imágenes se piden en
+# orden de importancia; cuando una ya no cabe se envía una variante más estrecha (o una caja menor si
+# no hay variantes), sin bajar de BUDGET_MIN_W px de ancho.
+PAGE_BUDGET_BYTES = int(os.environ.get("MOTOR_PAGE_BUDGET_KB", "1500")) * 1024
+BUDGET_MIN_W = 240  # px
+MOBILE_USER_AGENT = re.compile(r"Mobi|Android|iPhone|iPad", re.IGNORECASE)
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+_manifests: Dict[Path, Tuple[int, Dict]] = {}  # ruta -> (mtime_ns, contenido); solo los motores abiertos
+_manifest_lock = threading.Lock()
+
+
+def manifest_path(engine_id: str = DEFAULT_ENGINE) -> Path:
+    """Manifiesto de un motor: MANIFEST_PATH el principal, static/derivados/motores/<id>/ los demás."""
+    if engine_id == DEFAULT_ENGINE:
+        return MANIFEST_PATH
+    return ASSETS_DIR / ENGINES_DIR.relative_to(BASE_DIR) / engine_id / MANIFEST_PATH.name
+
+
+def load_manifest(engine_id: str = DEFAULT_ENGINE) -> Dict:
+    """Manifiesto de derivados de un motor; se relee solo si build_assets.py lo ha reescrito.
+
+    Con un paquete activo (MOTOR_BUNDLE) se usa el que va dentro: describe justo los derivados
+    empaquetados con él y no cambia mientras el proceso tiene el paquete abierto.
+    """
+    path = manifest_path(engine_id)
+    bundle = get_bundle()
+    if bundle is not None and bundle.has(path):
+        with _manifest_lock:
+            if path not in _manifests:
+                _manifests[path] = (-1, json.loads(bytes(bundle.read(path)).decode("utf-8")))
+            return _manifests[path][1]
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    with _manifest_lock:
+        cached = _manifests.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = _manifests[path] = (mtime, json.load(f))
+        return cached[1]
+
+
+def source_key(src: Path) -> str:
+    """Clave de una imagen original en el manifiesto: ruta relativa a la raíz, en formato POSIX."""
+    try:
+        return src.relative_to(BASE_DIR).as_posix()  # caso normal: rutas construidas desde paths.py
+    except ValueError:
+        return src.resolve().relative_to(BASE_DIR.resolve()).as_posix()
+
+
+def _fresh_entry(src: Path) -> Optional[Dict]:
+    entry = load_manifest(engine_for_path(src)).get("images", {}).get(source_key(src))
+    if not entry:
+        return None
+    if stat_signature(src) != (entry["mtime_ns"], entry["size"]):
+        return None  # original modificado después del build: mejor recalcular que servir algo viejo
+    return entry
+
+
+def _fitted_size(entry: Dict, max_w: int, max_h: int) -> Tuple[int, int]:
+    scale = min(max_w / entry["width"], max_h / entry["height"], 1.0)
+    return max(1, int(entry["width"] * scale)), max(1, int(entry["height"] * scale))
+
+
+def pick_variant(src: Path, max_w: int, max_h: int) -> Optional[Dict]:
+    """Variante más pequeña que cubre la caja destino (o la mayor disponible si ninguna la cubre).
+
+    En FALLBACK_FORMAT si el build lo generó (si no, en el primero de PREFERRED_FORMATS que haya):
+    es la que va en el src, así que tiene que verse en cualquier navegador. Los formatos mejores se
+    ofrecen aparte, en los <source> de picture_html().
+    """
+    entry = _fresh_entry(src)
+    if entry is None:
+        return None
+    need_w = _fitted_size(entry, max_w, max_h)[0]
+    for fmt in (FALLBACK_FORMAT,) + PREFERRED_FORMATS:
+        cands = sorted((v for v in entry["variants"] if v["format"] == fmt), key=lambda v: v["width"])
+        if cands:
+            return next((v for v in cands if v["width"] >= need_w), cands[-1])
+    return None
+
+
+def _runtime_placeholder(src: Path) -> Dict:
+    from build_assets import PLACEHOLDER_SIZE, make_placeholder, normalize  # import diferido: evita el ciclo
+
+    with Image.open(image_source(src)) as im:
+        width, height = im.size
+        im.draft("RGB", (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))  # sin decodificar el original completo
+        img, meta = normalize(im)
+    if meta["orientation"] in (5, 6, 7, 8):
+        width, height = height, width
+    return {"width": width, "height": height, "placeholder": make_placeholder(img)}
+
+
+def _placeholder_entry(src: Path) -> Optional[Dict]:
+    """Dimensiones y miniatura de carga de una imagen: las del manifiesto o, si no está en él (o ha
+    cambiado), calculadas aquí una vez y guardadas en la caché de memoria."""
+    entry = _fresh_entry(src)
+    if entry is not None and "placeholder" in entry:
+        return entry
+    try:
+        key = ("placeholder", str(src), stat_signature(src))
+    except OSError:
+        return None
+    cache = get_memory_cache()
+    entry = cache.get(key)
+    if entry is None:
+        try:
+            entry = _runtime_placeholder(src)
+        except OSError:
+            return None  # imagen ilegible: ya lo avisará la vista al mostrarla
+        cache.put(key, entry, nbytes=len(entry["placeholder"]), owner=engine_for_path(src))
+    return entry
+
+
+def placeholder_for(src: Path, max_w: int = DOWNSCALE_MAX_W, max_h: int = DOWNSCALE_MAX_H) -> Optional[str]:
+    """SVG del tamaño final con la miniatura de carga desenfocada; None si la imagen no se puede leer.
+
+    El SVG tiene las mismas dimensiones que la imagen real, así que ocupa su hueco en la página y el
+    cambio por la imagen buena no desplaza nada. Son unos cientos de bytes; con manifiesto no se
+    decodifica nada.
+    """
+    entry = _placeholder_entry(src)
+    if entry is None:
+        return None
+    w, h = _fitted_size(entry, max_w, max_h)
+    return PLACEHOLDER_SVG.format(w=w, h=h, blur=max(w, h) / 40, href=entry["placeholder"])
+
+
+def _data_url(path: str, size: int, fmt: str) -> str:
+    def build() -> str:
+        bundle = get_bundle()
+        if bundle is not None and bundle.has(BASE_DIR / path):
+            payload = base64.b64encode(bundle.read(BASE_DIR / path)).decode("ascii")
+        else:
+            with open(BASE_DIR / path, "rb") as f:
+                payload = base64.b64encode(f.read()).decode("ascii")
+        return f"data:{MIME_TYPES[fmt]};base64,{payload}"
+
+    return get_memory_cache().get_or_build(("data_url", path, size), build, owner=engine_for_path(BASE_DIR / path))
+
+
+def image_serving_problem() -> Optional[str]:
+    """Aviso para la interfaz si MOTOR_IMAGE_SERVING=server no se puede usar; si no, None."""
+    if IMAGE_SERVING != "server":
+        return None
+    if not STATIC_BASE_URL:
+        return ("MOTOR_IMAGE_SERVING=server necesita MOTOR_STATIC_BASE_URL (la URL con la que el navegador "
+                "llega a static_server.py): las imágenes se sirven desde /app/static/.")
+    import static_server  # import diferido: solo este modo levanta el servidor
+
+    if not static_server.ensure_running():  # comprobado una vez por proceso
+        return (f"El servidor de imágenes no responde en el puerto {static_server.STATIC_PORT}: "
+                "las imágenes se sirven desde /app/static/.")
+    return None
+
+
+def variant_url(variant: Dict) -> str:
+    """URL estable de una variante; el nombre lleva el hash del contenido, así que nunca caduca."""
+    name = Path(variant["path"]).relative_to(ASSETS_DIR.relative_to(BASE_DIR)).as_posix()
+    if IMAGE_SERVING == "server" and image_serving_problem() is None:
+        return f"{STATIC_BASE_URL.rstrip('/')}/{name}"
+    if IMAGE_SERVING == "inline" or not (BASE_DIR / variant["path"]).exists():
+        # /app/static/ solo ve el disco: una variante que únicamente está en el paquete va en línea
+        return _data_url(variant["path"], variant["bytes"], variant["format"])
+    return f"/app/static/{ASSETS_DIR.relative_to(STATIC_DIR).as_posix()}/{name}"
+
+
+class PageBudget:
+    """Bytes de imagen enviados en una ejecución de la página, con tope opcional."""
+
+    def __init__(self, limit: int = PAGE_BUDGET_BYTES):
+        self.limit = limit
+        self.items: List[Tuple[str, int]] = []  # (imagen, bytes) en el orden en que se enviaron
+
+    @property
+    def spent(self) -> int:
+        return sum(n for _, n in self.items)
+
+    def fits(self, size: int) -> bool:
+        return not self.limit or self.spent + size <= self.limit
+
+    def add(self, label: str, size: int) -> None:
+        self.items.append((label, size))
+
+    def summary(self) -> Dict[str, str]:
+        """Contadores para el panel de cachés (stats_panel.show_cache_stats)."""
+        values = {"imágenes": str(len(self.items)), "enviado": f"{self.spent / 2**10:.0f} KB"}
+        if self.limit:
+            values["tope"] = f"{self.limit / 2**10:.0f} KB" + (" (superado)" if self.spent > self.limit else "")
+        return values
+
+
+def _display_payload(img_path: Path, max_w: int, max_h: int, tier: Optional[str]) -> Union[str, bytes]:
+    data = display_bytes(img_path, max_w, max_h, tier)
+    if DISPLAY_ENCODER.format == "jpeg":
+        return data  # JPEG (o PNG con transparencia): st.image lo envía sin recodificar
+    return f"data:{MIME_TYPES[DISPLAY_ENCODER.format]};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _display_options(
+    img_path: Path, max_w: int, max_h: int, tier: Optional[str]
+) -> Iterator[Tuple[Union[str, bytes], int]]:
+    """(lo que se pasa a st.image, bytes que viajan), de la opción buena a la más ligera; perezoso."""
+    first = pick_variant(img_path, max_w, max_h)
+    if first is not None:
+        narrower = sorted(
+            (v for v in _fresh_entry(img_path)["variants"]
+             if v["format"] == first["format"] and BUDGET_MIN_W <= v["width"] < first["width"]),
+            key=lambda v: -v["width"],
+        )
+        for v in [first] + narrower:
+            url = variant_url(v)
+            yield url, len(url) if url.startswith("data:") else v["bytes"]
+        return
+    while True:
+        payload = _display_payload(img_path, max_w, max_h, tier)
+        yield payload, len(payload)
+        if max_w // 2 < BUDGET_MIN_W:
+            return
+        max_w, max_h = max_w // 2, max_h // 2
+
+
+def image_for_display(
+    img_path: Path, max_w: int = DOWNSCALE_MAX_W, max_h: int = DOWNSCALE_MAX_H, tier: Optional[str] = None,
+    budget: Optional[PageBudget] = None,
+) -> Union[str, bytes]:
+    """Lo que se pasa a st.image: la URL de la variante precalculada si existe, si no los bytes reducidos.
+
+    Con una URL Streamlit no recodifica nada y el navegador reutiliza su caché al volver a un paso;
+    sin manifiesto (o con el original modificado) se recurre a display_bytes(), compartido en memoria,
+    con el nivel de calidad `tier` y el codificador del despliegue (imaging.DISPLAY_ENCODER). Con
+    `budget`, se anota lo enviado y se elige la mayor opción que aún cabe en el tope de la página.
+    """
+    for payload, size in _display_options(img_path, max_w, max_h, tier):
+        if budget is None or budget.fits(size):
+            break
+    if budget is not None:
+        budget.add(img_path.name, size)
+    return payload
+
+
+def device_class(user_agent: str) -> str:
+    """Clase de dispositivo a partir del User-Agent: "movil" o "escritorio" (portátil del proyector)."""
+    return "movil" if MOBILE_USER_AGENT.search(user_agent or "") else "escritorio"
+
+
+def session_quality_tier() -> str:
+    """Nivel de calidad de la sesión actual: ?calidad=... en la URL o el configurado para su dispositivo."""
+    import streamlit as st  # import diferido: build_assets.py y warmup.py usan este módulo sin Streamlit
+
+    requested = st.query_params.get("calidad")
+    if requested in QUALITY_TIERS:
+        return requested
+    try:
+        user_agent = st.context.headers.get("User-Agent", "")
+    except Exception:  # sin contexto de petición (p. ej. ejecución en pruebas o en modo bare)
+        user_agent = ""
+    return tier_for_device(device_class(user_agent))
+
+
+def _srcset(urls: Dict[str, Dict], fmt: str, max_width: int) -> Optional[str]:
+    cands = sorted(
+        ((url, v) for url, v in urls.items() if v["format"] == fmt and v["width"] <= max_width),
+        key=lambda item: item[1]["width"],
+    )
+    return ", ".join(f"{url} {v['width']}w" for url, v in cands) or None
+
+
+def picture_html(img_path: Path, src: str, sizes: str) -> str:
+    """<picture> para la imagen ya elegida (`src`, de pick_variant: en el formato de reserva).
+
+    Lleva un <source> por formato de PREFERRED_FORMATS con sus variantes hasta la anchura elegida
+    (nunca más ancha: respeta el tope de la página); el navegador toma el primer formato que entiende
+    y, con `sizes` (el atributo HTML), la anchura según el hueco real y la densidad de la pantalla.
+    Uno sin AVIF se queda con el WebP del <img>. Si `src` no es una variante o va en línea (cada
+    candidata viajaría entera), solo el <img>.
+    """
+    img = LQIP_IMG_HTML.format(src=html.escape(src), alt=html.escape(img_path.stem))
+    entry = _fresh_entry(img_path)
+    if entry is None or src.startswith("data:"):
+        return img
+    urls = {variant_url(v): v for v in entry["variants"]}
+    top = urls.get(src)
+    if top is None:
+        return img
+    sources = []
+    for fmt in PREFERRED_FORMATS:
+        srcset = _srcset(urls, fmt, top["width"])
+        if srcset is not None:
+            sources.append(PICTURE_SOURCE_HTML.format(
+                type=MIME_TYPES[fmt], srcset=html.escape(srcset), sizes=html.escape(sizes)))
+    return PICTURE_HTML.format(sources="".join(sources), img=img)
+
+
+def _image_src(payload: Union[str, bytes]) -> str:
+    """URL para un <img>: la de la variante tal cual; los bytes reducidos, como data URL."""
+    if isinstance(payload, str):
+        return payload
+    mime = "image/png" if payload[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(payload).decode('ascii')}"
+
+
+def show_image(
+    img_path: Path, max_w: int = DOWNSCALE_MAX_W, max_h: int = DOWNSCALE_MAX_H, tier: Optional[str] = None,
+    budget: Optional[PageBudget] = None, width: str = "content", sizes: Optional[str] = None,
+) -> None:
+    """Imagen con miniatura de carga: la miniatura desenfocada queda de fondo del hueco (con el tamaño
+    final) hasta que el navegador pinta encima la imagen buena.
+
+    Si hay que decodificar el original, la miniatura sola se envía antes, para que se vea mientras
+    tanto. Sin entrada en el manifiesto, la miniatura se calcula al vuelo (_placeholder_entry).
+    `width`: "content" (hasta el ancho de la imagen) o "stretch" (ancho de la columna). `sizes`: ancho
+    que ocupará en pantalla, como el atributo HTML; con él el navegador elige la variante del <picture>
+    (por defecto, el de la imagen limitado al de la ventana, o la ventana entera con "stretch").
+    """
+    import streamlit as st  # import diferido: build_assets.py y warmup.py usan este módulo sin Streamlit
+
+    slot = st.empty()
+    entry = _placeholder_entry(img_path)
+    if entry is None:  # no hay ni miniatura: st.image como siempre (y su error, si lo hay)
+        slot.image(image_for_display(img_path, max_w, max_h, tier or session_quality_tier(), budget), width=width)
+        return
+    w, h = _fitted_size(entry, max_w, max_h)
+    svg = PLACEHOLDER_SVG.format(w=w, h=h, blur=max(w, h) / 40, href=entry["placeholder"])
+    background = f"data:image/svg+xml;base64,{base64.b64encode(svg.encode('utf-8')).decode('ascii')}"
+    if budget is not None:
+        budget.add(f"{img_path.name} (carga)", len(background))
+
+    def box(img: str) -> str:
+        return LQIP_HTML.format(width="100%" if width == "stretch" else f"min(100%, {w}px)", w=w, h=h,
+                                background=background, img=img)
+
+    if pick_variant(img_path, max_w, max_h) is None:
+        slot.html(box(""))  # la decodificación tarda: mientras, la miniatura sola
+    try:
+        payload = image_for_display(img_path, max_w, max_h, tier or session_quality_tier(), budget)
+    except Exception:
+        slot.empty()  # que el aviso de error del llamador no quede debajo de una imagen borrosa
+        raise
+    sizes = sizes or ("100vw" if width == "stretch" else f"(max-width: {w}px) 100vw, {w}px")
+    slot.html(box(picture_html(img_path, _image_src(payload), sizes)))
@@ -0,0 +1,127 @@
+"""Benchmark: decodificación completa + LANCZOS frente a decodificación reducida (draft) de JPEG.
+
+Uso:
+    python bench_decode.py [--dir images] [--max-w 1200] [--max-h 800] [--repeat 3]
+
+Para cada imagen mide el tiempo (mejor de N), el pico de memoria residente del proceso que
+decodifica (cada medida se hace en un proceso hijo nuevo) y la diferencia visual del camino
+rápido respecto al actual (error medio absoluto y PSNR).
+"""
+import argparse
+import math
+import multiprocessing as mp
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+from imaging import DOWNSCALE_MAX_H, DOWNSCALE_MAX_W, render_downscaled, render_downscaled_fast
+
+BASE_DIR = Path(__file__).parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+RENDERERS = {"lanczos": render_downscaled, "draft": render_downscaled_fast}
+
+
+def _proc_status_kib(field: str) -> int:
+    with open("/proc/self/status", "r", encoding="ascii") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _reset_peak_rss() -> int:
+    """Reinicia el pico de RSS (Linux >= 4.0) y devuelve el RSS actual en KiB.
+
+    Sin /proc se recurre a ru_maxrss, que incluye el pico de las importaciones y subestima el coste.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return _proc_status_kib("VmRSS")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_rss() -> int:
+    try:
+        return _proc_status_kib("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(method: str, path: str, max_w: int, max_h: int, repeat: int) -> Tuple[float, int]:
+    """Se ejecuta en un proceso hijo de un solo uso: devuelve (ms, bytes de pico de RSS añadidos)."""
+    render = RENDERERS[method]
+    rss0 = _reset_peak_rss()
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        render(Path(path), max_w, max_h).load()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0, max(0, _peak_rss() - rss0) * 1024
+
+
+def _difference(path: Path, max_w: int, max_h: int) -> Tuple[float, float]:
+    ref = render_downscaled(path, max_w, max_h).convert("RGB")
+    fast = render_downscaled_fast(path, max_w, max_h).convert("RGB")
+    diff = ImageChops.difference(ref, fast)
+    stat = ImageStat.Stat(diff)
+    mae = sum(stat.mean) / len(stat.mean)
+    rms = math.sqrt(sum(r * r for r in stat.rms) / len(stat.rms))
+    psnr = math.inf if rms == 0 else 20 * math.log10(255.0 / rms)
+    return mae, psnr
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dir", type=Path, default=BASE_DIR / "images")
+    ap.add_argument("--max-w", type=int, default=DOWNSCALE_MAX_W)
+    ap.add_argument("--max-h", type=int, default=DOWNSCALE_MAX_H)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    files = sorted(p for p in args.dir.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    if not files:
+        raise SystemExit(f"No hay imágenes en {args.dir}")
+
+    rows: List[Dict] = []
+    # max_tasks_per_child=1: cada medida arranca en un proceso limpio, sin memoria reutilizada
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx, max_tasks_per_child=1) as pool:
+        for p in files:
+            res = {
+                m: pool.submit(_measure, m, str(p), args.max_w, args.max_h, args.repeat).result()
+                for m in RENDERERS
+            }
+            mae, psnr = _difference(p, args.max_w, args.max_h)
+            with Image.open(p) as im:
+                size = im.size
+            rows.append({"file": p.relative_to(args.dir), "size": size, "res": res, "mae": mae, "psnr": psnr})
+
+    print(f"{'archivo':48} {'origen':>10} {'lanczos ms':>10} {'draft ms':>9} {'x':>5} "
+          f"{'lanczos MB':>10} {'draft MB':>9} {'MAE':>6} {'PSNR dB':>8}")
+    for r in rows:
+        (t_ref, m_ref), (t_fast, m_fast) = r["res"]["lanczos"], r["res"]["draft"]
+        print(f"{str(r['file'])[:48]:48} {r['size'][0]:>5}x{r['size'][1]:<4} {t_ref:10.1f} {t_fast:9.1f} "
+              f"{t_ref / t_fast:5.1f} {m_ref / 2**20:10.1f} {m_fast / 2**20:9.1f} {r['mae']:6.2f} {r['psnr']:8.1f}")
+
+    t_ref = sum(r["res"]["lanczos"][0] for r in rows)
+    t_fast = sum(r["res"]["draft"][0] for r in rows)
+    print()
+    print(f"{len(rows)} imágenes, caja {args.max_w}x{args.max_h}")
+    print(f"tiempo total: lanczos {t_ref:.0f} ms, draft {t_fast:.0f} ms ({t_ref / t_fast:.1f}x)")
+    print(f"pico RSS mediano: lanczos {statistics.median(r['res']['lanczos'][1] for r in rows) / 2**20:.1f} MB, "
+          f"draft {statistics.median(r['res']['draft'][1] for r in rows) / 2**20:.1f} MB")
+    finite = [r["psnr"] for r in rows if math.isfinite(r["psnr"])]
+    print(f"diferencia: MAE medio {statistics.mean(r['mae'] for r in rows):.2f}, "
+          f"PSNR mínimo {min(finite) if finite else math.inf:.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
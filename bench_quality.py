@@ -0,0 +1,110 @@
+"""Benchmark: coste y calidad de cada nivel de remuestreo (fast, balanced, best).
+
+Uso:
+    python bench_quality.py [--dir images] [--max-w 1200] [--max-h 800] [--repeat 3]
+
+Para cada imagen mide el tiempo de cada nivel de imaging.RENDERERS (mejor de N, sin pasar por
+las cachés) y el SSIM de su salida frente a la de best (1.0 = idéntica). El resumen da ms/imagen y
+SSIM medio y mínimo por nivel, para elegir MOTOR_QUALITY_TIER / MOTOR_QUALITY_TIERS con datos;
+p. ej. con una caja menor (--max-w 480 --max-h 800) para los móviles.
+"""
+import argparse
+import math
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from imaging import DOWNSCALE_MAX_H, DOWNSCALE_MAX_W, QUALITY_TIERS, RENDERERS
+
+BASE_DIR = Path(__file__).parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+# SSIM de Wang et al. (2004): ventana gaussiana 11x11, sigma 1.5, sobre la luminancia
+SSIM_WINDOW = 11
+SSIM_SIGMA = 1.5
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def _gaussian_filter(x: np.ndarray) -> np.ndarray:
+    """Filtro gaussiano separable (solo la zona válida, sin bordes rellenados)."""
+    r = np.arange(SSIM_WINDOW) - SSIM_WINDOW // 2
+    g = np.exp(-(r ** 2) / (2 * SSIM_SIGMA ** 2))
+    g /= g.sum()
+    view = np.lib.stride_tricks.sliding_window_view
+    x = view(x, SSIM_WINDOW, axis=1) @ g
+    return view(x, SSIM_WINDOW, axis=0) @ g
+
+
+def ssim(a: Image.Image, b: Image.Image) -> float:
+    x = np.asarray(a.convert("L"), dtype=np.float64)
+    y = np.asarray(b.convert("L"), dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError(f"tamaños distintos: {x.shape} frente a {y.shape}")
+    if min(x.shape) < SSIM_WINDOW:
+        return 1.0 if np.array_equal(x, y) else 0.0
+    mu_x, mu_y = _gaussian_filter(x), _gaussian_filter(y)
+    var_x = _gaussian_filter(x * x) - mu_x ** 2
+    var_y = _gaussian_filter(y * y) - mu_y ** 2
+    cov = _gaussian_filter(x * y) - mu_x * mu_y
+    num = (2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)
+    den = (mu_x ** 2 + mu_y ** 2 + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    return float((num / den).mean())
+
+
+def _time_render(tier: str, path: Path, max_w: int, max_h: int, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        RENDERERS[tier](path, max_w, max_h).load()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dir", type=Path, default=BASE_DIR / "images")
+    ap.add_argument("--max-w", type=int, default=DOWNSCALE_MAX_W)
+    ap.add_argument("--max-h", type=int, default=DOWNSCALE_MAX_H)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    files = sorted(p for p in args.dir.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    if not files:
+        raise SystemExit(f"No hay imágenes en {args.dir}")
+
+    rows: List[Dict] = []
+    for p in files:
+        ms = {t: _time_render(t, p, args.max_w, args.max_h, args.repeat) for t in QUALITY_TIERS}
+        ref = RENDERERS["best"](p, args.max_w, args.max_h)
+        sim = {t: ssim(RENDERERS[t](p, args.max_w, args.max_h), ref) for t in QUALITY_TIERS if t != "best"}
+        with Image.open(p) as im:
+            size = im.size
+        rows.append({"file": p.relative_to(args.dir), "size": size, "ms": ms, "ssim": sim})
+
+    others = [t for t in QUALITY_TIERS if t != "best"]
+    print(f"{'archivo':48} {'origen':>10} " + " ".join(f"{t + ' ms':>11}" for t in QUALITY_TIERS)
+          + " " + " ".join(f"{'SSIM ' + t:>13}" for t in others))
+    for r in rows:
+        print(f"{str(r['file'])[:48]:48} {r['size'][0]:>5}x{r['size'][1]:<4} "
+              + " ".join(f"{r['ms'][t]:11.1f}" for t in QUALITY_TIERS) + " "
+              + " ".join(f"{r['ssim'][t]:13.4f}" for t in others))
+
+    best_ms = statistics.mean(r["ms"]["best"] for r in rows)
+    print()
+    print(f"{len(rows)} imágenes, caja {args.max_w}x{args.max_h}, mejor de {args.repeat}")
+    print(f"{'nivel':10} {'ms/imagen':>10} {'mediana':>8} {'x best':>7} {'SSIM medio':>11} {'SSIM mín.':>10}")
+    for t in QUALITY_TIERS:
+        mean_ms = statistics.mean(r["ms"][t] for r in rows)
+        median_ms = statistics.median(r["ms"][t] for r in rows)
+        sims = [r["ssim"][t] for r in rows] if t != "best" else [1.0]
+        print(f"{t:10} {mean_ms:10.1f} {median_ms:8.1f} {best_ms / mean_ms:7.1f} "
+              f"{statistics.mean(sims):11.4f} {min(sims):10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Genera variantes responsivas (WebP y, si Pillow lo soporta, AVIF) de las imágenes de la app.
+
+Uso:
+    python build_assets.py [--widths 480 960 1200] [--formats webp avif] [--all] [--force] [--jobs N]
+
+Recorre las imágenes referenciadas en elementos.json (carpeta images/) y steps.json (carpeta
+'imagenes montaje/'), escribe en static/derivados/ una variante por anchura y formato y deja el
+índice en static/derivados/manifest.json, que las apps consultan mediante assets.image_for_display().
+Cada motor de motores/ (engines.py) se procesa igual y tiene su propio manifiesto en
+static/derivados/motores/<id>/manifest.json: una app solo carga el del motor que se está viendo.
+El manifiesto guarda además, por imagen, una miniatura de carga de unos cientos de bytes que las
+vistas pintan al instante mientras llega la variante (assets.show_image()), y la hoja de sprites
+del catálogo de elementos (sprites.py) con la que se dibuja la rejilla de la vista de catálogo.
+Antes de codificar, cada original pasa por normalize(): se aplica la orientación EXIF, se
+convierte a sRGB si trae otro perfil de color y se descartan los metadatos; el manifiesto guarda
+las dimensiones ya giradas y qué se corrigió. Cada fichero lleva en el nombre el hash de su
+contenido, de modo que puede servirse con caché inmutable. El proceso es incremental: solo se
+recodifican los originales nuevos o modificados, y al final se borran las variantes que ya no
+aparecen en el manifiesto. También deja al día la instantánea compilada de elementos.json y
+steps.json (models.compile_snapshot()) y, si MOTOR_CATALOG_DB está definido, los reimporta en la
+base SQLite (catalog_db.py).
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from PIL import Image, ImageOps, features
+
+try:
+    from PIL import ImageCms  # requiere Pillow compilado con LittleCMS
+except ImportError:
+    ImageCms = None
+
+from asset_index import AssetIndex, refresh_index
+from assets import ASSETS_DIR, manifest_path, source_key
+from catalog_db import CATALOG_DB_PATH, CatalogDB
+from engines import Engine, discover_engines, load_engine_catalog, load_engine_procedure
+from models import compile_snapshot
+from paths import BASE_DIR, all_existing
+from sprites import catalog_sprite, sprite_files
+
+# ===================== Parámetros por defecto =====================
+DEFAULT_WIDTHS = [480, 960, 1200]  # px
+DEFAULT_FORMATS = ["webp", "avif"]
+ENCODE_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 5},
+    "avif": {"format": "AVIF", "quality": 55, "speed": 6},
+}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+EXIF_ORIENTATION = 0x0112
+SRGB_PROFILE = ImageCms.createProfile("sRGB") if ImageCms is not None else None
+PLACEHOLDER_SIZE = 24      # px del lado mayor de la miniatura de carga (LQIP); el desenfoque lo pone el navegador
+PLACEHOLDER_QUALITY = 50   # JPEG de la miniatura: ~0,5 KB por imagen dentro del manifiesto
+
+
+def referenced_images(engine: Engine) -> List[Path]:
+    """Imágenes citadas en los JSON de un motor que existen en disco, sin repetir."""
+    found: Dict[Path, None] = {}
+    for items, img_dir in (
+        (load_engine_catalog(engine).elements, engine.elements_img_dir),
+        (load_engine_procedure(engine).steps, engine.steps_img_dir),
+    ):
+        for item in items:
+            for p in all_existing(img_dir, item.images):
+                found[p] = None
+    return list(found)
+
+
+def all_images(engine: Engine) -> List[Path]:
+    return sorted(
+        p for d in (engine.elements_img_dir, engine.steps_img_dir) for p in d.rglob("*")
+        if p.suffix.lower() in IMAGE_EXTS
+    )
+
+
+def variant_path(src: Path, width: int, fmt: str, digest: str) -> Path:
+    rel = Path(source_key(src).replace(" ", "_"))
+    return ASSETS_DIR / rel.parent / f"{rel.stem}-{width}.{digest[:12]}.{fmt}"
+
+
+def make_placeholder(img: Image.Image) -> str:
+    """Miniatura diminuta como data URL, para pintar algo al instante mientras llega la imagen buena."""
+    thumb = img.copy()
+    thumb.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buf = io.BytesIO()
+    if thumb.mode == "RGBA":
+        thumb.save(buf, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        thumb.save(buf, format="JPEG", quality=PLACEHOLDER_QUALITY, optimize=True)
+        mime = "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
+
+
+def normalize(im: Image.Image) -> Tuple[Image.Image, Dict]:
+    """Etapa de normalización: orientación EXIF aplicada, colores en sRGB y sin metadatos.
+
+    Todo lo que se deriva de un original (variantes y miniatura de carga) sale de aquí, de modo que
+    en tiempo de ejecución no hay que girar nada ni leer miniaturas EXIF incrustadas, y dos builds
+    del mismo original dan los mismos bytes. Devuelve la imagen y lo que se ha corregido.
+    """
+    orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+    icc = im.info.get("icc_profile")
+    img = ImageOps.exif_transpose(im)  # siempre una copia: el original abierto no se toca
+    profile = None
+    if icc and ImageCms is not None:
+        try:
+            src_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+            profile = ImageCms.getProfileDescription(src_profile).strip() or "desconocido"
+            if not profile.lower().startswith("srgb"):
+                mode = "RGBA" if "A" in img.getbands() else "RGB"
+                img = ImageCms.profileToProfile(img, src_profile, SRGB_PROFILE, outputMode=mode)
+        except (ImageCms.PyCMSError, OSError, ValueError):
+            pass  # perfil ilegible: se usan los valores tal cual, como haría un navegador sin él
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    img.info = {}  # fuera EXIF (y su miniatura), ICC, XMP y comentarios
+    return img, {"orientation": orientation, "icc_profile": profile}
+
+
+def placeholder_from_file(src: Path) -> str:
+    """Miniatura de carga sin decodificar el original completo (reducción en el decodificador JPEG)."""
+    with Image.open(src) as im:
+        im.draft("RGB", (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+        img, _ = normalize(im)
+    return make_placeholder(img)
+
+
+def build_one(src: Path, widths: Iterable[int], formats: Iterable[str]) -> Dict:
+    st_ = src.stat()
+    with Image.open(src) as im:
+        img, normalized = normalize(im)
+    w, h = img.size  # dimensiones finales, ya giradas
+    variants = []
+    for vw in sorted({min(x, w) for x in widths}):  # nunca ampliar: la mayor variante es el original
+        vh = max(1, round(h * vw / w))
+        resized = img if vw == w else img.resize((vw, vh), Image.LANCZOS)
+        for fmt in formats:
+            buf = io.BytesIO()
+            resized.save(buf, **ENCODE_OPTIONS[fmt])
+            data = buf.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+            out = variant_path(src, vw, fmt, digest)
+            if not out.exists():  # mismo hash, mismo contenido: no hace falta reescribir
+                out.parent.mkdir(parents=True, exist_ok=True)
+                out.write_bytes(data)
+            variants.append({
+                "format": fmt,
+                "width": vw,
+                "height": vh,
+                "path": out.relative_to(BASE_DIR).as_posix(),
+                "bytes": len(data),
+                "sha256": digest,
+            })
+    return {
+        "mtime_ns": st_.st_mtime_ns,
+        "size": st_.st_size,
+        "width": w,
+        "height": h,
+        "normalized": normalized,
+        "placeholder": make_placeholder(img),
+        "variants": variants,
+    }
+
+
+def _timed_build(src: Path, widths: List[int], formats: List[str]) -> Tuple[Dict, float]:
+    t0 = time.perf_counter()
+    entry = build_one(src, widths, formats)
+    return entry, time.perf_counter() - t0
+
+
+def _content_hash(index: AssetIndex, src: Path) -> str:
+    info = index.by_path(src)
+    if info is not None:
+        return info.sha256
+    return hashlib.sha256(src.read_bytes()).hexdigest()
+
+
+def _share(entry: Dict, src: Path) -> Dict:
+    """Entrada de manifiesto para una copia idéntica: mismas variantes, su propio mtime."""
+    st_ = src.stat()
+    return {**entry, "mtime_ns": st_.st_mtime_ns, "size": st_.st_size}
+
+
+def _is_fresh(entry: Dict, src: Path, widths: List[int], formats: List[str]) -> bool:
+    st_ = src.stat()
+    if entry.get("mtime_ns") != st_.st_mtime_ns or entry.get("size") != st_.st_size:
+        return False
+    if "normalized" not in entry:
+        return False  # generada antes de la etapa de normalización: puede estar girada o con otro perfil
+    have = {(v["width"], v["format"]) for v in entry.get("variants", [])}
+    want = {(min(x, entry["width"]), f) for x in widths for f in formats}
+    return want <= have and all((BASE_DIR / v["path"]).exists() for v in entry["variants"])
+
+
+def prune(images: Dict[str, Dict], sprites: Dict[str, Dict], manifests: Iterable[Path]) -> int:
+    """Borra de ASSETS_DIR los ficheros que ningún manifiesto referencia."""
+    keep = {BASE_DIR / v["path"] for e in images.values() for v in e["variants"]} | set(manifests)
+    keep |= {p for meta in sprites.values() for p in sprite_files(meta)}
+    removed = 0
+    for p in ASSETS_DIR.rglob("*"):
+        if p.is_file() and p not in keep:
+            p.unlink()
+            removed += 1
+    return removed
+
+
+def build_engine(
+    engine: Engine, index: AssetIndex, args: argparse.Namespace, formats: List[str]
+) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Variantes, hoja de sprites y manifiesto de un motor; devuelve las imágenes y hojas de su manifiesto."""
+    path = manifest_path(engine.id)
+    old: Dict = {}
+    if path.exists() and not args.force:
+        with open(path, "r", encoding="utf-8") as f:
+            old = json.load(f).get("images", {})
+
+    sources = all_images(engine) if args.all else referenced_images(engine)
+    images: Dict[str, Dict] = {}
+    by_content: Dict[str, Dict] = {}  # hash del original -> entrada vigente con sus variantes
+    pending: Dict[str, List[Path]] = {}  # hash -> originales idénticos pendientes de codificar
+    for src in sources:
+        key = source_key(src)
+        sha = _content_hash(index, src)
+        if key in old and old[key].get("sha256") == sha and _is_fresh(old[key], src, args.widths, formats):
+            if "placeholder" not in old[key]:  # manifiesto anterior a las miniaturas de carga
+                old[key] = {**old[key], "placeholder": placeholder_from_file(src)}
+            images[key] = old[key]
+            by_content.setdefault(sha, old[key])
+        else:
+            pending.setdefault(sha, []).append(src)
+
+    shared = 0
+    for sha in [s for s in pending if s in by_content]:  # copia idéntica de algo ya vigente
+        for src in pending.pop(sha):
+            images[source_key(src)] = _share(by_content[sha], src)
+            shared += 1
+
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {sha: pool.submit(_timed_build, srcs[0], args.widths, formats) for sha, srcs in pending.items()}
+        for sha, fut in futures.items():
+            entry, secs = fut.result()
+            entry["sha256"] = sha
+            first, *copies = pending[sha]
+            images[source_key(first)] = entry
+            for src in copies:  # mismos bytes: mismas variantes, una sola codificación
+                images[source_key(src)] = _share(entry, src)
+                shared += 1
+            extra = f" (compartidas con {len(copies)} copia(s) idéntica(s))" if copies else ""
+            print(f"{source_key(first)}: {len(entry['variants'])} variantes en {secs:.2f} s{extra}")
+    built = len(pending)
+
+    sprite = catalog_sprite(load_engine_catalog(engine).elements, engine)  # reutiliza la hoja si nada ha cambiado
+    sprites = {sprite["name"]: sprite}
+    print(f"hoja de sprites '{sprite['name']}': {len(sprite['items'])} miniaturas, "
+          f"{sprite['width']}x{sprite['height']} px, {sprite['bytes'] / 2**10:.0f} KB")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "version": 1,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "widths": sorted(args.widths),
+        "formats": formats,
+        "images": images,
+        "sprites": sprites,
+    }
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    tmp.replace(path)
+
+    src_bytes = sum(e["size"] for e in images.values())
+    print(f"\n{engine.name}: {len(images)} originales ({built} recodificados, {shared} copias idénticas sin "
+          f"recodificar) en {time.perf_counter() - t_start:.1f} s -> {path.relative_to(BASE_DIR)}")
+    print(f"originales: {src_bytes / 2**20:.1f} MB")
+    for fmt in formats:
+        for vw in sorted(args.widths):
+            total = sum(
+                next((v["bytes"] for v in e["variants"] if v["format"] == fmt and v["width"] == min(vw, e["width"])), 0)
+                for e in images.values()
+            )
+            if total:
+                print(f"  {fmt} {vw:>5} px: {total / 2**20:6.1f} MB ({src_bytes / total:4.1f}x menos)")
+    return images, sprites
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--widths", type=int, nargs="+", default=DEFAULT_WIDTHS)
+    ap.add_argument("--formats", nargs="+", choices=sorted(ENCODE_OPTIONS), default=DEFAULT_FORMATS)
+    ap.add_argument("--all", action="store_true", help="incluir también imágenes no referenciadas en los JSON")
+    ap.add_argument("--force", action="store_true", help="recodificar aunque el manifiesto esté al día")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="procesos de codificación en paralelo")
+    args = ap.parse_args()
+
+    formats = [f for f in args.formats if features.check(f)]
+    for f in sorted(set(args.formats) - set(formats)):
+        print(f"aviso: esta instalación de Pillow no codifica {f.upper()}; se omite")
+    if not formats:
+        raise SystemExit("Ningún formato disponible.")
+
+    index = refresh_index()  # índice de imágenes al día: las apps resuelven los nombres contra él
+    snapshot = compile_snapshot()  # y los JSON validados y compilados (models.py): arranque sin volver a parsearlos
+    if CATALOG_DB_PATH:  # aunque esté desfasada (es lo que se arregla aquí) o aún no exista
+        CatalogDB(CATALOG_DB_PATH).import_models(snapshot.catalog, snapshot.procedure)
+
+    images: Dict[str, Dict] = {}
+    sprites: Dict[str, Dict] = {}
+    for engine in discover_engines().values():  # un manifiesto por motor: cada app abre solo el suyo
+        engine_images, engine_sprites = build_engine(engine, index, args, formats)
+        images.update(engine_images)  # las claves son rutas desde la raíz: no se pisan entre motores
+        sprites.update(engine_sprites)
+    pruned = prune(images, sprites, [manifest_path(eid) for eid in discover_engines()])
+    print(f"{pruned} variantes obsoletas borradas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Paquete único de imágenes: originales y derivados en un solo fichero leído con mmap.
+
+Uso:
+    python bundle.py build [--out motor.pack] [--no-originals]
+    python bundle.py list|verify [--bundle motor.pack]
+
+Formato: cabecera (MAGIC, longitud del índice), índice JSON {nombre: [offset, longitud, sha256,
+mtime_ns]} y, alineados a DATA_ALIGN, los ficheros uno detrás de otro. Los nombres son rutas
+relativas a la raíz del proyecto en formato POSIX ("images/x.jpeg", "static/derivados/...").
+
+Con MOTOR_BUNDLE=<ruta> las apps resuelven las carpetas de imágenes contra el paquete en lugar
+del disco (paths.first_existing/all_existing), leen de él el manifiesto y las variantes, y abren
+los originales a través de image_source(). Los bytes salen del mmap sin copias intermedias, de la
+caché de páginas del sistema; el despliegue copia un fichero en lugar de cientos. Las variantes
+del paquete se sirven en modo MOTOR_IMAGE_SERVING=server (static_server.py) o inline.
+"""
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Union
+
+from paths import BASE_DIR
+
+# ===================== Parámetros (ajustables) =====================
+BUNDLE_PATH = os.environ.get("MOTOR_BUNDLE")  # sin definir: todo se lee del disco como siempre
+DEFAULT_BUNDLE = BASE_DIR / "motor.pack"
+MAGIC = b"MOTORPK1"
+HEADER = struct.Struct("<8sQ")  # magic, bytes del índice JSON
+DATA_ALIGN = 4096  # los datos empiezan en una página: mmap y lecturas alineadas
+
+
+class Member(NamedTuple):
+    offset: int  # relativo al inicio de los datos
+    length: int
+    sha256: str
+    mtime_ns: int  # del fichero empaquetado (para comparar con el manifiesto como con os.stat)
+
+
+def _align(n: int) -> int:
+    return -(-n // DATA_ALIGN) * DATA_ALIGN
+
+
+def bundle_key(path: Union[str, Path]) -> Optional[str]:
+    """Nombre de una ruta dentro del paquete (relativa a la raíz), o None si está fuera del proyecto."""
+    p = Path(path)
+    try:
+        return p.relative_to(BASE_DIR).as_posix()
+    except ValueError:
+        try:
+            return Path(os.path.abspath(p)).relative_to(BASE_DIR).as_posix()
+        except ValueError:
+            return None
+
+
+class _MemberReader(io.RawIOBase):
+    """Fichero de solo lectura sobre un trozo del mmap (lo que necesita PIL: read/seek/tell)."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class AssetBundle:
+    """Lectura aleatoria de un paquete mapeado en memoria; seguro entre hilos (solo lectura)."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} no es un paquete de imágenes")
+        index = json.loads(self._mm[HEADER.size:HEADER.size + index_len].decode("utf-8"))
+        self._data_start = _align(HEADER.size + index_len)
+        self._buf = memoryview(self._mm)
+        self.members: Dict[str, Member] = {name: Member(*m) for name, m in index["members"].items()}
+        self._dirs = {parent.as_posix() for name in self.members for parent in Path(name).parents}
+
+    def info(self, path: Union[str, Path]) -> Optional[Member]:
+        """Entrada del índice para una ruta absoluta o un nombre del paquete."""
+        if isinstance(path, str) and path in self.members:
+            return self.members[path]
+        key = bundle_key(path)
+        return self.members.get(key) if key is not None else None
+
+    def has(self, path: Union[str, Path]) -> bool:
+        return self.info(path) is not None
+
+    def covers(self, dir_path: Path) -> bool:
+        """True si el paquete trae ficheros de esa carpeta (entonces sustituye al disco)."""
+        return bundle_key(dir_path) in self._dirs
+
+    def read(self, path: Union[str, Path]) -> memoryview:
+        """Bytes del fichero sin copiarlos: una vista del mmap."""
+        m = self.info(path)
+        if m is None:
+            raise FileNotFoundError(path)
+        start = self._data_start + m.offset
+        return self._buf[start:start + m.length]
+
+    def open(self, path: Union[str, Path]) -> BinaryIO:
+        return _MemberReader(self.read(path))
+
+    def names_under(self, dir_path: Path) -> List[str]:
+        prefix = f"{bundle_key(dir_path)}/"
+        return [n for n in self.members if n.startswith(prefix)]
+
+
+_bundle: Optional[AssetBundle] = None
+_bundle_loaded = False
+_bundle_lock = threading.Lock()
+
+
+def get_bundle() -> Optional[AssetBundle]:
+    """Paquete activo del proceso (MOTOR_BUNDLE), o None si no se usa."""
+    global _bundle, _bundle_loaded
+    with _bundle_lock:
+        if not _bundle_loaded:
+            _bundle = AssetBundle(BUNDLE_PATH) if BUNDLE_PATH else None
+            _bundle_loaded = True
+        return _bundle
+
+
+def image_source(path: Path) -> Union[Path, BinaryIO]:
+    """Lo que se pasa a Image.open(): el fichero del paquete si está en él, si no la ruta en disco."""
+    b = get_bundle()
+    if b is not None and b.has(path):
+        return b.open(path)
+    return path
+
+
+# ===================== Construcción =====================
+def write_bundle(out: Path, files: Iterable[Path]) -> Dict[str, Member]:
+    """Escribe el paquete de forma atómica; devuelve su índice."""
+    files = sorted(dict.fromkeys(files))
+    members: Dict[str, Member] = {}
+    offset = 0
+    for p in files:
+        st_ = p.stat()
+        members[bundle_key(p)] = Member(offset, st_.st_size, "", st_.st_mtime_ns)
+        offset += st_.st_size
+    # el hash se calcula al copiar; el índice tiene longitud fija por entrada, así que se puede
+    # reservar antes con un hash de relleno y reescribir al final
+    blank = json.dumps({"version": 1, "members": {k: list(m._replace(sha256="0" * 64)) for k, m in members.items()}})
+    index_len = len(blank.encode("utf-8"))
+    data_start = _align(HEADER.size + index_len)
+
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            for p in files:
+                key = bundle_key(p)
+                data = p.read_bytes()
+                if len(data) != members[key].length:  # se pisaría el miembro siguiente
+                    raise RuntimeError(f"{p} ha cambiado de tamaño mientras se empaquetaba; vuelve a ejecutar")
+                f.seek(data_start + members[key].offset)
+                f.write(data)
+                members[key] = members[key]._replace(sha256=hashlib.sha256(data).hexdigest())
+            index = json.dumps({"version": 1, "members": {k: list(m) for k, m in members.items()}}).encode("utf-8")
+            if len(index) != index_len:  # los datos empiezan justo después del hueco reservado
+                raise RuntimeError(f"el índice del paquete ocupa {len(index)} bytes y se reservaron {index_len}")
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, index_len))
+            f.write(index)
+    except BaseException:
+        tmp.unlink(missing_ok=True)  # nunca queda un paquete a medias (ni se sustituye el bueno)
+        raise
+    os.replace(tmp, out)
+    return members
+
+
+def bundle_files(include_originals: bool = True) -> List[Path]:
+    """Originales de las carpetas de imágenes y todo lo generado en static/derivados/."""
+    from asset_index import INDEXED_DIRS, IMAGE_EXTS
+    from assets import ASSETS_DIR
+
+    files: List[Path] = []
+    if include_originals:
+        for d in dict.fromkeys(INDEXED_DIRS):
+            files += [p for p in d.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
+    if ASSETS_DIR.exists():
+        files += [p for p in ASSETS_DIR.rglob("*") if p.is_file() and not p.name.endswith(".tmp")]
+    return files
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="empaquetar originales y derivados")
+    b.add_argument("--out", type=Path, default=DEFAULT_BUNDLE)
+    b.add_argument("--no-originals", action="store_true", help="solo static/derivados/")
+    for name in ("list", "verify"):
+        s = sub.add_parser(name)
+        s.add_argument("--bundle", type=Path, default=Path(BUNDLE_PATH) if BUNDLE_PATH else DEFAULT_BUNDLE)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        members = write_bundle(args.out, bundle_files(not args.no_originals))
+        total = sum(m.length for m in members.values())
+        print(f"{len(members)} ficheros, {total / 2**20:.1f} MB -> {args.out} "
+              f"({args.out.stat().st_size / 2**20:.1f} MB con índice y alineación)")
+        return
+
+    bundle = AssetBundle(args.bundle)
+    if args.cmd == "list":
+        for name, m in sorted(bundle.members.items()):
+            print(f"{m.length / 2**10:9.1f} KB  {m.sha256[:12]}  {name}")
+        return
+    bad = [name for name in bundle.members if hashlib.sha256(bundle.read(name)).hexdigest() != bundle.members[name].sha256]
+    for name in bad:
+        print(f"hash incorrecto: {name}")
+    print(f"{len(bundle.members) - len(bad)}/{len(bundle.members)} ficheros correctos")
+    if bad:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
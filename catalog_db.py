@@ -0,0 +1,466 @@
+"""Almacenamiento opcional del catálogo en SQLite: elementos, pasos, dependencias, imágenes y CAD.
+
+Uso:
+    python catalog_db.py import [--db catalogo.sqlite3]   # desde elementos.json y steps.json
+    python catalog_db.py stats [--db catalogo.sqlite3]
+
+Con MOTOR_CATALOG_DB=<ruta> las apps dejan de cargar los JSON enteros: cada pieza se lee con una
+consulta por clave primaria (CatalogDB.element) o por posición (ElementSequence), y la lista de
+pasos es una secuencia perezosa (StepSequence) que lee solo el paso que se pide, por su posición en
+el orden de dependencias, calculado al importar. La importación crea el esquema y deja la base en
+modo WAL: cualquier número de sesiones lee a la vez, sin bloquearse, mientras una importación
+escribe. Las apps abren la base en solo lectura (vale un fichero sin permiso de escritura), con una
+conexión por hilo.
+
+Con la base activa los JSON son el formato de intercambio: tras editarlos hay que volver a
+importar (build_assets.py lo hace si MOTOR_CATALOG_DB está definido). La base guarda el sha256 de
+los JSON importados y la huella del conversor a HTML (markdown_html.RENDER_FINGERPRINT); si no casan
+con los actuales (o la base falta o es de otro esquema), las apps vuelven a leer los JSON y avisan
+en la barra lateral (catalog_db_problem()).
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union, overload
+
+from markdown_html import RENDER_FINGERPRINT
+from models import Catalog, Element, Procedure, Step, load_catalog, load_procedure
+from paths import BASE_DIR, ELEMENTS_JSON, STEPS_JSON
+
+# ===================== Parámetros (ajustables) =====================
+CATALOG_DB_PATH = os.environ.get("MOTOR_CATALOG_DB")  # sin definir: los JSON, como siempre
+DEFAULT_DB = BASE_DIR / "catalogo.sqlite3"
+SOURCES = (ELEMENTS_JSON, STEPS_JSON)  # lo que se importa; su sha256 queda en meta
+SCHEMA_VERSION = 2  # 2: description_html en elements y steps
+BUSY_TIMEOUT_S = 5.0  # espera máxima de un lector si coincide con el final de una importación
+STALE_RECHECK_SECONDS = 5.0  # frecuencia máxima del chequeo de la base y los JSON (stale_reason)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS elements (
+    id          TEXT PRIMARY KEY,
+    position    INTEGER NOT NULL UNIQUE,    -- orden de elementos.json
+    name        TEXT,
+    description TEXT NOT NULL DEFAULT '',
+    description_html TEXT NOT NULL DEFAULT ''  -- ya convertida y saneada (markdown_html.py)
+);
+CREATE TABLE IF NOT EXISTS element_images (
+    element_id TEXT NOT NULL REFERENCES elements(id) ON DELETE CASCADE,
+    position   INTEGER NOT NULL,
+    name       TEXT NOT NULL,               -- relativo a images/
+    PRIMARY KEY (element_id, position)
+);
+CREATE INDEX IF NOT EXISTS element_images_by_name ON element_images(name);
+CREATE TABLE IF NOT EXISTS cad_models (
+    element_id TEXT NOT NULL REFERENCES elements(id) ON DELETE CASCADE,
+    position   INTEGER NOT NULL,
+    name       TEXT NOT NULL,               -- relativo a CAD/
+    PRIMARY KEY (element_id, position)
+);
+CREATE INDEX IF NOT EXISTS cad_models_by_name ON cad_models(name);
+CREATE TABLE IF NOT EXISTS steps (
+    id          TEXT PRIMARY KEY,
+    position    INTEGER NOT NULL UNIQUE,    -- orden de steps.json
+    seq         INTEGER NOT NULL UNIQUE,    -- orden de dependencias (Procedure.ordered)
+    title       TEXT,
+    description TEXT NOT NULL DEFAULT '',
+    description_html TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS step_dependencies (
+    step_id    TEXT NOT NULL REFERENCES steps(id) ON DELETE CASCADE,
+    position   INTEGER NOT NULL,
+    depends_on TEXT NOT NULL REFERENCES steps(id),
+    PRIMARY KEY (step_id, position)
+);
+CREATE INDEX IF NOT EXISTS step_dependencies_by_target ON step_dependencies(depends_on);
+CREATE TABLE IF NOT EXISTS step_elements (
+    step_id    TEXT NOT NULL REFERENCES steps(id) ON DELETE CASCADE,
+    position   INTEGER NOT NULL,
+    element_id TEXT NOT NULL,               -- sin REFERENCES: un paso puede citar una pieza aún sin ficha
+    PRIMARY KEY (step_id, position)
+);
+CREATE INDEX IF NOT EXISTS step_elements_by_element ON step_elements(element_id);
+CREATE TABLE IF NOT EXISTS step_images (
+    step_id  TEXT NOT NULL REFERENCES steps(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name     TEXT NOT NULL,                 -- relativo a 'imagenes montaje/'
+    PRIMARY KEY (step_id, position)
+);
+CREATE INDEX IF NOT EXISTS step_images_by_name ON step_images(name);
+CREATE TABLE IF NOT EXISTS images (
+    path        TEXT PRIMARY KEY,           -- relativa a la raíz del proyecto
+    folder      TEXT NOT NULL,
+    name        TEXT NOT NULL,              -- el nombre que usan los JSON
+    sha256      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    width       INTEGER NOT NULL,
+    height      INTEGER NOT NULL,
+    format      TEXT NOT NULL,
+    orientation INTEGER NOT NULL DEFAULT 1
+);
+CREATE UNIQUE INDEX IF NOT EXISTS images_by_name ON images(folder, name);
+CREATE INDEX IF NOT EXISTS images_by_sha ON images(sha256);
+"""
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st_.st_mtime_ns, st_.st_size
+
+
+def source_hashes(sources: Sequence[Path] = SOURCES) -> Dict[str, str]:
+    return {p.name: hashlib.sha256(p.read_bytes()).hexdigest() for p in sources}
+
+
+def _with_html(model, description_html: str):
+    """Deja puesto el cached_property description_html con el HTML guardado, como llega en la
+    instantánea: cada ejecución crea modelos nuevos y así no se vuelve a convertir nada."""
+    model.__dict__["description_html"] = description_html
+    return model
+
+
+class CatalogDB:
+    """Consultas puntuales sobre la base; una conexión de solo lectura por hilo (sqlite3 no comparte
+    conexiones). Solo import_models() escribe, con una conexión propia."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._checked: Optional[Tuple[Tuple, Optional[str]]] = None  # (firmas de los ficheros, veredicto)
+        self._checked_at = 0.0  # time.monotonic() del último chequeo
+        self._check_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # mode=ro: no crea una base vacía si falta, y sirve aunque el fichero no admita escritura
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_S)
+            self._local.conn = conn
+        return conn
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S)
+        conn.execute("PRAGMA journal_mode=WAL")  # persistente: lectores concurrentes sin bloquear al escritor
+        conn.execute("PRAGMA synchronous=NORMAL")  # suficiente con WAL: no se pierde consistencia
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            version = None  # base nueva
+        if version is not None and version[0] != str(SCHEMA_VERSION):
+            # otro esquema: CREATE TABLE IF NOT EXISTS no cambiaría las tablas viejas; se rehacen
+            tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            conn.execute("PRAGMA foreign_keys=OFF")
+            for table in tables:
+                conn.execute(f"DROP TABLE {table}")
+            conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def stale_reason(self, sources: Sequence[Path] = SOURCES) -> Optional[str]:
+        """Por qué la base no sirve tal cual (falta, es de otro esquema o los JSON han cambiado desde la
+        importación); None si está al día. Las apps lo preguntan varias veces por ejecución: el
+        veredicto se reutiliza STALE_RECHECK_SECONDS sin tocar el disco, después se comparan las
+        firmas de los ficheros y los hashes solo se recalculan si cambia alguno."""
+        with self._check_lock:
+            if self._checked is not None and time.monotonic() - self._checked_at < STALE_RECHECK_SECONDS:
+                return self._checked[1]
+        wal = self.path.with_name(f"{self.path.name}-wal")
+        key = tuple(_signature(p) for p in (self.path, wal, *sources))
+        with self._check_lock:
+            if self._checked is not None and self._checked[0] == key:
+                self._checked_at = time.monotonic()
+                return self._checked[1]
+        if key[0] is None:
+            reason = f"no existe {self.path.name}"
+        else:
+            try:
+                meta = dict(self.connect().execute("SELECT key, value FROM meta"))
+            except sqlite3.Error as e:
+                meta, reason = {}, f"no se puede leer {self.path.name} ({e})"
+            else:
+                reason = None
+            if reason is None and meta.get("schema_version") != str(SCHEMA_VERSION):
+                reason = f"{self.path.name} es de otra versión del esquema"
+            if reason is None and meta.get("render_fingerprint") != RENDER_FINGERPRINT:
+                reason = f"el HTML de las descripciones de {self.path.name} es de otra versión de markdown_html.py"
+            if reason is None:
+                changed = [name for name, digest in source_hashes(sources).items() if meta.get(f"sha256:{name}") != digest]
+                if changed:
+                    verb = "han" if len(changed) > 1 else "ha"
+                    reason = f"{' y '.join(changed)} {verb} cambiado desde la última importación"
+        with self._check_lock:
+            self._checked = (key, reason)
+            self._checked_at = time.monotonic()
+        return reason
+
+    def _column(self, sql: str, *args) -> Tuple[str, ...]:
+        return tuple(row[0] for row in self.connect().execute(sql, args))
+
+    # ---------- elementos ----------
+    def element(self, element_id: str) -> Optional[Element]:
+        return self._element_where("id = ?", element_id)
+
+    def element_at(self, position: int) -> Optional[Element]:
+        """Elemento en la posición `position` de elementos.json."""
+        return self._element_where("position = ?", position)
+
+    def _element_where(self, where: str, value) -> Optional[Element]:
+        row = self.connect().execute(
+            f"SELECT id, name, description, description_html FROM elements WHERE {where}", (value,)
+        ).fetchone()
+        if row is None:
+            return None
+        return _with_html(Element(
+            id=row[0], name=row[1], description=row[2],
+            images=self._column("SELECT name FROM element_images WHERE element_id = ? ORDER BY position", row[0]),
+            cad_model=self._column("SELECT name FROM cad_models WHERE element_id = ? ORDER BY position", row[0]),
+        ), row[3])
+
+    def element_count(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM elements").fetchone()[0]
+
+    def element_names(self) -> Tuple[Optional[str], ...]:
+        """Nombres de todos los elementos, en orden: lo que necesita el selector, sin cargar el resto."""
+        return self._column("SELECT name FROM elements ORDER BY position")
+
+    def elements(self) -> List[Element]:
+        """Todos los elementos en orden, con tres consultas (no una por elemento): para la rejilla del
+        catálogo y las búsquedas que recorren el catálogo entero."""
+        conn = self.connect()
+        children: Dict[str, Dict[str, List[str]]] = {}
+        for table, field in (("element_images", "images"), ("cad_models", "cad_model")):
+            for element_id, name in conn.execute(f"SELECT element_id, name FROM {table} ORDER BY element_id, position"):
+                children.setdefault(element_id, {}).setdefault(field, []).append(name)
+        return [
+            _with_html(Element(
+                id=eid, name=name, description=desc, **{k: tuple(v) for k, v in children.get(eid, {}).items()}
+            ), desc_html)
+            for eid, name, desc, desc_html in conn.execute(
+                "SELECT id, name, description, description_html FROM elements ORDER BY position"
+            )
+        ]
+
+    def elements_using_image(self, name: str) -> Tuple[str, ...]:
+        """Ids de los elementos que citan esa foto de images/."""
+        return self._column("SELECT element_id FROM element_images WHERE name = ? ORDER BY element_id", name)
+
+    # ---------- pasos ----------
+    def step_count(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM steps").fetchone()[0]
+
+    def step(self, step_id: str) -> Optional[Step]:
+        return self._step_where("id = ?", step_id)
+
+    def step_at(self, index: int, order: str = "seq") -> Optional[Step]:
+        """Paso en la posición `index` del orden de dependencias ("seq") o del de steps.json ("position")."""
+        if order not in ("seq", "position"):
+            raise ValueError(f"orden desconocido: {order!r}")
+        return self._step_where(f"{order} = ?", index)
+
+    def _step_where(self, where: str, value) -> Optional[Step]:
+        row = self.connect().execute(
+            f"SELECT id, title, description, description_html FROM steps WHERE {where}", (value,)
+        ).fetchone()
+        if row is None:
+            return None
+        sid = row[0]
+        return _with_html(Step(
+            id=sid, title=row[1], description=row[2],
+            elements=self._column("SELECT element_id FROM step_elements WHERE step_id = ? ORDER BY position", sid),
+            depends_on=self._column("SELECT depends_on FROM step_dependencies WHERE step_id = ? ORDER BY position", sid),
+            images=self._column("SELECT name FROM step_images WHERE step_id = ? ORDER BY position", sid),
+        ), row[3])
+
+    def steps_with_element(self, element_id: str) -> Tuple[str, ...]:
+        """Ids de los pasos en los que interviene una pieza, en orden de montaje."""
+        return self._column(
+            "SELECT s.id FROM step_elements e JOIN steps s ON s.id = e.step_id WHERE e.element_id = ? "
+            "ORDER BY s.seq", element_id,
+        )
+
+    # ---------- importación ----------
+    def import_models(self, catalog: Catalog, procedure: Procedure, sources: Sequence[Path] = SOURCES) -> None:
+        """Sustituye todo el contenido en una sola transacción: los lectores ven la versión anterior
+        o la nueva, nunca una mezcla. `sources`: los JSON de los que salen los modelos (su sha256
+        queda en meta para detectar una base desfasada)."""
+        from asset_index import get_asset_index  # import diferido: solo la importación lo necesita
+
+        hashes = source_hashes(sources)  # antes de escribir: si cambian mientras tanto, no casarán
+        seq = {s.id: i for i, s in enumerate(procedure.ordered)}
+        conn = self._connect_writer()
+        with conn:
+            for table in ("step_images", "step_elements", "step_dependencies", "steps",
+                          "cad_models", "element_images", "elements", "images", "meta"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany(
+                "INSERT INTO elements (id, position, name, description, description_html) VALUES (?, ?, ?, ?, ?)",
+                [(el.id, i, el.name, el.description, el.description_html) for i, el in enumerate(catalog.elements)],
+            )
+            conn.executemany(
+                "INSERT INTO element_images (element_id, position, name) VALUES (?, ?, ?)",
+                [(el.id, i, name) for el in catalog.elements for i, name in enumerate(el.images)],
+            )
+            conn.executemany(
+                "INSERT INTO cad_models (element_id, position, name) VALUES (?, ?, ?)",
+                [(el.id, i, name) for el in catalog.elements for i, name in enumerate(n for n in el.cad_model if n)],
+            )
+            conn.executemany(
+                "INSERT INTO steps (id, position, seq, title, description, description_html) VALUES (?, ?, ?, ?, ?, ?)",
+                [(s.id, i, seq[s.id], s.title, s.description, s.description_html) for i, s in enumerate(procedure.steps)],
+            )
+            for table, column, attr in (
+                ("step_dependencies", "depends_on", "depends_on"),
+                ("step_elements", "element_id", "elements"),
+                ("step_images", "name", "images"),
+            ):
+                conn.executemany(
+                    f"INSERT INTO {table} (step_id, position, {column}) VALUES (?, ?, ?)",
+                    [(s.id, i, v) for s in procedure.steps for i, v in enumerate(getattr(s, attr))],
+                )
+            conn.executemany(
+                "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (Path(a.path).relative_to(BASE_DIR).as_posix(), Path(a.path).relative_to(BASE_DIR).parts[0],
+                     a.name, a.sha256, a.size, a.mtime_ns, a.width, a.height, a.format, a.orientation)
+                    for a in get_asset_index().assets()
+                ],
+            )
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("schema_version", str(SCHEMA_VERSION)),
+                ("render_fingerprint", RENDER_FINGERPRINT),
+                ("catalog_version", catalog.version),
+                ("catalog_updated_at", catalog.updated_at),
+                ("steps_version", procedure.version),
+                ("steps_updated_at", procedure.updated_at),
+                *((f"sha256:{name}", digest) for name, digest in hashes.items()),
+            ])
+        conn.execute("PRAGMA optimize")  # estadísticas al día para el planificador
+        conn.close()
+        with self._check_lock:
+            self._checked = None  # el veredicto anterior ya no vale
+
+    def counts(self) -> List[Tuple[str, int]]:
+        tables = self._column("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+        return [(t, self.connect().execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]) for t in tables]
+
+
+class ElementSequence(Sequence[Element]):
+    """Los elementos de la base como secuencia: len() y [i] son consultas puntuales; recorrerla entera
+    la carga de una vez (CatalogDB.elements)."""
+
+    def __init__(self, db: CatalogDB):
+        self._db = db
+
+    def __len__(self) -> int:
+        return self._db.element_count()
+
+    @overload
+    def __getitem__(self, index: int) -> Element: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Element]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if not -n <= index < n:
+            raise IndexError(index)
+        element = self._db.element_at(index % n)
+        if element is None:  # la base se ha reimportado entre len() y la consulta
+            raise IndexError(index)
+        return element
+
+    def __iter__(self) -> Iterator[Element]:
+        return iter(self._db.elements())
+
+
+class StepSequence(Sequence[Step]):
+    """Los pasos de la base como secuencia: len() y [i] son consultas puntuales, no una carga completa."""
+
+    def __init__(self, db: CatalogDB, order: str = "seq"):
+        self._db = db
+        self._order = order
+
+    def __len__(self) -> int:
+        return self._db.step_count()
+
+    @overload
+    def __getitem__(self, index: int) -> Step: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Step]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if not -n <= index < n:
+            raise IndexError(index)
+        step = self._db.step_at(index % n, self._order)
+        if step is None:  # la base se ha reimportado entre len() y la consulta
+            raise IndexError(index)
+        return step
+
+    def __iter__(self) -> Iterator[Step]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+_db: Optional[CatalogDB] = None
+_db_lock = threading.Lock()
+
+
+def _configured_db() -> Optional[CatalogDB]:
+    global _db
+    with _db_lock:
+        if _db is None and CATALOG_DB_PATH:
+            _db = CatalogDB(CATALOG_DB_PATH)
+        return _db
+
+
+def get_catalog_db() -> Optional[CatalogDB]:
+    """Base activa del proceso (MOTOR_CATALOG_DB) si está al día con los JSON; None si el catálogo se
+    lee de los JSON (sin base configurada, o con una que no sirve: véase catalog_db_problem())."""
+    db = _configured_db()
+    return db if db is not None and db.stale_reason() is None else None
+
+
+def catalog_db_problem() -> Optional[str]:
+    """Aviso para la interfaz si hay una base configurada que no se está usando; si no, None."""
+    db = _configured_db()
+    reason = db.stale_reason() if db is not None else None
+    if reason is None:
+        return None
+    return f"Base SQLite sin usar ({reason}): se leen los JSON. Para usarla: python catalog_db.py import"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("cmd", choices=("import", "stats"))
+    ap.add_argument("--db", type=Path, default=Path(CATALOG_DB_PATH) if CATALOG_DB_PATH else DEFAULT_DB)
+    args = ap.parse_args()
+
+    db = CatalogDB(args.db)
+    if args.cmd == "import":
+        t0 = time.perf_counter()
+        db.import_models(load_catalog(), load_procedure())
+        print(f"importado en {time.perf_counter() - t0:.2f} s -> {args.db}")
+    for table, n in db.counts():
+        print(f"  {table:18} {n:6d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Caché en disco de derivados de imagen (bitmaps ya reducidos para pantalla).
+
+Cada derivado se guarda una sola vez bajo una clave que resume el contenido del origen (su
+hash si está en el índice de imágenes; si no, ruta, mtime y tamaño) y la caja destino; las
+siguientes ejecuciones (y otras sesiones o procesos) solo lo leen. Junto a los bitmaps se guardan
+también los bytes ya codificados para el navegador (get_bytes/put_bytes), con el codificador en
+la clave. El directorio tiene un tope en bytes con desalojo LRU, común a ambos tipos de fichero.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from asset_index import content_id
+
+# ===================== Parámetros (ajustables) =====================
+BASE_DIR = Path(__file__).parent
+CACHE_DIR = BASE_DIR / ".cache" / "derivados"  # fuera del control de versiones
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # tope total del directorio de derivados
+CACHE_EXT = ".png"  # sin pérdidas: leer el derivado equivale a recalcularlo
+ENCODED_EXT = ".bin"  # bytes codificados para pantalla (JPEG/WebP/PNG), listos para enviar
+
+_PNG_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"}
+
+
+class DerivativeCache:
+    """Almacén de derivados direccionado por contenido, seguro entre hilos."""
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # fichero -> bytes, de menos a más reciente
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scan()
+
+    # ---------- claves y rutas ----------
+    @staticmethod
+    def make_key(src: Path, box: Tuple[int, int], variant: str = "") -> str:
+        # identidad del contenido según el índice: las copias idénticas comparten derivado
+        raw = f"{content_id(src)}|{box[0]}x{box[1]}|{variant}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, ext: str = CACHE_EXT) -> Path:
+        return self._file_path(f"{key}{ext}")
+
+    def _file_path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    def _scan(self) -> None:
+        """Reconstruye el índice LRU a partir de lo que ya hay en disco (mtime = último acceso)."""
+        if not self.root.exists():
+            return
+        found = []
+        for ext in (CACHE_EXT, ENCODED_EXT):
+            for p in self.root.glob(f"*/*{ext}"):
+                try:
+                    st_ = p.stat()
+                except OSError:
+                    continue
+                found.append((st_.st_mtime_ns, p.name, st_.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total += size
+
+    # ---------- lectura / escritura ----------
+    def get(self, key: str) -> Optional[Image.Image]:
+        p = self.path_for(key)
+        try:
+            with Image.open(p) as im:
+                im.load()
+                img = im
+        except (FileNotFoundError, OSError):
+            self._missed(p.name)
+            return None
+        self._hit(p)
+        return img
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        p = self.path_for(key, ENCODED_EXT)
+        try:
+            data = p.read_bytes()
+        except OSError:
+            self._missed(p.name)
+            return None
+        self._hit(p)
+        return data
+
+    def _missed(self, name: str) -> None:
+        with self._lock:
+            self.misses += 1
+            self._forget(name)
+
+    def _hit(self, p: Path) -> None:
+        try:
+            os.utime(p)  # marca de acceso para el orden LRU entre reinicios
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if p.name not in self._entries:  # escrito por otro proceso (p. ej. el calentamiento)
+                self._entries[p.name] = p.stat().st_size
+                self._total += self._entries[p.name]
+            self._entries.move_to_end(p.name)
+
+    def put(self, key: str, img: Image.Image) -> None:
+        if img.mode not in _PNG_MODES:
+            img = img.convert("RGB")
+        # compresión ligera: prima la velocidad
+        self._store(self.path_for(key), lambda tmp: img.save(tmp, format="PNG", compress_level=1))
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        self._store(self.path_for(key, ENCODED_EXT), lambda tmp: tmp.write_bytes(data))
+
+    def _store(self, p: Path, write: Callable[[Path], object]) -> None:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write(tmp)
+        os.replace(tmp, p)  # escritura atómica: nunca se lee un derivado a medias
+        size = p.stat().st_size
+        with self._lock:
+            self._forget(p.name)
+            self._entries[p.name] = size
+            self._total += size
+            self._evict()
+
+    def get_or_build(
+        self,
+        src: Path,
+        box: Tuple[int, int],
+        build: Callable[[Path], Image.Image],
+        variant: str = "",
+    ) -> Image.Image:
+        key = self.make_key(src, box, variant)
+        img = self.get(key)
+        if img is None:
+            img = build(src)
+            self.put(key, img)
+        return img
+
+    # ---------- mantenimiento ----------
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)  # el menos usado recientemente
+            self._total -= size
+            self.evictions += 1
+            try:
+                self._file_path(name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in list(self._entries):
+                try:
+                    self._file_path(name).unlink()
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._total = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache: Optional[DerivativeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DerivativeCache:
+    """Instancia única por proceso, compartida por todas las sesiones de Streamlit."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DerivativeCache()
+        return _cache
@@ -1,9 +1,21 @@
-import json
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import streamlit as st
-from PIL import Image
+from pydantic import ValidationError
+
+from assets import PageBudget, image_for_display, image_serving_problem, show_image, variant_url
+from catalog_db import CatalogDB, ElementSequence, catalog_db_problem, get_catalog_db
+from engines import Engine, get_engine, load_engine_catalog, select_engine
+from file_watcher import watch_file
+from models import Element, describe_errors
+from part_lookup import get_part_index
+from paths import all_existing, first_existing
+from similarity import get_similarity_index
+from sprites import SPRITE_CELL_H, catalog_sprite
+from stats_panel import show_cache_stats
+from tiles import deep_zoom_viewer
 
 # ===================== Parámetros de tamaño (ajustables) =====================
 # Límites duros basados en viewport; reduce estos valores si aún ves la imagen grande.
@@ -13,6 +25,8 @@ IMG_MAX_VW = 48   # ancho máximo visible de la imagen en % del ancho de ventana
 # Reducción del bitmap por software (mejora nitidez y rendimiento al no enviar imágenes enormes).
 DOWNSCALE_MAX_W = 1200  # px [file:1]
 DOWNSCALE_MAX_H = 800   # px [file:1]
+# Ancho en pantalla para el srcset de la variante: columnas apiladas en móvil, si no el tope IMG_MAX_VW
+IMAGE_SIZES = f"(max-width: 640px) 100vw, {IMG_MAX_VW}vw"
 
 # ===================== Configuración de página y estilos =====================
 st.set_page_config(page_title="Partes del motor", layout="wide")  # layout ancho [file:1]
@@ -25,6 +39,7 @@ st.markdown(f"""
 .stButton > button {{ width: 100%; }}  /* botones a ancho de columna */
 
 .desc-text {{ margin: 0.2rem 0 0.6rem 0; font-size: 0.95rem; opacity: 0.9; }}  /* descripción encima de imagen */
+.desc-text p, .desc-text ul, .desc-text ol {{ margin: 0 0 0.4rem 0; }}  /* HTML de la descripción (markdown_html.py) */
 
 /* Limita TODAS las imágenes de Streamlit (st.image) en la página */
 div[data-testid="stImage"] img {{
@@ -37,6 +52,7 @@ div[data-testid="stImage"] img {{
   display: block;
   margin: 0 auto;                          /* centrado */
 }}
+div.lqip {{ max-height: {IMG_MAX_VH}vh; max-width: {IMG_MAX_VW}vw; }}  /* mismo tope para show_image (assets.py) */
 
 /* Afinado en portátiles más estrechos */
 @media (max-width: 1280px) {{
@@ -47,48 +63,158 @@ div[data-testid="stImage"] img {{
 </style>
 """, unsafe_allow_html=True)  # la modificación de IMG_MAX_VH/IMG_MAX_VW surte efecto inmediato tras guardar [file:1]
 
-# ===================== Rutas =====================
-BASE_DIR = Path(__file__).parent  # raíz del proyecto [file:1]
-JSON_PATH = BASE_DIR / "elementos.json"  # archivo JSON con la lista de elementos [file:1]
-IMAGES_DIR = BASE_DIR / "images"  # carpeta con imágenes referenciadas en el JSON [file:1]
+# ===================== Vista de catálogo =====================
+CATALOG_COLUMNS = 6  # piezas por fila en la rejilla (las miniaturas salen de una sola hoja de sprites)
+
+# ===================== Buscar por foto =====================
+LOOKUP_TOP_K = 5  # candidatos que se ofrecen para una foto subida o de la cámara (part_lookup.py)
+
+# ===================== Fotos parecidas =====================
+SIMILAR_LIMIT = 6     # fotos más parecidas (pHash, ver similarity.py) que se muestran bajo la ficha
+SIMILAR_THUMB_W = 240  # px
+SIMILAR_THUMB_H = 160  # px
 
 # ===================== Utilidades =====================
-@st.cache_data
-def load_elements():
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data.get("elements", [])  # estructura esperada: {version, updated_at, elements:[...]} [file:1]
-
-def get_first_image_path(images_list: List[str]) -> Optional[Path]:
-    for name in images_list or []:
-        p = IMAGES_DIR / name
-        if p.exists():
-            return p
-    return None  # no hay imagen disponible [file:1]
-
-def downscale_for_display(img_path: Path, max_w: int, max_h: int) -> Image.Image:
-    """Reduce el bitmap para que el navegador no tenga que escalar imágenes enormes, manteniendo aspecto."""
-    img = Image.open(img_path)
-    w, h = img.size
-    scale = min(max_w / w, max_h / h, 1.0)  # solo reducir, nunca ampliar [file:1]
-    if scale < 1.0:
-        new_size: Tuple[int, int] = (int(w * scale), int(h * scale))
-        img = img.resize(new_size, Image.LANCZOS)
-    return img  # imagen físicamente más pequeña para render fluido [file:1]
+# Rutas del motor elegido (engines.py): engine.elements_json y engine.elements_img_dir
+@st.cache_resource  # modelos inmutables (models.py): compartidos entre sesiones sin copiarlos, uno por motor
+def load_elements(engine_id: str) -> Tuple[Element, ...]:
+    return load_engine_catalog(get_engine(engine_id)).elements  # estructura validada: {version, updated_at, elements:[...]}
+
+def catalog_db(engine: Engine) -> Optional[CatalogDB]:
+    return get_catalog_db() if engine.is_default else None  # la base SQLite es del motor principal
+
+def engine_elements(engine: Engine) -> Sequence[Element]:
+    db = catalog_db(engine)
+    if db is not None:
+        return ElementSequence(db)  # la ficha lee solo su elemento; el catálogo entero, de una vez
+    return load_elements(engine.id)
+
+def element_names(engine: Engine, elements: Sequence[Element]) -> List[str]:
+    db = catalog_db(engine)
+    raw = db.element_names() if db is not None else [el.name for el in elements]  # con base: solo la columna
+    return [name or f"Elemento {i}" for i, name in enumerate(raw)]
+
+def watch_engine(engine: Engine) -> None:
+    # recarga solo el JSON editado, y solo la entrada de ese motor
+    watch_file(engine.elements_json, f"elementos.load_elements.{engine.id}", partial(load_elements.clear, engine.id))
+
+def get_first_image_path(engine: Engine, images_list: Sequence[str]) -> Optional[Path]:
+    return first_existing(engine.elements_img_dir, images_list)  # None si no hay imagen disponible [file:1]
+
+def open_element(i: int) -> None:
+    st.session_state.idx = i
+    st.session_state.vista = "Ficha"  # callback: se aplica antes de dibujar el selector de vista
+
+def show_catalog(engine: Engine, elements: Sequence[Element], names: List[str]) -> None:
+    """Rejilla con todas las piezas: una única imagen (la hoja de sprites) para todas las miniaturas."""
+    elements = list(elements)  # con la base, una sola carga para la hoja y para las celdas
+    sprite = catalog_sprite(elements, engine)
+    st.markdown(f"""
+<style>
+.cat-cell   {{ height: {SPRITE_CELL_H}px; display: flex; align-items: center; justify-content: center; overflow: hidden; }}
+.cat-sprite {{ background-image: url('{variant_url(sprite)}'); background-repeat: no-repeat;
+               background-size: {sprite['width']}px {sprite['height']}px; border-radius: 4px; }}
+.cat-empty  {{ font-size: 0.8rem; opacity: 0.6; }}
+</style>
+""", unsafe_allow_html=True)  # la URL de la hoja se declara una vez; las celdas solo cambian el desplazamiento
+    for start in range(0, len(elements), CATALOG_COLUMNS):
+        cols = st.columns(CATALOG_COLUMNS)
+        for i, (col, el) in enumerate(zip(cols, elements[start:start + CATALOG_COLUMNS]), start):
+            box = sprite["items"].get(el.id)
+            if box:
+                x, y, w, h = box
+                cell = f"<div class='cat-sprite' style='width:{w}px;height:{h}px;background-position:-{x}px -{y}px'></div>"
+            else:
+                cell = "<div class='cat-empty'>Sin imagen</div>"
+            with col:
+                st.markdown(f"<div class='cat-cell'>{cell}</div>", unsafe_allow_html=True)
+                st.button(names[i], key=f"cat_{i}", on_click=open_element, args=(i,), width="stretch")
+
+def show_similar(engine: Engine, elements: Sequence[Element], img_path: Path, budget: PageBudget) -> None:
+    """Fotos de cualquiera de las dos carpetas parecidas a la de la pieza; las del catálogo abren su ficha."""
+    index = get_similarity_index()
+    if index.missing:  # hashes sin calcular: la búsqueda no los calcula, lo hace el script
+        st.caption(f"{index.missing} foto(s) aún sin hash quedan fuera de la búsqueda: ejecuta python similarity.py")
+    matches = index.similar(img_path, limit=SIMILAR_LIMIT)
+    if not matches:
+        st.caption("No hay fotos parecidas a esta.")
+        return
+    owner = {str(p): i for i, el in enumerate(elements) for p in all_existing(engine.elements_img_dir, el.images)}
+    for rank, (col, m) in enumerate(zip(st.columns(SIMILAR_LIMIT), matches)):
+        with col:
+            st.image(image_for_display(m.path, SIMILAR_THUMB_W, SIMILAR_THUMB_H, budget=budget), width="stretch")
+            st.caption(f"{m.path.parent.name}/{m.path.name} · distancia {m.distance}")
+            i = owner.get(str(m.path))
+            if i is not None and i != st.session_state.idx:
+                # clave por puesto: dos fotos parecidas pueden ser del mismo elemento
+                st.button(elements[i].name or f"Elemento {i}", key=f"similar_{rank}", on_click=open_element, args=(i,))
+
+def show_photo_lookup(elements: Sequence[Element]) -> None:
+    """Foto de la cámara o subida -> elementos más parecidos del catálogo, con botón para abrir su ficha."""
+    photo = st.camera_input("Haz una foto de la pieza", key="foto_camara")
+    upload = st.file_uploader("...o sube una imagen", type=["jpg", "jpeg", "png", "webp"], key="foto_subida")
+    source = photo or upload
+    if source is None:
+        return
+    index = get_part_index()
+    if index.missing:  # descriptores sin calcular: la búsqueda no los calcula, lo hace el script
+        st.caption(f"{index.missing} foto(s) de piezas aún sin descriptor quedan fuera: ejecuta python part_lookup.py build")
+    try:
+        matches = index.lookup(source, LOOKUP_TOP_K)
+    except Exception as e:
+        st.warning(f"No se pudo leer la foto. Error: {e}")
+        return
+    position = {el.id: i for i, el in enumerate(elements)}
+    for col, m in zip(st.columns(LOOKUP_TOP_K), matches):
+        i = position.get(m.element_id)
+        if i is None:
+            continue
+        with col:
+            st.image(image_for_display(m.path, SIMILAR_THUMB_W, SIMILAR_THUMB_H), width="stretch")
+            st.caption(f"similitud {m.score:.2f}")
+            st.button(elements[i].name or f"Elemento {i}", key=f"lookup_{i}", on_click=open_element, args=(i,),
+                      width="stretch")
 
 # ===================== App =====================
 def main():
     st.title("Explorador de elementos")  # encabezado [file:1]
 
-    elements = load_elements()
+    engine = select_engine(reset_keys=("idx",))  # la posición es de otro catálogo
+    watch_engine(engine)
+    problem = catalog_db_problem() if engine.is_default else None
+    if problem:
+        st.sidebar.warning(problem)  # base desfasada o ausente: se siguen los JSON
+    serving = image_serving_problem()
+    if serving:
+        st.sidebar.warning(serving)  # modo "server" sin URL o sin servidor: las imágenes van por /app/static/
+    try:
+        elements = engine_elements(engine)
+    except ValidationError as e:  # todos los errores del fichero juntos, al cargar
+        st.error(describe_errors(e, engine.elements_json))
+        return
     if not elements:
         st.error("No se encontraron elementos en elementos.json.")
         return  # manejo si el JSON está vacío o mal formado [file:1]
 
     if "idx" not in st.session_state:
         st.session_state.idx = 0  # índice inicial [file:1]
+    st.session_state.idx %= len(elements)  # por si elementos.json ha cambiado y tiene menos elementos
 
-    names = [el.get("name", f"Elemento {i}") for i, el in enumerate(elements)]  # nombres para selector [file:1]
+    names = element_names(engine, elements)  # nombres para selector [file:1]
+
+    # búsqueda por foto y fotos parecidas: índices del motor principal (part_lookup.py, similarity.py)
+    vistas = ["Ficha", "Catálogo", "Buscar por foto"] if engine.is_default else ["Ficha", "Catálogo"]
+    if st.session_state.get("vista") not in vistas:
+        st.session_state.vista = "Ficha"
+    vista = st.radio("Vista", vistas, key="vista", horizontal=True, label_visibility="collapsed")
+    if vista == "Catálogo":
+        show_catalog(engine, elements, names)  # pulsar una pieza vuelve a la ficha en ese elemento
+        show_cache_stats()
+        return
+    if vista == "Buscar por foto":
+        show_photo_lookup(elements)  # pulsar un candidato abre su ficha
+        show_cache_stats()
+        return
 
     # Columna central relativamente estrecha; reduce el factor si se desea aún menor anchura del área de imagen.
     controls_col, content_col, meta_col = st.columns([1, 1.6, 1])  # distribución de columnas [file:1]
@@ -108,9 +234,9 @@ def main():
         #)  # salto directo a cualquier elemento [file:1]
 
     current = elements[st.session_state.idx]  # elemento activo [file:1]
-    name = current.get("name", "Sin nombre")  # nombre [file:1]
-    desc = current.get("description", "")  # descripción [file:1]
-    img_path = get_first_image_path(current.get("images", []))  # primera imagen existente de la lista [file:1]
+    name = current.name or "Sin nombre"  # nombre [file:1]
+    desc = current.description_html  # descripción ya convertida a HTML saneado (models.py)
+    img_path = get_first_image_path(engine, current.images)  # primera imagen existente de la lista [file:1]
 
     with content_col:
         # Título y descripción arriba, imagen debajo.
@@ -120,11 +246,16 @@ def main():
             unsafe_allow_html=True
         )  # descripción compacta encima de la imagen [file:1]
 
+        budget = PageBudget()  # bytes de imagen de esta ficha, con el tope de MOTOR_PAGE_BUDGET_KB
         if img_path is not None:
             try:
-                img = downscale_for_display(img_path, DOWNSCALE_MAX_W, DOWNSCALE_MAX_H)  # reduce bitmap [file:1]
                 # Importante: no usar use_container_width=True para no forzar 100% de la columna.
-                st.image(img)  # la regla CSS global limita altura/anchura reales del <img> [file:1]
+                # Miniatura de carga al instante y, en el mismo hueco, la variante o los bytes reducidos.
+                show_image(img_path, DOWNSCALE_MAX_W, DOWNSCALE_MAX_H, budget=budget, sizes=IMAGE_SIZES)  # la regla CSS global limita altura/anchura reales del <img> [file:1]
+                if st.toggle("Ver en detalle (zoom)", key="zoom_elemento"):
+                    deep_zoom_viewer(img_path)  # resolución nativa por teselas, solo las visibles
+                if engine.is_default and st.toggle("Ver fotos parecidas", key="similares_elemento"):
+                    show_similar(engine, elements, img_path, budget)
             except Exception as e:
                 st.warning(f"No se pudo abrir la imagen: {img_path.name}. Error: {e}")  # manejo de errores de imagen [file:1]
         else:
@@ -132,11 +263,13 @@ def main():
 
     #with meta_col:
     #    st.subheader("Detalles")  # metadatos [file:1]
-    #    st.write("ID:", current.get("id"))  # id del elemento [file:1]
-    #    st.write("Imagen:", current.get("images", []))  # nombres de archivo de imagen en el JSON [file:1]
+    #    st.write("ID:", current.id)  # id del elemento [file:1]
+    #    st.write("Imagen:", current.images)  # nombres de archivo de imagen en el JSON [file:1]
 
     #st.caption("Asegurar que las imágenes existan en ./images con los nombres indicados en elementos.json.")  # recordatorio [file:1]
 
+    show_cache_stats({"Transferencia de la página": budget.summary()})  # estado de las cachés compartidas, en la barra lateral
+
 if __name__ == "__main__":
     main()  # ejecución de la app [file:1]
 
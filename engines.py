@@ -0,0 +1,154 @@
+"""Registro de motores: cada familia de motor con su catálogo, sus pasos y sus imágenes.
+
+Estructura:
+    elementos.json, steps.json, images/, 'imagenes montaje/'     motor principal (DEFAULT_ENGINE)
+    motores/<id>/elementos.json, steps.json, images/, ...         un motor más por carpeta
+
+Descubrir los motores solo lista carpetas: de un motor no se lee nada hasta que una sesión lo
+elige en la barra lateral (select_engine()). Entonces se validan sus JSON (load_engine_catalog /
+load_engine_procedure, que las apps envuelven en st.cache_resource por id de motor), se abre su
+manifiesto de derivados (assets.load_manifest) y sus imágenes entran en las cachés compartidas
+etiquetadas con su id. engine_memory() reparte la memoria por motor: uno que nadie ha abierto
+ocupa cero.
+
+La instantánea compilada, la base SQLite, el índice de imágenes, la búsqueda por foto y las fotos
+parecidas siguen siendo del motor principal; los demás leen sus JSON y sondean sus carpetas.
+"""
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Sequence, Union
+
+from models import Catalog, Procedure, load_catalog, load_procedure
+from paths import BASE_DIR, steps_img_dir
+
+# ===================== Parámetros (ajustables) =====================
+ENGINES_DIR = BASE_DIR / "motores"  # dentro del proyecto: los derivados se nombran por ruta relativa a la raíz
+DEFAULT_ENGINE = "principal"  # id del motor de la raíz del proyecto
+DEFAULT_ENGINE_NAME = "Motor principal"
+SESSION_KEY = "motor"  # clave de st.session_state con el id del motor elegido (común a las dos apps)
+
+
+class Engine(NamedTuple):
+    id: str
+    name: str
+    root: Path
+
+    @property
+    def elements_json(self) -> Path:
+        return self.root / "elementos.json"
+
+    @property
+    def steps_json(self) -> Path:
+        return self.root / "steps.json"
+
+    @property
+    def elements_img_dir(self) -> Path:
+        return self.root / "images"
+
+    @property
+    def steps_img_dir(self) -> Path:
+        return steps_img_dir(self.root)
+
+    @property
+    def is_default(self) -> bool:
+        return self.id == DEFAULT_ENGINE
+
+
+_engines: Dict[str, Engine] = {}
+_engines_mtime: Optional[int] = None
+_engines_lock = threading.Lock()
+
+
+def discover_engines() -> Dict[str, Engine]:
+    """id -> Engine, el principal primero; la carpeta de motores se vuelve a listar solo si cambia."""
+    global _engines, _engines_mtime
+    try:
+        mtime = os.stat(ENGINES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _engines_lock:
+        if not _engines or mtime != _engines_mtime:
+            found = {DEFAULT_ENGINE: Engine(DEFAULT_ENGINE, DEFAULT_ENGINE_NAME, BASE_DIR)}
+            for d in sorted(ENGINES_DIR.iterdir()) if mtime is not None else ():
+                engine = Engine(d.name, d.name.replace("_", " ").capitalize(), d)
+                if d.is_dir() and d.name not in found and engine.elements_json.exists() and engine.steps_json.exists():
+                    found[d.name] = engine
+            _engines, _engines_mtime = found, mtime
+        return _engines
+
+
+def get_engine(engine_id: str = DEFAULT_ENGINE) -> Engine:
+    engines = discover_engines()
+    if engine_id not in engines:
+        raise KeyError(f"motor desconocido: {engine_id!r} (hay {', '.join(engines)})")
+    return engines[engine_id]
+
+
+def engine_for_path(path: Union[str, Path]) -> str:
+    """Id del motor al que pertenece un fichero, solo por su ruta (sin listar carpetas)."""
+    try:
+        rel = Path(path).relative_to(ENGINES_DIR)
+    except ValueError:
+        return DEFAULT_ENGINE
+    return rel.parts[0] if rel.parts else DEFAULT_ENGINE
+
+
+# ===================== Carga perezosa y memoria por motor =====================
+_model_bytes: Dict[str, Dict[str, int]] = {}
+_model_bytes_lock = threading.Lock()
+
+
+def _record(engine_id: str, kind: str, model: Union[Catalog, Procedure]) -> None:
+    # tamaño serializado como medida del modelo: proporcional a lo que ocupa, sin recorrer objetos
+    size = len(pickle.dumps(model, protocol=5))
+    with _model_bytes_lock:
+        _model_bytes.setdefault(engine_id, {})[kind] = size
+
+
+def load_engine_catalog(engine: Engine) -> Catalog:
+    catalog = load_catalog(engine.elements_json)
+    _record(engine.id, "elementos", catalog)
+    return catalog
+
+
+def load_engine_procedure(engine: Engine) -> Procedure:
+    procedure = load_procedure(engine.steps_json)
+    _record(engine.id, "pasos", procedure)
+    return procedure
+
+
+def engine_memory() -> Dict[str, Dict[str, int]]:
+    """Por motor cargado: bytes de sus modelos y de sus entradas en la caché de memoria compartida."""
+    from memory_cache import get_memory_cache  # import diferido: memory_cache no sabe de motores
+
+    with _model_bytes_lock:
+        usage = {eid: {"modelos": sum(kinds.values())} for eid, kinds in _model_bytes.items()}
+    for eid, (entries, nbytes) in get_memory_cache().usage_by_owner().items():
+        usage.setdefault(eid, {"modelos": 0}).update({"caché": nbytes, "entradas": entries})
+    return usage
+
+
+# ===================== Selector =====================
+def _reset_session(keys: Sequence[str]) -> None:
+    import streamlit as st
+
+    for key in keys:
+        st.session_state.pop(key, None)
+
+
+def select_engine(reset_keys: Sequence[str] = ()) -> Engine:
+    """Selector de motor en la barra lateral (si hay más de uno); al cambiar se borran `reset_keys`
+    de la sesión (la posición de navegación, que es de otro catálogo)."""
+    import streamlit as st  # import diferido: el resto del módulo lo usan también los scripts
+
+    engines = discover_engines()
+    if st.session_state.get(SESSION_KEY) not in engines:
+        st.session_state[SESSION_KEY] = DEFAULT_ENGINE  # primera visita, o el motor ya no existe
+    if len(engines) > 1:
+        st.sidebar.selectbox(
+            "Motor", list(engines), format_func=lambda eid: engines[eid].name, key=SESSION_KEY,
+            on_change=_reset_session, args=(tuple(reset_keys),),
+        )
+    return engines[st.session_state[SESSION_KEY]]
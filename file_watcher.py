@@ -0,0 +1,201 @@
+"""Vigilancia de ficheros de datos para invalidar solo las cachés afectadas.
+
+Un hilo por proceso observa las carpetas de los ficheros registrados con inotify (Linux) o, si no
+está disponible, sondeando su mtime. Ante un cambio se recalcula el hash del fichero y, solo si el
+contenido es distinto, se ejecutan sus callbacks (p. ej. `load_steps.clear`). Se vigila la carpeta
+y no el fichero porque los editores suelen guardar escribiendo un temporal y renombrándolo.
+Una carpeta que inotify no admite (cuota de vigilancias agotada, sistema de ficheros de red) se
+sondea igual que sin inotify, y se avisa una vez en el log.
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+# ===================== Parámetros (ajustables) =====================
+POLL_INTERVAL = 1.0  # s, solo en modo sondeo
+SETTLE_DELAY = 0.2   # s de espera tras un evento antes de leer el fichero (escrituras en curso)
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (struct inotify_event)
+_log = logging.getLogger(__name__)
+
+
+def file_digest(path: Path) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class _Watched:
+    def __init__(self, path: Path):
+        self.path = path
+        self.digest = file_digest(path)
+        self.mtime = self._mtime()
+        self.callbacks: Dict[str, Callable[[], None]] = {}
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+
+class FileWatcher:
+    """Registro fichero -> callbacks con detección por inotify o por sondeo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files: Dict[Path, _Watched] = {}
+        self._dir_wds: Dict[Path, int] = {}
+        self._wd_dirs: Dict[int, Path] = {}
+        self._polled_dirs: Set[Path] = set()  # carpetas sin vigilancia inotify: se sondean
+        self._inotify_fd = self._init_inotify()
+        self.mode = "inotify" if self._inotify_fd is not None else "polling"
+        self.changes = 0
+        self._thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+        self._thread.start()
+
+    # ---------- registro ----------
+    def watch(self, path: Path, key: str, on_change: Callable[[], None]) -> None:
+        """Asocia `on_change` al fichero bajo `key`; registrar otra vez la misma clave la sustituye.
+
+        Las apps de Streamlit re-ejecutan su script en cada interacción, así que la sustitución por
+        clave evita acumular callbacks repetidos.
+        """
+        path = Path(os.path.abspath(path))
+        with self._lock:
+            watched = self._files.get(path)
+            if watched is None:
+                watched = self._files[path] = _Watched(path)
+                self._add_dir_watch(path.parent)
+            watched.callbacks[key] = on_change
+
+    # ---------- inotify ----------
+    def _init_inotify(self) -> Optional[int]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        self._libc = libc
+        return fd
+
+    def _add_dir_watch(self, directory: Path) -> None:
+        if self._inotify_fd is None or directory in self._dir_wds or directory in self._polled_dirs:
+            return
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(directory), mask)
+        if wd < 0:
+            # sin permiso, sin cuota de inotify o sistema de ficheros que no lo admite: se sondea
+            err = ctypes.get_errno()
+            _log.warning("inotify no vigila %s (%s): se comprueba su mtime cada %.0f s",
+                         directory, os.strerror(err) if err else "error desconocido", POLL_INTERVAL)
+            self._polled_dirs.add(directory)
+            return
+        self._dir_wds[directory] = wd
+        self._wd_dirs[wd] = directory
+
+    def _read_inotify(self) -> None:
+        # espera eventos; como mucho POLL_INTERVAL, para sondear entretanto las carpetas sin vigilancia
+        ready, _, _ = select.select([self._inotify_fd], [], [], POLL_INTERVAL)
+        if not ready:
+            self._poll_fallback()
+            return
+        buf = os.read(self._inotify_fd, 64 * 1024)
+        touched = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+            name = buf[offset + _EVENT_HEADER.size: offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            directory = self._wd_dirs.get(wd)
+            if directory is not None and name:
+                touched.add(directory / os.fsdecode(name))
+        with self._lock:
+            candidates = [w for p, w in self._files.items() if p in touched]
+        if candidates:
+            time.sleep(SETTLE_DELAY)
+            for watched in candidates:
+                self._check(watched, force=True)
+        self._poll_fallback()
+
+    # ---------- sondeo ----------
+    def _poll(self) -> None:
+        time.sleep(POLL_INTERVAL)
+        with self._lock:
+            watched_files = list(self._files.values())
+        for watched in watched_files:
+            self._check(watched, force=False)
+
+    def _poll_fallback(self) -> None:
+        """Con inotify activo, sondea solo los ficheros de las carpetas que no admitió."""
+        with self._lock:
+            watched_files = [w for p, w in self._files.items() if p.parent in self._polled_dirs]
+        for watched in watched_files:
+            self._check(watched, force=False)
+
+    # ---------- bucle ----------
+    def _check(self, watched: _Watched, force: bool) -> None:
+        mtime = watched._mtime()
+        if not force and mtime == watched.mtime:
+            return
+        watched.mtime = mtime
+        digest = file_digest(watched.path)
+        if digest == watched.digest:
+            return  # mismo contenido (p. ej. solo se ha tocado el fichero): nada que invalidar
+        watched.digest = digest
+        self.changes += 1
+        with self._lock:
+            callbacks = list(watched.callbacks.values())
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:  # un callback roto no debe detener la vigilancia del resto
+                pass
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if self._inotify_fd is not None:
+                    self._read_inotify()
+                else:
+                    self._poll()
+            except OSError:
+                # inotify deja de funcionar (p. ej. descriptor cerrado): se sigue por sondeo
+                self._inotify_fd = None
+                self.mode = "polling"
+
+
+_watcher: Optional[FileWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher() -> FileWatcher:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = FileWatcher()
+        return _watcher
+
+
+def watch_file(path: Path, key: str, on_change: Callable[[], None]) -> None:
+    """Atajo: registra `on_change` en el vigilante único del proceso."""
+    get_watcher().watch(path, key, on_change)
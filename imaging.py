@@ -0,0 +1,195 @@
+"""Operaciones de imagen compartidas por elementos.py y steps.py."""
+import io
+import math
+import os
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from bundle import image_source
+from derivative_cache import DerivativeCache, get_cache
+from engines import engine_for_path
+from memory_cache import get_memory_cache
+
+# ===================== Parámetros de tamaño (por defecto) =====================
+DOWNSCALE_MAX_W = 1200  # px
+DOWNSCALE_MAX_H = 800   # px
+
+# ===================== Niveles de calidad del remuestreo =====================
+#   fast:     decodificación reducida de JPEG (libjpeg escala en la DCT 1/2, 1/4, 1/8) hasta justo por
+#             encima del destino y BILINEAR para terminar; en otros formatos, reduce() + BILINEAR
+#   balanced: igual, pero dejando al menos BALANCED_OVERSAMPLE veces el destino y terminando con LANCZOS
+#   best:     decodificación completa + LANCZOS
+# Se elige por despliegue (MOTOR_QUALITY_TIER) y, opcionalmente, por clase de dispositivo:
+#   MOTOR_QUALITY_TIERS="movil=fast,escritorio=best"   (clases: ver assets.device_class())
+# bench_quality.py mide el coste y el SSIM de cada nivel frente a best para decidir con datos.
+QUALITY_TIERS = ("fast", "balanced", "best")
+FAST_FINISH_RESAMPLE = Image.BILINEAR
+BALANCED_OVERSAMPLE = 2.0
+
+
+def _check_tier(tier: str) -> str:
+    if tier not in QUALITY_TIERS:
+        raise ValueError(f"Nivel de calidad desconocido: {tier!r} (válidos: {', '.join(QUALITY_TIERS)})")
+    return tier
+
+
+def _parse_device_tiers(spec: str) -> Dict[str, str]:
+    pairs = (item.split("=", 1) for item in spec.split(",") if "=" in item)
+    return {device.strip(): _check_tier(tier.strip()) for device, tier in pairs}
+
+
+QUALITY_TIER = _check_tier(os.environ.get("MOTOR_QUALITY_TIER", "fast"))  # nivel por defecto del despliegue
+DEVICE_QUALITY_TIERS = _parse_device_tiers(os.environ.get("MOTOR_QUALITY_TIERS", ""))
+
+
+def tier_for_device(device: Optional[str]) -> str:
+    """Nivel configurado para una clase de dispositivo, o el del despliegue si no tiene uno propio."""
+    return DEVICE_QUALITY_TIERS.get(device or "", QUALITY_TIER)
+
+# ===================== Codificación para pantalla =====================
+# Lo que se envía al navegador cuando no hay variante precalculada. Streamlit deja pasar tal cual
+# los bytes JPEG y PNG, pero recodifica cualquier otro formato a JPEG 90; por eso WebP viaja como
+# data URL (assets.image_for_display). Se configura por despliegue:
+#   MOTOR_DISPLAY_FORMAT=jpeg|webp  MOTOR_DISPLAY_QUALITY=1..100  MOTOR_DISPLAY_SUBSAMPLING=4:4:4|4:2:2|4:2:0
+# El submuestreo de croma solo se aplica a JPEG (WebP con pérdidas es siempre 4:2:0).
+DISPLAY_FORMATS = ("jpeg", "webp")
+CHROMA_SUBSAMPLING = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}  # valores de `subsampling` de Pillow
+
+
+class Encoder(NamedTuple):
+    format: str = "jpeg"
+    quality: int = 90  # la misma que usa Streamlit cuando recodifica por su cuenta
+    subsampling: Optional[str] = None  # None: la del codificador (4:2:0 en JPEG)
+
+    @property
+    def tag(self) -> str:
+        """Parte de la clave de caché: cada configuración tiene sus propios bytes."""
+        return f"{self.format}-q{self.quality}-{self.subsampling or 'auto'}"
+
+
+def _check_encoder(encoder: Encoder) -> Encoder:
+    if encoder.format not in DISPLAY_FORMATS:
+        raise ValueError(f"Formato de pantalla desconocido: {encoder.format!r} (válidos: {', '.join(DISPLAY_FORMATS)})")
+    if not 1 <= encoder.quality <= 100:
+        raise ValueError(f"Calidad fuera de rango: {encoder.quality} (1..100)")
+    if encoder.subsampling is not None and encoder.subsampling not in CHROMA_SUBSAMPLING:
+        raise ValueError(f"Submuestreo desconocido: {encoder.subsampling!r} (válidos: {', '.join(CHROMA_SUBSAMPLING)})")
+    return encoder
+
+
+DISPLAY_ENCODER = _check_encoder(Encoder(
+    os.environ.get("MOTOR_DISPLAY_FORMAT", "jpeg").lower(),
+    int(os.environ.get("MOTOR_DISPLAY_QUALITY", "90")),
+    os.environ.get("MOTOR_DISPLAY_SUBSAMPLING") or None,
+))
+
+
+def render_downscaled(img_path: Path, max_w: int, max_h: int) -> Image.Image:
+    """Nivel best: reduce el bitmap manteniendo aspecto (sin pasar por la caché)."""
+    img = Image.open(image_source(img_path))
+    w, h = img.size
+    scale = min(max_w / w, max_h / h, 1.0)  # solo reducir, nunca ampliar
+    if scale < 1.0:
+        new_size: Tuple[int, int] = (int(w * scale), int(h * scale))
+        img = img.resize(new_size, Image.LANCZOS)
+    return img
+
+
+def render_downscaled_fast(img_path: Path, max_w: int, max_h: int) -> Image.Image:
+    """Nivel fast: como render_downscaled, pero pide a libjpeg que decodifique ya cerca del tamaño final."""
+    img = Image.open(image_source(img_path))
+    w, h = img.size
+    scale = min(max_w / w, max_h / h, 1.0)
+    if scale >= 1.0:
+        return img
+    new_size: Tuple[int, int] = (int(w * scale), int(h * scale))
+    # draft() solo actúa sobre JPEG y elige la mayor reducción que no baja del tamaño pedido
+    drafted = img.draft(img.mode, (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale))))
+    if drafted is None:  # formato sin escalado DCT: reducción entera por bloques y BILINEAR
+        return img.resize(new_size, FAST_FINISH_RESAMPLE, reducing_gap=BALANCED_OVERSAMPLE)
+    _, box = drafted
+    return img.resize(new_size, FAST_FINISH_RESAMPLE, box=box)
+
+
+def render_downscaled_balanced(img_path: Path, max_w: int, max_h: int) -> Image.Image:
+    """Nivel balanced: decodificación reducida con margen y LANCZOS para terminar."""
+    img = Image.open(image_source(img_path))
+    w, h = img.size
+    scale = min(max_w / w, max_h / h, 1.0)
+    if scale >= 1.0:
+        return img
+    new_size: Tuple[int, int] = (int(w * scale), int(h * scale))
+    over = scale * BALANCED_OVERSAMPLE
+    drafted = img.draft(img.mode, (max(1, math.ceil(w * over)), max(1, math.ceil(h * over)))) if over < 1.0 else None
+    if drafted is None:
+        return img.resize(new_size, Image.LANCZOS, reducing_gap=BALANCED_OVERSAMPLE)
+    _, box = drafted
+    return img.resize(new_size, Image.LANCZOS, box=box)
+
+
+RENDERERS: Dict[str, Callable[[Path, int, int], Image.Image]] = {
+    "fast": render_downscaled_fast,
+    "balanced": render_downscaled_balanced,
+    "best": render_downscaled,
+}
+
+
+def _renderer(tier: Optional[str] = None) -> Callable[[Path, int, int], Image.Image]:
+    return RENDERERS[_check_tier(tier or QUALITY_TIER)]
+
+
+def downscale_for_display(
+    img_path: Path, max_w: int = DOWNSCALE_MAX_W, max_h: int = DOWNSCALE_MAX_H, tier: Optional[str] = None
+) -> Image.Image:
+    """Reduce el bitmap para que el navegador no tenga que escalar imágenes enormes, manteniendo aspecto.
+
+    El resultado se guarda en la caché de derivados: solo la primera petición decodifica y redimensiona.
+    Cada nivel de calidad tiene su propia entrada (`tier`; por defecto el del despliegue).
+    """
+    render = _renderer(tier)
+    return get_cache().get_or_build(
+        img_path, (max_w, max_h), lambda p: render(p, max_w, max_h), variant=render.__name__
+    )
+
+
+def encode_for_display(img: Image.Image, encoder: Optional[Encoder] = None) -> bytes:
+    """Codifica con `encoder` (por defecto el del despliegue); en JPEG, PNG si hay transparencia."""
+    encoder = encoder or DISPLAY_ENCODER
+    buf = io.BytesIO()
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    if encoder.format == "webp":
+        img = img if img.mode in ("RGB", "RGBA") else img.convert("RGBA" if has_alpha else "RGB")
+        img.save(buf, format="WEBP", quality=encoder.quality, method=4)
+    elif has_alpha:
+        img.save(buf, format="PNG")
+    else:
+        img = img if img.mode in ("RGB", "L") else img.convert("RGB")
+        options = {"subsampling": CHROMA_SUBSAMPLING[encoder.subsampling]} if encoder.subsampling else {}
+        img.save(buf, format="JPEG", quality=encoder.quality, **options)
+    return buf.getvalue()
+
+
+def display_bytes(
+    img_path: Path, max_w: int = DOWNSCALE_MAX_W, max_h: int = DOWNSCALE_MAX_H, tier: Optional[str] = None,
+    encoder: Optional[Encoder] = None,
+) -> bytes:
+    """Bytes codificados para el navegador, compartidos por todas las sesiones.
+
+    Se guardan en la caché de disco junto al derivado (un reinicio no vuelve a codificar) y en la de
+    memoria. La clave identifica el contenido del original, el nivel de calidad y el codificador: una
+    imagen editada se vuelve a generar y las copias idénticas comparten una sola entrada.
+    """
+    encoder = encoder or DISPLAY_ENCODER
+    key = DerivativeCache.make_key(img_path, (max_w, max_h), f"{_renderer(tier).__name__}|{encoder.tag}")
+
+    def build() -> bytes:
+        disk = get_cache()
+        data = disk.get_bytes(key)
+        if data is None:
+            data = encode_for_display(downscale_for_display(img_path, max_w, max_h, tier), encoder)
+            disk.put_bytes(key, data)
+        return data
+
+    return get_memory_cache().get_or_build(("display", key), build, owner=engine_for_path(img_path))
@@ -0,0 +1,101 @@
+"""Descripciones en Markdown -> HTML saneado, listo para insertar en la página.
+
+Cubre lo que usan elementos.json y steps.json: párrafos, saltos de línea, listas con "-", "*" o
+"+" y numeradas, encabezados "#", **negrita**, *cursiva*, `código` y enlaces http(s). El texto se
+escapa antes de reconocer nada, así que el resultado solo contiene las etiquetas que genera este
+módulo (sin atributos salvo el href comprobado de los enlaces): el HTML que venga en el JSON se
+muestra como texto. La salida va en una sola línea: st.markdown no la vuelve a interpretar como
+Markdown (un bloque HTML termina en la primera línea en blanco).
+
+render_description() no guarda nada: el HTML vive con el modelo (cached_property description_html
+en models.py), y llega ya convertido en la instantánea y en la base SQLite (catalog_db.py). Las dos
+guardan RENDER_FINGERPRINT y dejan de usarse si no coincide: cualquier cambio en este fichero (reglas,
+etiquetas permitidas) obliga a volver a convertir.
+"""
+import hashlib
+import html
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+_BULLET = re.compile(r"^\s{0,3}[-*+]\s+(.*)$")
+_ORDERED = re.compile(r"^\s{0,3}\d{1,9}[.)]\s+(.*)$")
+_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_CODE = re.compile(r"`([^`]+)`")
+_STRONG = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*")
+_EM = re.compile(r"(?<![*\w])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?![*\w])")
+_LINK = re.compile(r"\[([^\]]+)\]\((https?://[^\s)]+)\)")
+HEADING_OFFSET = 3  # "# Título" -> <h4>: las descripciones van debajo del título de la ficha
+RENDER_FINGERPRINT = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()  # huella del conversor
+
+
+def _inline(text: str) -> str:
+    """Formato dentro de una línea; el texto se escapa primero y los códigos no se formatean."""
+    parts = _CODE.split(text)  # posiciones impares: contenido de `código`
+    out = []
+    for i, part in enumerate(parts):
+        part = html.escape(part, quote=True)
+        if i % 2:
+            out.append(f"<code>{part}</code>")
+            continue
+        part = _LINK.sub(lambda m: f'<a href="{m.group(2)}" target="_blank" rel="noopener noreferrer">{m.group(1)}</a>', part)
+        part = _STRONG.sub(r"<strong>\1</strong>", part)
+        out.append(_EM.sub(r"<em>\1</em>", part))
+    return "".join(out)
+
+
+def markdown_to_html(text: str) -> str:
+    """Convierte el subconjunto de Markdown de las descripciones a HTML de una sola línea."""
+    out: List[str] = []
+    paragraph: List[str] = []
+    items: List[str] = []
+    list_tag: Optional[str] = None
+
+    def close_paragraph() -> None:
+        if paragraph:
+            out.append(f"<p>{'<br>'.join(_inline(line) for line in paragraph)}</p>")
+            paragraph.clear()
+
+    def close_list() -> None:
+        nonlocal list_tag
+        if list_tag:
+            out.append(f"<{list_tag}>{''.join(f'<li>{_inline(item)}</li>' for item in items)}</{list_tag}>")
+            items.clear()
+            list_tag = None
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if not line.strip():
+            close_paragraph()
+            close_list()
+            continue
+        heading = _HEADING.match(line)
+        item: Optional[Tuple[str, str]] = None
+        for tag, pattern in (("ul", _BULLET), ("ol", _ORDERED)):
+            m = pattern.match(line)
+            if m:
+                item = (tag, m.group(1))
+                break
+        if heading:
+            close_paragraph()
+            close_list()
+            level = min(6, len(heading.group(1)) + HEADING_OFFSET)
+            out.append(f"<h{level}>{_inline(heading.group(2))}</h{level}>")
+        elif item:
+            close_paragraph()
+            if list_tag != item[0]:
+                close_list()
+                list_tag = item[0]
+            items.append(item[1])
+        elif list_tag and line[:1].isspace():
+            items[-1] += " " + line.strip()  # continuación sangrada del elemento anterior
+        else:
+            close_list()
+            paragraph.append(line.strip())
+    close_paragraph()
+    close_list()
+    return "".join(out)
+
+
+def render_description(text: str) -> str:
+    """HTML saneado de una descripción ("" si no hay)."""
+    return markdown_to_html(text) if text else ""
@@ -0,0 +1,133 @@
+"""Caché en memoria compartida por todas las sesiones del proceso, limitada por bytes.
+
+Guarda lo que ya está listo para enviar al navegador (bytes codificados, data URLs), con
+desalojo LRU y construcción única por clave: si 60 sesiones piden a la vez la misma imagen,
+una la decodifica y las demás esperan su resultado. Cada entrada puede llevar un propietario (el id
+del motor de la imagen, engines.py) para repartir la ocupación con usage_by_owner().
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# ===================== Parámetros (ajustables) =====================
+MEMORY_CACHE_MAX_BYTES = 128 * 1024 * 1024  # presupuesto total del proceso
+
+
+def sizeof(value: Any) -> int:
+    """Bytes que ocupa un valor cacheado (exacto para bytes/str, aproximado para el resto)."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return sys.getsizeof(value)
+
+
+class ByteBudgetLRU:
+    """LRU segura entre hilos cuyo límite es la suma de tamaños, no el número de entradas."""
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, Optional[str]]]" = OrderedDict()
+        self._building: Dict[Hashable, threading.Event] = {}
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None, owner: Optional[str] = None) -> None:
+        nbytes = sizeof(value) if nbytes is None else nbytes
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return  # nunca cabría: no se vacía la caché entera por un solo valor
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._total -= old[1]
+            self._data[key] = (value, nbytes, owner)
+            self._total += nbytes
+            while self._total > self.max_bytes:
+                _, (_, size, _) = self._data.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any], owner: Optional[str] = None) -> Any:
+        """Devuelve el valor cacheado o lo construye una sola vez aunque lo pidan varios hilos.
+
+        `owner` se apunta en la entrada que se crea; si la clave ya existe conserva el de quien la creó
+        (las copias idénticas entre motores comparten entrada).
+        """
+        while True:
+            with self._lock:
+                item = self._data.get(key)
+                if item is not None:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[0]
+                waiter = self._building.get(key)
+                if waiter is None:
+                    self.misses += 1
+                    self._building[key] = threading.Event()
+                    break
+            waiter.wait()  # otro hilo lo está construyendo; al terminar se reintenta la lectura
+            with self._lock:
+                if key not in self._data and key not in self._building:
+                    # el constructor falló o el valor no cabía: se construye aquí sin esperar más
+                    self.misses += 1
+                    self._building[key] = threading.Event()
+                    break
+        try:
+            value = build()
+            self.put(key, value, owner=owner)
+            return value
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._total = 0
+
+    def usage_by_owner(self) -> Dict[str, Tuple[int, int]]:
+        """propietario -> (entradas, bytes), sin las entradas que no tienen propietario."""
+        usage: Dict[str, Tuple[int, int]] = {}
+        with self._lock:
+            for _, nbytes, owner in self._data.values():
+                if owner is not None:
+                    entries, total = usage.get(owner, (0, 0))
+                    usage[owner] = (entries + 1, total + nbytes)
+        return usage
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache: Optional[ByteBudgetLRU] = None
+_cache_lock = threading.Lock()
+
+
+def get_memory_cache() -> ByteBudgetLRU:
+    """Instancia única por proceso (Streamlit ejecuta todas las sesiones en el mismo proceso)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ByteBudgetLRU()
+        return _cache
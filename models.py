@@ -0,0 +1,233 @@
+"""Modelos de datos de elementos.json y steps.json (Pydantic v2, inmutables).
+
+Cada fichero se valida entero al cargarlo, en una sola pasada de pydantic-core sobre el texto
+(model_validate_json), y los errores salen juntos en ese momento con la ruta de cada campo
+(describe_errors). El resto del código recibe objetos congelados y hashables, con listas como
+tuplas: se pueden guardar en st.cache_resource y compartir entre sesiones sin copiarlos.
+
+Instantánea compilada (`python models.py`, también al final de build_assets.py): los dos modelos
+ya validados, con los mapas derivados calculados (by_id, orden de pasos por dependencias) y las
+descripciones ya convertidas a HTML (description_html), en
+.cache/modelo.pkl con pickle protocolo 5. La cabecera lleva la versión del formato, una huella del
+esquema de los modelos, otra del conversor a HTML (markdown_html.RENDER_FINGERPRINT) y el sha256 de
+cada JSON; load_catalog()/load_procedure() la usan solo si todo coincide y, si no, leen el JSON como siempre. Es una caché local que genera este mismo
+proyecto: no se debe cargar una instantánea de origen desconocido (pickle ejecuta código).
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import time
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, ValidationError, model_validator
+
+from markdown_html import RENDER_FINGERPRINT, render_description
+from paths import BASE_DIR, ELEMENTS_JSON, STEPS_JSON
+
+# ===================== Parámetros (ajustables) =====================
+SNAPSHOT_PATH = BASE_DIR / ".cache" / "modelo.pkl"
+SNAPSHOT_MAGIC = "motor-modelo"
+SNAPSHOT_VERSION = 2  # subirlo si cambia lo que se guarda (no hace falta por cambios de los modelos)
+
+
+class _Frozen(BaseModel):
+    # extra="forbid": una clave mal escrita ("imagenes", "depends") es un error y no un campo vacío
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+
+class Element(_Frozen):
+    id: str
+    name: Optional[str] = None
+    description: str = ""
+    images: Tuple[str, ...] = ()     # nombres dentro de images/, por orden de preferencia
+    cad_model: Tuple[str, ...] = ()  # ficheros de CAD/ asociados
+
+    @cached_property
+    def description_html(self) -> str:
+        """La descripción (Markdown) como HTML saneado de una línea (markdown_html.py)."""
+        return render_description(self.description)
+
+
+class Step(_Frozen):
+    id: str
+    title: Optional[str] = None
+    description: str = ""
+    elements: Tuple[str, ...] = ()    # ids de Element que intervienen en el paso
+    depends_on: Tuple[str, ...] = ()  # ids de Step que deben ir antes
+    images: Tuple[str, ...] = ()      # nombres dentro de 'imagenes montaje/'
+
+    @cached_property
+    def description_html(self) -> str:
+        return render_description(self.description)
+
+
+class Catalog(_Frozen):
+    """elementos.json."""
+
+    version: str = ""
+    updated_at: str = ""
+    elements: Tuple[Element, ...] = ()
+
+    @model_validator(mode="after")
+    def _unique_ids(self) -> "Catalog":
+        _check_unique("elemento", (el.id for el in self.elements))
+        return self
+
+    @cached_property
+    def by_id(self) -> Dict[str, Element]:
+        return {el.id: el for el in self.elements}
+
+
+class Procedure(_Frozen):
+    """steps.json."""
+
+    version: str = ""
+    updated_at: str = ""
+    steps: Tuple[Step, ...] = ()
+
+    @model_validator(mode="after")
+    def _valid_references(self) -> "Procedure":
+        _check_unique("paso", (s.id for s in self.steps))
+        ids = {s.id for s in self.steps}
+        unknown = [f"{s.id} -> {d}" for s in self.steps for d in s.depends_on if d not in ids]
+        if unknown:
+            raise ValueError(f"depends_on con pasos inexistentes: {', '.join(unknown)}")
+        return self
+
+    @cached_property
+    def by_id(self) -> Dict[str, Step]:
+        return {s.id: s for s in self.steps}
+
+    @cached_property
+    def ordered(self) -> Tuple[Step, ...]:
+        """Pasos en orden de dependencias (Kahn); a igualdad, en el orden de steps.json.
+
+        Los que no se pueden ordenar (ciclos o dependencias de sí mismos) van al final.
+        """
+        indeg = {s.id: len(s.depends_on) for s in self.steps}
+        dependents: Dict[str, List[str]] = {s.id: [] for s in self.steps}
+        for s in self.steps:
+            for d in dict.fromkeys(s.depends_on):
+                if d != s.id:
+                    dependents[d].append(s.id)
+        queue = [sid for sid, n in indeg.items() if n == 0]
+        for sid in queue:  # la lista crece mientras se recorre
+            for t in dependents[sid]:
+                indeg[t] -= 1
+                if indeg[t] == 0:
+                    queue.append(t)
+        placed = set(queue)
+        queue += [s.id for s in self.steps if s.id not in placed]
+        return tuple(self.by_id[sid] for sid in queue)
+
+
+def _check_unique(kind: str, ids) -> None:
+    seen, repeated = set(), []
+    for i in ids:
+        if i in seen:
+            repeated.append(i)
+        seen.add(i)
+    if repeated:
+        raise ValueError(f"id de {kind} repetido: {', '.join(sorted(set(repeated)))}")
+
+
+def load_catalog(path: Path = ELEMENTS_JSON) -> Catalog:
+    """De la instantánea si está al día; si no, del JSON (ValidationError con todos sus problemas)."""
+    snapshot = load_snapshot() if path == ELEMENTS_JSON else None
+    return snapshot.catalog if snapshot is not None else Catalog.model_validate_json(path.read_bytes())
+
+
+def load_procedure(path: Path = STEPS_JSON) -> Procedure:
+    snapshot = load_snapshot() if path == STEPS_JSON else None
+    return snapshot.procedure if snapshot is not None else Procedure.model_validate_json(path.read_bytes())
+
+
+# ===================== Instantánea compilada =====================
+class Snapshot(NamedTuple):
+    catalog: Catalog
+    procedure: Procedure
+
+
+def _schema_fingerprint(models: Tuple[Type[BaseModel], ...] = (Element, Step, Catalog, Procedure)) -> str:
+    """Huella de los campos de los modelos: una instantánea de otra versión del código no se usa."""
+    spec = [
+        (m.__name__, name, repr(f.annotation), repr(f.default))
+        for m in models
+        for name, f in m.model_fields.items()
+    ]
+    return hashlib.sha256(repr(spec).encode("utf-8")).hexdigest()
+
+
+def _source_hashes() -> Dict[str, str]:
+    return {p.name: hashlib.sha256(p.read_bytes()).hexdigest() for p in (ELEMENTS_JSON, STEPS_JSON)}
+
+
+def _header() -> Dict:
+    return {
+        "magic": SNAPSHOT_MAGIC,
+        "version": SNAPSHOT_VERSION,
+        "schema": _schema_fingerprint(),
+        "render": RENDER_FINGERPRINT,  # description_html va dentro: otro conversor, otra instantánea
+        "sources": _source_hashes(),
+    }
+
+
+def compile_snapshot(out: Path = SNAPSHOT_PATH) -> Snapshot:
+    """Valida los dos JSON, calcula los mapas derivados y guarda la instantánea de forma atómica."""
+    header = _header()  # antes de leer los JSON: si cambian mientras tanto, la cabecera no casará
+    snapshot = Snapshot(
+        Catalog.model_validate_json(ELEMENTS_JSON.read_bytes()),
+        Procedure.model_validate_json(STEPS_JSON.read_bytes()),
+    )
+    snapshot.catalog.by_id  # cached_property: se guardan ya calculados dentro de la instantánea
+    snapshot.procedure.by_id
+    snapshot.procedure.ordered
+    for item in snapshot.catalog.elements + snapshot.procedure.steps:
+        item.description_html  # las vistas insertan el HTML tal cual, sin convertir nada al ejecutarse
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(header, f, protocol=5)  # cabecera aparte: se comprueba sin cargar el resto
+        pickle.dump(snapshot, f, protocol=5)
+    os.replace(tmp, out)
+    return snapshot
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[Snapshot]:
+    """La instantánea si existe y corresponde a este código y a los JSON actuales; si no, None."""
+    try:
+        with open(path, "rb") as f:
+            if pickle.load(f) != _header():
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None  # ausente, a medias o de una versión del código que ya no existe
+
+
+def describe_errors(e: ValidationError, path: Path) -> str:
+    """Mensaje legible con un error por línea: 'elements.3.images: Input should be a valid array'."""
+    lines = [f"{'.'.join(str(part) for part in err['loc']) or '(raíz)'}: {err['msg']}" for err in e.errors()]
+    return f"{path.name} no es válido ({len(lines)} error(es)):\n" + "\n".join(f"- {line}" for line in lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compila elementos.json y steps.json en una instantánea binaria.")
+    ap.add_argument("--out", type=Path, default=SNAPSHOT_PATH)
+    args = ap.parse_args()
+    try:
+        snapshot = compile_snapshot(args.out)
+    except ValidationError as e:
+        raise SystemExit(describe_errors(e, STEPS_JSON if e.title == "Procedure" else ELEMENTS_JSON))
+    t0 = time.perf_counter()
+    load_snapshot(args.out)
+    print(f"{len(snapshot.catalog.elements)} elementos, {len(snapshot.procedure.steps)} pasos -> {args.out} "
+          f"({args.out.stat().st_size / 2**10:.0f} KB, carga en {(time.perf_counter() - t0) * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    import models  # pickle guarda las clases por módulo: "models.Catalog", no "__main__.Catalog"
+
+    models.main()
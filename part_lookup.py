@@ -0,0 +1,241 @@
+"""Búsqueda de piezas por foto: de una imagen subida (o de la cámara) a los elementos más parecidos.
+
+Uso (índice offline, en paralelo con un proceso por núcleo):
+    python part_lookup.py build [--jobs N]
+    python part_lookup.py query foto.jpg [--top 5]
+
+Cada foto de pieza se resume en un descriptor compacto de DESCRIPTOR_DIM números, calculado solo
+con la CPU: un histograma de color HSV (qué colores tiene la pieza) y un histograma de gradientes
+orientados por celdas, al estilo HOG (qué forma tiene). Los descriptores se guardan en
+.cache/part_features.npz por hash de contenido, así que reconstruir solo procesa fotos nuevas o
+modificadas; qué foto es de qué elemento se decide al cargar, con elementos.json tal como esté.
+
+Una consulta es una decodificación reducida y un producto matriz-vector contra todas las fotos
+del catálogo (similitud del coseno); cada elemento puntúa con la mejor de sus fotos. elementos.py
+lo usa en la vista "Buscar por foto", solo con los descriptores ya guardados: en una petición no se
+calcula ninguno, y las fotos sin descriptor quedan fuera hasta volver a ejecutar `build`.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from asset_index import get_asset_index
+from bundle import image_source
+from models import load_catalog
+from paths import BASE_DIR, ELEMENTS_IMG_DIR, ELEMENTS_JSON, all_existing
+
+# ===================== Parámetros (ajustables) =====================
+FEATURES_PATH = BASE_DIR / ".cache" / "part_features.npz"
+DECODE_SIZE = 256        # px: lado aproximado al que se decodifica la foto (draft de JPEG)
+HOG_SIZE = 64            # px del lado de la versión en grises sobre la que se calculan gradientes
+HOG_CELL = 8             # px por celda: 8x8 celdas
+HOG_BINS = 9             # orientaciones sin signo (0-180°)
+HSV_BINS = (8, 3, 3)     # tono, saturación, valor
+COLOR_WEIGHT = 0.5       # peso del color frente a la forma en la similitud final
+TOP_K = 5
+FEATURES_VERSION = 1
+
+DESCRIPTOR_DIM = int(np.prod(HSV_BINS)) + (HOG_SIZE // HOG_CELL) ** 2 * HOG_BINS
+
+
+# ===================== Descriptores =====================
+def _unit(v: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(v)
+    return v / n if n > 0 else v
+
+
+def color_histogram(img: Image.Image) -> np.ndarray:
+    """Histograma HSV normalizado; con raíz cuadrada el coseno equivale a la distancia de Hellinger."""
+    hsv = np.asarray(img.convert("HSV"), dtype=np.int32)
+    idx = [hsv[..., c] * bins // 256 for c, bins in enumerate(HSV_BINS)]
+    flat = (idx[0] * HSV_BINS[1] + idx[1]) * HSV_BINS[2] + idx[2]
+    hist = np.bincount(flat.ravel(), minlength=int(np.prod(HSV_BINS))).astype(np.float64)
+    return _unit(np.sqrt(hist / hist.sum()))
+
+
+def gradient_histogram(img: Image.Image) -> np.ndarray:
+    """HOG simplificado: por celda, histograma de orientaciones ponderado por la magnitud del gradiente."""
+    g = np.asarray(img.convert("L").resize((HOG_SIZE, HOG_SIZE), Image.BILINEAR), dtype=np.float64)
+    gx = np.zeros_like(g)
+    gy = np.zeros_like(g)
+    gx[:, 1:-1] = g[:, 2:] - g[:, :-2]
+    gy[1:-1, :] = g[2:, :] - g[:-2, :]
+    mag = np.hypot(gx, gy)
+    bins = (np.degrees(np.arctan2(gy, gx)) % 180.0 * HOG_BINS / 180.0).astype(np.int64) % HOG_BINS
+    cells = HOG_SIZE // HOG_CELL
+    cell_idx = (np.arange(HOG_SIZE) // HOG_CELL)
+    flat = (cell_idx[:, None] * cells + cell_idx[None, :]) * HOG_BINS + bins
+    hist = np.bincount(flat.ravel(), weights=mag.ravel(), minlength=cells * cells * HOG_BINS)
+    return _unit(np.sqrt(hist))
+
+
+def describe(img: Image.Image) -> np.ndarray:
+    """Descriptor de una foto ya cargada (unitario: el producto escalar es la similitud ponderada)."""
+    img = img.convert("RGB")
+    return np.concatenate([
+        np.sqrt(COLOR_WEIGHT) * color_histogram(img),
+        np.sqrt(1.0 - COLOR_WEIGHT) * gradient_histogram(img),
+    ]).astype(np.float32)
+
+
+def describe_file(source: Union[Path, BinaryIO]) -> np.ndarray:
+    with Image.open(source) as im:
+        im.draft("RGB", (DECODE_SIZE, DECODE_SIZE))  # en JPEG, decodificación ya reducida por libjpeg
+        img = ImageOps.exif_transpose(im)
+        img.thumbnail((DECODE_SIZE, DECODE_SIZE), Image.BILINEAR)
+        return describe(img)
+
+
+def _describe_path(path: str) -> Optional[np.ndarray]:
+    """Se ejecuta en un proceso del pool."""
+    try:
+        return describe_file(image_source(Path(path)))
+    except OSError:
+        return None
+
+
+# ===================== Índice =====================
+def _load_features(path: Path = FEATURES_PATH) -> Dict[str, np.ndarray]:
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != FEATURES_VERSION or data["vectors"].shape[1:] != (DESCRIPTOR_DIM,):
+                return {}
+            return dict(zip(data["shas"].tolist(), data["vectors"]))
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        return {}
+
+
+def _save_features(features: Dict[str, np.ndarray], path: Path = FEATURES_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shas = sorted(features)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp.npz")
+    np.savez(
+        tmp, version=FEATURES_VERSION, shas=np.array(shas),
+        vectors=np.stack([features[s] for s in shas]) if shas else np.zeros((0, DESCRIPTOR_DIM), np.float32),
+    )
+    os.replace(tmp, path)
+
+
+def _element_photos() -> List[Tuple[str, Path]]:
+    """(id de elemento, foto) para todas las fotos existentes de cada elemento."""
+    return [(el.id, p) for el in load_catalog().elements for p in all_existing(ELEMENTS_IMG_DIR, el.images)]
+
+
+def update_features(jobs: int = 1) -> Tuple[Dict[str, np.ndarray], int]:
+    """Descriptores de todas las fotos de elementos; calcula (en paralelo si jobs > 1) los que faltan.
+
+    Devuelve los descriptores por hash de contenido y cuántos se han calculado ahora.
+    """
+    index = get_asset_index()
+    features = _load_features()
+    missing: Dict[str, Path] = {}
+    for _, p in _element_photos():
+        info = index.by_path(p)
+        if info is not None and info.sha256 not in features:
+            missing.setdefault(info.sha256, p)
+    if missing:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                vectors = list(pool.map(_describe_path, [str(p) for p in missing.values()], chunksize=4))
+        else:
+            vectors = [_describe_path(str(p)) for p in missing.values()]
+        features.update((sha, v) for sha, v in zip(missing, vectors) if v is not None)
+        _save_features(features)
+    return features, len(missing)
+
+
+class PartMatch(NamedTuple):
+    element_id: str
+    score: float  # similitud del coseno de la mejor foto del elemento (1.0 = idéntica)
+    path: Path    # esa foto
+
+
+class PartIndex:
+    """Matriz de descriptores de las fotos de elementos, con el id de elemento de cada fila."""
+
+    def __init__(self, photos: List[Tuple[str, Path]], features: Dict[str, np.ndarray]):
+        index = get_asset_index()
+        rows = [(eid, p, index.by_path(p)) for eid, p in photos]
+        rows = [(eid, p, info.sha256) for eid, p, info in rows if info is not None and info.sha256 in features]
+        self.missing = len(photos) - len(rows)  # fotos sin descriptor: fuera de las búsquedas
+        self.element_ids = [eid for eid, _, _ in rows]
+        self.paths = [p for _, p, _ in rows]
+        self.matrix = (
+            np.stack([features[sha] for _, _, sha in rows]) if rows else np.zeros((0, DESCRIPTOR_DIM), np.float32)
+        )
+
+    def query(self, vector: np.ndarray, k: int = TOP_K) -> List[PartMatch]:
+        """Los k elementos más parecidos, cada uno con la puntuación de su mejor foto."""
+        scores = self.matrix @ vector
+        best: Dict[str, PartMatch] = {}
+        for row in np.argsort(-scores):
+            eid = self.element_ids[row]
+            if eid not in best:
+                best[eid] = PartMatch(eid, float(scores[row]), self.paths[row])
+                if len(best) == k:
+                    break
+        return list(best.values())
+
+    def lookup(self, source: Union[Path, BinaryIO], k: int = TOP_K) -> List[PartMatch]:
+        """Elementos más parecidos a una foto (ruta o fichero abierto, p. ej. lo que devuelve st.camera_input)."""
+        return self.query(describe_file(source), k)
+
+
+_part_index: Optional[PartIndex] = None
+_part_index_key: Optional[Tuple] = None
+_part_index_lock = threading.Lock()
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_part_index() -> PartIndex:
+    """Índice del proceso con los descriptores que `python part_lookup.py build` dejó en disco (no
+    calcula ninguno: PartIndex.missing cuenta los que faltan). Se rehace si cambian las imágenes,
+    elementos.json o el fichero de descriptores.
+    """
+    global _part_index, _part_index_key
+    with _part_index_lock:
+        key = (get_asset_index().built_at, _mtime(ELEMENTS_JSON), _mtime(FEATURES_PATH))
+        if _part_index is None or _part_index_key != key:
+            _part_index = PartIndex(_element_photos(), _load_features())
+            _part_index_key = key
+        return _part_index
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="calcular los descriptores que falten")
+    b.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="procesos en paralelo")
+    q = sub.add_parser("query", help="elementos más parecidos a una foto")
+    q.add_argument("photo", type=Path)
+    q.add_argument("--top", type=int, default=TOP_K)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    features, computed = update_features(args.jobs if args.cmd == "build" else 1)
+    index = PartIndex(_element_photos(), features)
+    print(f"{len(index.paths)} fotos de {len(set(index.element_ids))} elementos ({computed} descriptores nuevos) "
+          f"en {time.perf_counter() - t0:.2f} s -> {FEATURES_PATH}")
+    if args.cmd == "query":
+        t0 = time.perf_counter()
+        matches = index.lookup(args.photo, args.top)
+        print(f"consulta en {(time.perf_counter() - t0) * 1000.0:.1f} ms")
+        for m in matches:
+            print(f"  {m.score:.3f}  {m.element_id:40} {m.path.relative_to(BASE_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
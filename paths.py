@@ -0,0 +1,50 @@
+"""Rutas del proyecto y resolución de nombres de imagen, compartidas por las apps y los scripts."""
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+# ===================== Rutas =====================
+def steps_img_dir(root: Path) -> Path:
+    """Carpeta de fotos de montaje de un motor ('imagenes montaje/' o, si solo existe esa, 'imagenes_montaje/')."""
+    path = root / "imagenes montaje"
+    if not path.exists():
+        alt = root / "imagenes_montaje"
+        if alt.exists():
+            return alt
+    return path
+
+
+BASE_DIR = Path(__file__).parent  # raíz del proyecto
+ELEMENTS_JSON = BASE_DIR / "elementos.json"
+STEPS_JSON = BASE_DIR / "steps.json"
+ELEMENTS_IMG_DIR = BASE_DIR / "images"
+STEPS_IMG_DIR = steps_img_dir(BASE_DIR)
+
+
+# ===================== Búsqueda de imágenes =====================
+# Las carpetas de imágenes se resuelven contra el paquete (bundle.py, si MOTOR_BUNDLE está definido)
+# o contra el índice precalculado (asset_index), sin tocar el sistema de ficheros; cualquier otra
+# carpeta se sigue sondeando con Path.exists().
+def _exists_fn(dir_path: Path) -> Callable[[str], bool]:
+    from asset_index import get_asset_index  # import diferido: asset_index depende de este módulo
+    from bundle import get_bundle
+
+    bundle = get_bundle()
+    if bundle is not None and bundle.covers(dir_path):
+        return lambda name: bundle.has(dir_path / name)
+    index = get_asset_index()
+    if index.covers(dir_path):
+        return lambda name: index.lookup(dir_path, name) is not None
+    return lambda name: (dir_path / name).exists()
+
+
+def first_existing(dir_path: Path, names: Sequence[str]) -> Optional[Path]:
+    exists = _exists_fn(dir_path)
+    for name in names or []:
+        if exists(name):
+            return dir_path / name
+    return None  # primera imagen válida
+
+
+def all_existing(dir_path: Path, names: Sequence[str]) -> List[Path]:
+    exists = _exists_fn(dir_path)
+    return [dir_path / n for n in (names or []) if exists(n)]  # lista de imágenes existentes
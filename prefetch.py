@@ -0,0 +1,114 @@
+"""Precarga en segundo plano de imágenes que el usuario verá previsiblemente a continuación.
+
+Un único pool de hilos por proceso calienta las cachés de derivados (disco y memoria) mientras
+el usuario lee el paso actual. Cada sesión indica qué quiere precargado; lo que deja de
+interesarle (porque ha saltado a otro sitio) se cancela si aún no ha empezado y ninguna otra
+sesión lo ha pedido también (cada trabajo lleva el conjunto de sesiones que lo esperan).
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from assets import pick_variant
+from imaging import display_bytes
+
+# ===================== Parámetros (ajustables) =====================
+PREFETCH_WORKERS = 2       # hilos decodificando a la vez en todo el proceso
+PREFETCH_MAX_PENDING = 16  # trabajos en vuelo (en cola + en curso) como máximo
+
+Job = Tuple[Path, int, int, str]  # (imagen, ancho máx., alto máx., nivel de calidad)
+
+
+def warm(job: Job) -> None:
+    """Deja listo el derivado que usará image_for_display() para esta imagen, caja y nivel."""
+    path, max_w, max_h, tier = job
+    if pick_variant(path, max_w, max_h) is not None:
+        return  # ya hay variante precalculada: no hay nada que decodificar
+    display_bytes(path, max_w, max_h, tier)  # deja el resultado en la caché de disco y en la de memoria
+
+
+class Prefetcher:
+    """Cola compartida de precargas con límite de concurrencia y cancelación por trabajo y sesión."""
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_pending: int = PREFETCH_MAX_PENDING):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.RLock()  # los callbacks de fin pueden ejecutarse dentro de submit/cancel
+        self._inflight: Dict[Job, Future] = {}
+        self._owners: Dict[Job, Set[Hashable]] = {}  # trabajo -> sesiones que lo han pedido
+        self.max_pending = max_pending
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def submit(self, jobs: Iterable[Job], owner: Hashable = None) -> List[Job]:
+        """Encola para `owner` los trabajos (por orden de prioridad); los que ya estén en vuelo se
+        comparten. Devuelve los aceptados."""
+        accepted: List[Job] = []
+        with self._lock:
+            for job in jobs:
+                if job not in self._inflight:
+                    if len(self._inflight) >= self.max_pending:
+                        break  # el resto se pedirá en la próxima ejecución del script
+                    fut = self._pool.submit(warm, job)
+                    self._inflight[job] = fut
+                    self._owners[job] = set()
+                    fut.add_done_callback(lambda f, j=job: self._done(j, f))
+                if job in self._owners:  # el callback de fin puede haberlo retirado ya
+                    self._owners[job].add(owner)
+                accepted.append(job)
+        return accepted
+
+    def cancel(self, jobs: Iterable[Job], owner: Hashable = None) -> None:
+        """Retira a `owner` de los trabajos; los que ya nadie espera se cancelan si no han empezado
+        (los que están en curso terminan)."""
+        with self._lock:
+            for job in jobs:
+                owners = self._owners.get(job)
+                if owners is None:
+                    continue
+                owners.discard(owner)
+                if not owners:
+                    self._inflight[job].cancel()  # el callback de fin lo retira de _inflight
+
+    def _done(self, job: Job, fut: Future) -> None:
+        with self._lock:
+            self._inflight.pop(job, None)
+            self._owners.pop(job, None)
+            if fut.cancelled():
+                self.cancelled += 1
+            elif fut.exception() is not None:
+                self.failed += 1  # imagen ilegible: ya lo avisará la vista cuando toque mostrarla
+            else:
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._inflight),
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+            }
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Instancia única por proceso, compartida por todas las sesiones."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
+
+
+def reschedule(previous: Iterable[Job], wanted: List[Job], owner: Hashable) -> List[Job]:
+    """Sustituye la precarga anterior de la sesión `owner` por la nueva: retira lo que ya no quiere
+    (se cancela solo si ninguna otra sesión lo espera)."""
+    keep = set(wanted)
+    pf = get_prefetcher()
+    pf.cancel((job for job in previous if job not in keep), owner)
+    return pf.submit(wanted, owner)
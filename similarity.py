@@ -0,0 +1,315 @@
+"""Índice de similitud visual entre todas las fotos del catálogo y del montaje.
+
+Uso:
+    python similarity.py [--check] [--bench] [--radius 10]
+    python similarity.py --similar "images/colector_admision_mesa.jpeg"
+
+Calcula para cada imagen de images/ e 'imagenes montaje/' tres hashes perceptuales de 64 bits
+(aHash, dHash y pHash) y los guarda en .cache/similarity.json, por hash de contenido: solo se
+calculan los de las fotos nuevas o modificadas y las copias idénticas se calculan una vez. Las
+búsquedas por radio de Hamming usan un BK-tree por tipo de hash, que descarta ramas enteras con la
+desigualdad triangular y responde en microsegundos con miles de fotos (--bench lo mide).
+
+--check cruza el índice con elementos.json y steps.json y avisa de enlaces sospechosos: fotos de
+un paso casi iguales a la de una pieza que el paso no incluye, piezas distintas con fotos casi
+iguales y fotos del catálogo que no usa ninguna pieza pero repiten, con otro nombre, una foto
+del montaje. La ficha de elementos.py muestra además las fotos más parecidas a la de cada pieza,
+solo con los hashes ya guardados (get_similarity_index() no decodifica fotos): las que falten
+quedan fuera de la búsqueda hasta volver a ejecutar este script.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from asset_index import AssetInfo, get_asset_index
+from bundle import image_source
+from models import Step, load_catalog, load_procedure
+from paths import BASE_DIR, ELEMENTS_IMG_DIR, STEPS_IMG_DIR, all_existing
+
+# ===================== Parámetros (ajustables) =====================
+HASHES_PATH = BASE_DIR / ".cache" / "similarity.json"
+HASH_KINDS = ("ahash", "dhash", "phash")
+DEFAULT_KIND = "phash"  # el más robusto frente a recompresión, cambios de brillo y reencuadres leves
+SIMILAR_RADIUS = 10     # bits de 64: hasta aquí dos fotos se consideran "parecidas"
+MISLINK_RADIUS = 4      # bits: por debajo son la misma foto (recortada, reescalada o recomprimida)
+PHASH_SIZE = 32         # px del lado de la imagen sobre la que se hace la DCT (se usan 8x8 coeficientes)
+HASHES_VERSION = 1
+
+
+# ===================== Hashes perceptuales =====================
+def _gray(img: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    return np.asarray(img.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def _bits(mask: np.ndarray) -> int:
+    return int("".join("1" if b else "0" for b in mask.ravel()), 2)
+
+
+def ahash(img: Image.Image) -> int:
+    """Media: cada bit dice si ese píxel de la versión 8x8 es más claro que la media."""
+    px = _gray(img, (8, 8))
+    return _bits(px > px.mean())
+
+
+def dhash(img: Image.Image) -> int:
+    """Diferencia: cada bit dice si el brillo crece hacia la derecha en la versión 9x8."""
+    px = _gray(img, (9, 8))
+    return _bits(px[:, 1:] > px[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def phash(img: Image.Image) -> int:
+    """DCT: cada bit dice si una de las 8x8 frecuencias más bajas supera la mediana (sin la continua)."""
+    px = _gray(img, (PHASH_SIZE, PHASH_SIZE))
+    low = (_DCT @ px @ _DCT.T)[:8, :8]
+    return _bits(low > np.median(low.ravel()[1:]))
+
+
+def image_hashes(path: Path) -> Dict[str, int]:
+    """Los tres hashes de una foto, tal como se ve (con la orientación EXIF aplicada)."""
+    with Image.open(image_source(path)) as im:
+        im.draft("RGB", (PHASH_SIZE * 2, PHASH_SIZE * 2))  # en JPEG basta con decodificar a 1/8
+        img = ImageOps.exif_transpose(im)
+    return {"ahash": ahash(img), "dhash": dhash(img), "phash": phash(img)}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# ===================== BK-tree =====================
+class BKTree:
+    """Árbol de Burkhard-Keller sobre hashes con distancia de Hamming.
+
+    Cada hijo cuelga de su padre por la distancia entre ambos; al buscar con radio r desde una
+    distancia d solo hay que bajar por los hijos con distancia en [d - r, d + r].
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, [claves], {distancia: nodo}]
+        self.size = 0
+
+    def add(self, value: int, key: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [key], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(key)  # mismo hash: se agrupa en el nodo
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [key], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """(distancia, clave) de todo lo que está a `radius` bits o menos, de más a menos parecido."""
+        found: List[Tuple[int, str]] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                found.extend((d, key) for key in node[1])
+            stack.extend(child for dist, child in node[2].items() if d - radius <= dist <= d + radius)
+        return sorted(found)
+
+
+# ===================== Índice =====================
+class Match(NamedTuple):
+    distance: int
+    path: Path
+
+
+def _load_hashes(path: Path = HASHES_PATH) -> Dict[str, Dict[str, int]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != HASHES_VERSION:
+        return {}
+    return {sha: {kind: int(h, 16) for kind, h in hs.items()} for sha, hs in data["hashes"].items()}
+
+
+def _save_hashes(hashes: Dict[str, Dict[str, int]], path: Path = HASHES_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "version": HASHES_VERSION,
+        "hashes": {sha: {kind: f"{h:016x}" for kind, h in hs.items()} for sha, hs in hashes.items()},
+    }
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class SimilarityIndex:
+    """Hashes de todas las fotos indexadas y un BK-tree por tipo de hash."""
+
+    def __init__(self, assets: Iterable[AssetInfo], hashes: Dict[str, Dict[str, int]]):
+        assets = list(assets)
+        self.hashes = hashes
+        self.sha_by_path: Dict[str, str] = {a.path: a.sha256 for a in assets if a.sha256 in hashes}
+        self.missing = len(assets) - len(self.sha_by_path)  # fotos sin hash: fuera de las búsquedas
+        self.trees = {kind: BKTree() for kind in HASH_KINDS}
+        for p, sha in self.sha_by_path.items():
+            for kind, tree in self.trees.items():
+                tree.add(hashes[sha][kind], p)
+
+    def hash_of(self, path: Path, kind: str = DEFAULT_KIND) -> Optional[int]:
+        sha = self.sha_by_path.get(str(path))
+        return self.hashes[sha][kind] if sha is not None else None
+
+    def similar(
+        self, path: Path, radius: int = SIMILAR_RADIUS, kind: str = DEFAULT_KIND, limit: Optional[int] = None
+    ) -> List[Match]:
+        """Otras fotos a `radius` bits o menos de `path`, de más a menos parecida."""
+        value = self.hash_of(path, kind)
+        if value is None:
+            return []
+        found = [Match(d, Path(p)) for d, p in self.trees[kind].search(value, radius) if p != str(path)]
+        return found[:limit] if limit is not None else found
+
+
+def build_similarity_index(save: bool = True) -> SimilarityIndex:
+    """Índice sobre las imágenes del índice de assets; calcula solo los hashes que faltan."""
+    assets = list(get_asset_index().assets())
+    hashes = _load_hashes()
+    missing = {a.sha256: a for a in assets if a.sha256 not in hashes}
+    for sha, a in missing.items():
+        try:
+            hashes[sha] = image_hashes(Path(a.path))
+        except OSError:
+            continue  # ilegible: queda fuera de las búsquedas
+    if missing and save:
+        _save_hashes(hashes)
+    return SimilarityIndex(assets, hashes)
+
+
+_similarity: Optional[SimilarityIndex] = None
+_similarity_key: Optional[Tuple] = None
+_similarity_lock = threading.Lock()
+
+
+def _hashes_signature() -> Optional[Tuple[int, int]]:
+    try:
+        st_ = os.stat(HASHES_PATH)
+    except FileNotFoundError:
+        return None
+    return st_.st_mtime_ns, st_.st_size
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """Índice vigente del proceso, solo con los hashes guardados en HASHES_PATH: en una petición no se
+    decodifica ninguna foto. Se rehace si cambia el índice de imágenes o el fichero de hashes."""
+    global _similarity, _similarity_key
+    with _similarity_lock:
+        assets = get_asset_index()
+        key = (assets.built_at, _hashes_signature())
+        if _similarity is None or _similarity_key != key:
+            _similarity = SimilarityIndex(assets.assets(), _load_hashes())
+            _similarity_key = key
+        return _similarity
+
+
+# ===================== Enlaces sospechosos =====================
+def _owners() -> Tuple[Dict[str, List[str]], List[Tuple[Step, List[Path]]]]:
+    """Foto de pieza -> ids de elementos que la usan, y cada paso con sus fotos."""
+    element_photos: Dict[str, List[str]] = {}
+    for el in load_catalog().elements:
+        for p in all_existing(ELEMENTS_IMG_DIR, el.images):
+            element_photos.setdefault(str(p), []).append(el.id)
+    return element_photos, [(step, all_existing(STEPS_IMG_DIR, step.images)) for step in load_procedure().steps]
+
+
+def find_mislinks(index: SimilarityIndex, radius: int = MISLINK_RADIUS) -> List[str]:
+    """Avisos legibles sobre fotos enlazadas a la pieza o al paso que probablemente no es."""
+    element_photos, steps = _owners()
+    warnings: List[str] = []
+    for step, photos in steps:
+        listed = set(step.elements)
+        for p in photos:
+            for m in index.similar(p, radius):
+                others = [eid for eid in element_photos.get(str(m.path), []) if eid not in listed]
+                if others:
+                    warnings.append(
+                        f"paso {step.id}: {p.relative_to(BASE_DIR)} es casi igual (d={m.distance}) a "
+                        f"{m.path.relative_to(BASE_DIR)}, foto de {', '.join(others)}, que el paso no incluye"
+                    )
+    seen = set()
+    for p, owners in element_photos.items():
+        for m in index.similar(Path(p), radius):
+            others = [eid for eid in element_photos.get(str(m.path), []) if eid not in owners]
+            pair = tuple(sorted((p, str(m.path))))
+            if others and pair not in seen:
+                seen.add(pair)
+                warnings.append(
+                    f"elementos {', '.join(owners)} y {', '.join(others)}: fotos casi iguales (d={m.distance}) "
+                    f"{Path(p).relative_to(BASE_DIR)} / {m.path.relative_to(BASE_DIR)}"
+                )
+    unused = [a for a in index.sha_by_path if a not in element_photos and Path(a).parent == ELEMENTS_IMG_DIR]
+    for p in sorted(unused):
+        for m in index.similar(Path(p), radius, limit=1):
+            # la copia con el mismo nombre en la carpeta de montaje es la convención del proyecto
+            if m.path.parent == STEPS_IMG_DIR and m.path.name != Path(p).name:
+                warnings.append(
+                    f"{Path(p).relative_to(BASE_DIR)} no la usa ningún elemento y es casi igual (d={m.distance}) "
+                    f"a la foto de montaje {m.path.relative_to(BASE_DIR)}"
+                )
+    return warnings
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--check", action="store_true", help="avisar de fotos probablemente mal enlazadas en los JSON")
+    ap.add_argument("--bench", action="store_true", help="medir el tiempo por búsqueda sobre todas las fotos")
+    ap.add_argument("--similar", type=Path, help="foto (relativa a la raíz) de la que listar las parecidas")
+    ap.add_argument("--radius", type=int, default=SIMILAR_RADIUS)
+    ap.add_argument("--kind", choices=HASH_KINDS, default=DEFAULT_KIND)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    index = build_similarity_index()
+    print(f"{len(index.sha_by_path)} fotos con hash ({len(index.hashes)} contenidos distintos) "
+          f"en {time.perf_counter() - t0:.2f} s -> {HASHES_PATH}")
+
+    if args.similar is not None:
+        for m in index.similar(BASE_DIR / args.similar, args.radius, args.kind):
+            print(f"  d={m.distance:2d}  {m.path.relative_to(BASE_DIR)}")
+    if args.bench:
+        paths = [Path(p) for p in index.sha_by_path]
+        for kind in HASH_KINDS:
+            t0 = time.perf_counter()
+            hits = sum(len(index.similar(p, args.radius, kind)) for p in paths)
+            ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(paths))
+            print(f"  {kind}: {ms:.3f} ms/búsqueda (radio {args.radius}, {hits / max(1, len(paths)):.1f} resultados de media)")
+    if args.check:
+        warnings = find_mislinks(index)
+        for w in warnings:
+            print(f"  {w}")
+        print(f"{len(warnings)} avisos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Hoja de sprites con las miniaturas de todo el catálogo de elementos.
+
+La vista de catálogo de elementos.py muestra una rejilla con todas las piezas. En lugar de una
+imagen por pieza (35 peticiones y 35 decodificaciones), las miniaturas se empaquetan en una sola
+imagen y cada celda muestra su trozo con background-position según el mapa de coordenadas.
+
+La hoja se guarda en static/derivados/sprites/ con el hash de su firma en el nombre: la firma
+resume el catálogo (ids y orden) y la identidad del contenido de cada imagen, así que solo se
+regenera si cambia elementos.json o alguna foto; en cualquier otro caso se lee la ya construida.
+build_assets.py la genera también y la registra en el manifiesto para que no se borre al podar.
+Cada motor (engines.py) tiene su hoja: "catalogo" la del principal, "catalogo-<id>" las demás.
+"""
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from PIL import Image, features
+
+from asset_index import content_id
+from assets import ASSETS_DIR
+from engines import Engine, get_engine
+from imaging import downscale_for_display
+from memory_cache import get_memory_cache
+from models import Element
+from paths import BASE_DIR, first_existing
+
+# ===================== Parámetros (ajustables) =====================
+SPRITE_CELL_W = 160   # px de cada miniatura (se ajusta dentro de la celda sin deformar)
+SPRITE_CELL_H = 120   # px
+SPRITE_COLUMNS = 8    # ancho de la hoja en celdas (la rejilla de la página tiene sus propias columnas)
+SPRITE_FORMAT = "webp" if features.check("webp") else "jpeg"
+SPRITE_QUALITY = 82
+SPRITES_DIR = ASSETS_DIR / "sprites"
+SPRITE_BACKGROUND = (245, 245, 245)
+SPRITE_GUTTER = 2     # px entre miniaturas: la compresión con pérdidas no mezcla bordes de vecinas
+
+
+def _thumb_sources(elements: Sequence[Element], img_dir: Path) -> Dict[str, Optional[Path]]:
+    """id -> primera imagen existente del elemento (la misma que muestra la ficha)."""
+    return {el.id: first_existing(img_dir, el.images) for el in elements}
+
+
+def sprite_signature(name: str, sources: Dict[str, Optional[Path]]) -> str:
+    """Hash de lo que determina la hoja: catálogo, contenido de cada foto y parámetros de empaquetado."""
+    h = hashlib.sha256()
+    h.update(f"{name}|{SPRITE_CELL_W}x{SPRITE_CELL_H}|{SPRITE_COLUMNS}|{SPRITE_GUTTER}|{SPRITE_FORMAT}|{SPRITE_QUALITY}".encode())
+    for key, src in sources.items():
+        h.update(f"\n{key}|{content_id(src) if src is not None else '-'}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _pack(name: str, sig: str, sources: Dict[str, Optional[Path]]) -> Dict:
+    """Empaqueta las miniaturas por estantes (filas de SPRITE_CELL_H px) y guarda hoja + mapa."""
+    row_w = SPRITE_COLUMNS * SPRITE_CELL_W
+    placed = []
+    x = y = 0
+    for key, src in sources.items():
+        if src is None:
+            continue
+        try:
+            # mismo derivado reducido (y en caché de disco) que usaría la ficha a este tamaño
+            thumb = downscale_for_display(src, SPRITE_CELL_W, SPRITE_CELL_H)
+        except OSError:
+            continue  # foto ilegible: la celda queda vacía y la rejilla muestra solo el nombre
+        if thumb.mode not in ("RGB", "L"):
+            thumb = thumb.convert("RGB")
+        if thumb.size[0] > SPRITE_CELL_W or thumb.size[1] > SPRITE_CELL_H:  # originales pequeños no se amplían
+            thumb = thumb.copy()
+            thumb.thumbnail((SPRITE_CELL_W, SPRITE_CELL_H), Image.LANCZOS)
+        if x + thumb.size[0] > row_w:  # las fotos verticales ocupan menos: caben más por fila
+            x, y = 0, y + SPRITE_CELL_H + SPRITE_GUTTER
+        placed.append((key, thumb, x, y))
+        x += thumb.size[0] + SPRITE_GUTTER
+
+    width = max((px + t.size[0] for _, t, px, _ in placed), default=1)
+    sheet = Image.new("RGB", (width, y + SPRITE_CELL_H), SPRITE_BACKGROUND)
+    items: Dict[str, List[int]] = {}
+    for key, thumb, px, py in placed:
+        sheet.paste(thumb, (px, py))
+        items[key] = [px, py, thumb.size[0], thumb.size[1]]
+
+    buf = io.BytesIO()
+    sheet.save(buf, format=SPRITE_FORMAT.upper(), quality=SPRITE_QUALITY)
+    data = buf.getvalue()
+    out = SPRITES_DIR / f"{name}.{sig[:12]}.{SPRITE_FORMAT}"
+    meta = {
+        "name": name,
+        "signature": sig,
+        "format": SPRITE_FORMAT,
+        "width": sheet.size[0],
+        "height": sheet.size[1],
+        "path": out.relative_to(BASE_DIR).as_posix(),
+        "bytes": len(data),
+        "items": items,
+    }
+    SPRITES_DIR.mkdir(parents=True, exist_ok=True)
+    for target, payload in ((out, data), (out.with_suffix(".json"), json.dumps(meta).encode("utf-8"))):
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, target)
+    return meta
+
+
+def catalog_sprite(elements: Sequence[Element], engine: Optional[Engine] = None) -> Dict:
+    """Metadatos de la hoja vigente del catálogo de un motor (ruta, tamaño y coordenadas por id de
+    elemento); por defecto, del motor principal.
+
+    Se resuelve en memoria por firma; si la hoja de esa firma ya está en disco se reutiliza y si no
+    se construye una sola vez aunque la pidan varias sesiones a la vez.
+    """
+    engine = engine or get_engine()
+    name = "catalogo" if engine.is_default else f"catalogo-{engine.id}"
+    sources = _thumb_sources(elements, engine.elements_img_dir)
+    sig = sprite_signature(name, sources)
+
+    def load_or_build() -> Dict:
+        map_path = SPRITES_DIR / f"{name}.{sig[:12]}.json"
+        try:
+            with open(map_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("signature") == sig and (BASE_DIR / meta["path"]).exists():
+                return meta
+        except (FileNotFoundError, ValueError):
+            pass
+        return _pack(name, sig, sources)
+
+    return get_memory_cache().get_or_build(("sprite", name, sig), load_or_build, owner=engine.id)
+
+
+def sprite_files(meta: Dict) -> List[Path]:
+    """Ficheros de una hoja (imagen y mapa), para que build_assets.py no los pode."""
+    sheet = BASE_DIR / meta["path"]
+    return [sheet, sheet.with_suffix(".json")]
@@ -0,0 +1,127 @@
+"""Servidor HTTP mínimo para los derivados de static/derivados/ con caché de larga duración.
+
+Streamlit sirve /app/static/ sin cabecera Cache-Control (el navegador revalida cada vez); este
+servidor marca como inmutables durante un año los ficheros cuyo nombre lleva hash de contenido.
+También sirve, bajo /teselas/, las teselas Deep Zoom de tiles.py (static/teselas/), que genera al
+pedirlas por primera vez, y, con MOTOR_BUNDLE, los derivados directamente desde el paquete
+(bundle.py) sin tocar el disco.
+
+Uso independiente:
+    python static_server.py [--port 8502]
+o desde la app con MOTOR_IMAGE_SERVING=server (se arranca en un hilo la primera vez) y
+MOTOR_STATIC_BASE_URL=<URL con la que el navegador de los alumnos llega a este servidor>.
+"""
+import argparse
+import os
+import re
+import socket
+import threading
+from functools import partial
+from typing import Dict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import tiles
+from assets import ASSETS_DIR
+from bundle import get_bundle
+
+STATIC_PORT = int(os.environ.get("MOTOR_STATIC_PORT", "8502"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[a-z0-9]+$")  # <nombre>-<ancho>.<hash>.<ext>
+TILE_URL = re.compile(r"^/teselas/([0-9a-f]{16})(?:\.dzi|_files/(\d+)/(\d+)_(\d+)\.jpg)$")
+
+
+class CachingHandler(SimpleHTTPRequestHandler):
+    """Archivos estáticos de solo lectura: inmutables si el nombre lleva hash, revalidados si no."""
+
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, ".dzi": "application/xml"}
+
+    def translate_path(self, path: str) -> str:
+        m = TILE_URL.match(path.split("?", 1)[0])
+        if m is None:
+            return super().translate_path(path)
+        tid, level, col, row = m.groups()
+        if level is None:
+            found = tiles.ensure_descriptor(tid)
+        else:
+            found = tiles.ensure_tile(tid, int(level), int(col), int(row))
+        return str(found) if found is not None else os.path.join(tiles.TILES_DIR, "no-existe")
+
+    def send_head(self):
+        bundle = get_bundle()
+        path = self.path.split("?", 1)[0]
+        if bundle is None or TILE_URL.match(path):
+            return super().send_head()
+        target = self.translate_path(self.path)
+        if not bundle.has(target):
+            return super().send_head()  # fuera del paquete: del disco como siempre
+        data = bundle.read(target)
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(target))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return bundle.open(target)
+
+    def end_headers(self) -> None:
+        path = self.path.split("?", 1)[0]
+        immutable = HASHED_NAME.search(path) or TILE_URL.match(path)  # el id de la pirámide es un hash
+        self.send_header("Cache-Control", IMMUTABLE if immutable else "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        super().end_headers()
+
+    def list_directory(self, path):  # no se publica el listado de la carpeta
+        self.send_error(404)
+        return None
+
+    def log_message(self, format, *args) -> None:  # silencioso: lo sirve a cada clic de cada alumno
+        pass
+
+
+def make_server(port: int = STATIC_PORT, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    handler = partial(CachingHandler, directory=str(ASSETS_DIR))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+_running: Dict[int, bool] = {}  # puerto -> si respondía al arrancar
+_server_lock = threading.Lock()
+
+
+def ensure_running(port: int = STATIC_PORT) -> bool:
+    """Arranca el servidor en un hilo demonio una sola vez por proceso; True si el puerto responde.
+
+    Si el puerto ya está ocupado se asume que otro proceso (p. ej. `python static_server.py`)
+    está sirviendo la misma carpeta. La conexión de prueba se hace solo la primera vez: assets.py
+    pregunta por cada URL de cada variante y el resultado se reutiliza durante todo el proceso.
+    """
+    with _server_lock:
+        if port not in _running:
+            try:
+                server = make_server(port)
+            except OSError:
+                pass  # puerto ocupado: ya lo sirve otro proceso
+            else:
+                threading.Thread(target=server.serve_forever, name="static-server", daemon=True).start()
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    _running[port] = True
+            except OSError:
+                _running[port] = False
+        return _running[port]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Sirve static/derivados/ y las teselas Deep Zoom con caché inmutable.")
+    ap.add_argument("--port", type=int, default=STATIC_PORT)
+    ap.add_argument("--host", default="0.0.0.0")
+    args = ap.parse_args()
+    server = make_server(args.port, args.host)
+    print(f"Sirviendo {ASSETS_DIR} en http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Panel lateral con el estado de las cachés compartidas por todas las sesiones del proceso."""
+from typing import Dict, Optional
+
+import streamlit as st
+
+from derivative_cache import get_cache
+from engines import discover_engines, engine_memory
+from memory_cache import get_memory_cache
+
+
+def _hit_rate(s: Dict[str, int]) -> str:
+    total = s["hits"] + s["misses"]
+    return f"{100.0 * s['hits'] / total:.0f} %" if total else "—"
+
+
+def show_cache_stats(extra: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+    """Aciertos, ocupación y desalojos de las cachés de memoria y disco (y contadores adicionales)."""
+    mem = get_memory_cache().stats()
+    disk = get_cache().stats()
+    with st.sidebar.expander("Cachés de imagen", expanded=False):
+        st.markdown(
+            f"**Memoria** · {mem['bytes'] / 2**20:.1f} / {mem['max_bytes'] / 2**20:.0f} MB · "
+            f"{mem['entries']} entradas  \n"
+            f"aciertos {mem['hits']} · fallos {mem['misses']} ({_hit_rate(mem)}) · desalojos {mem['evictions']}"
+        )
+        st.markdown(
+            f"**Disco** · {disk['bytes'] / 2**20:.1f} / {disk['max_bytes'] / 2**20:.0f} MB · "
+            f"{disk['entries']} derivados  \n"
+            f"aciertos {disk['hits']} · fallos {disk['misses']} ({_hit_rate(disk)}) · desalojos {disk['evictions']}"
+        )
+        engines = discover_engines()
+        for eid, usage in engine_memory().items():  # solo los motores que alguna sesión ha abierto
+            name = engines[eid].name if eid in engines else eid
+            st.markdown(
+                f"**{name}** · modelos {usage['modelos'] / 2**10:.0f} KB · "
+                f"caché {usage.get('caché', 0) / 2**20:.1f} MB ({usage.get('entradas', 0)} entradas)"
+            )
+        for title, values in (extra or {}).items():
+            st.markdown(f"**{title}** · " + " · ".join(f"{k} {v}" for k, v in values.items()))
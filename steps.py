@@ -1,9 +1,21 @@
-import json
+import uuid
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Sequence, Set
 
 import streamlit as st
-from PIL import Image
+from pydantic import ValidationError
+
+from assets import PageBudget, image_for_display, image_serving_problem, session_quality_tier, show_image
+from catalog_db import CatalogDB, StepSequence, catalog_db_problem, get_catalog_db
+from engines import Engine, get_engine, load_engine_catalog, load_engine_procedure, select_engine
+from file_watcher import watch_file
+from imaging import DOWNSCALE_MAX_H, DOWNSCALE_MAX_W
+from models import Element, Procedure, Step, describe_errors
+from paths import all_existing, first_existing
+from prefetch import Job, get_prefetcher, reschedule
+from stats_panel import show_cache_stats
+from tiles import deep_zoom_viewer
 
 # ===================== Página =====================
 st.set_page_config(page_title="Guía de desmontaje", layout="wide")  # layout ancho [web:1]
@@ -18,6 +30,7 @@ st.markdown("""
 .center-title { text-align: left; margin: 0.2rem 0 0.3rem 0; }
 .center-text  { text-align: left; }
 .desc-text    { text-align: left; margin: 0.2rem 0 0.6rem 0; font-size: 0.95rem; opacity: 0.9; }
+.desc-text p, .desc-text ul, .desc-text ol { margin: 0 0 0.4rem 0; }  /* HTML de la descripción (markdown_html.py) */
 
 /* Fila de navegación: dos botones juntos y centrados (sin columnas 50/50) */
 .nav-row { display: flex; justify-content: flex-start; align-items: center; gap: 0.6rem; margin: 0.2rem 0 0.35rem 0; }
@@ -35,110 +48,144 @@ st.markdown("""
   display: block;
   margin: 0 auto;
 }
+div.lqip { max-height: clamp(220px, 46vh, 900px); }  /* show_image (assets.py): miniatura de fondo e imagen encima */
 
 /* Móvil */
 @media (max-width: 768px) {
   .main .block-container { padding-top: 0.4rem; }
-  .img-inner img { max-height: clamp(220px, 54vh, 900px); }
+  .img-inner img, div.lqip { max-height: clamp(220px, 54vh, 900px); }
 }
 </style>
 """, unsafe_allow_html=True)  # centrado de botones e imágenes [web:21]
 
-# ===================== Rutas =====================
-BASE_DIR = Path(__file__).parent
-STEPS_JSON = BASE_DIR / "steps.json"
-ELEMENTS_JSON = BASE_DIR / "elementos.json"
-STEPS_IMG_DIR = BASE_DIR / "imagenes montaje"
-if not STEPS_IMG_DIR.exists():
-    alt = BASE_DIR / "imagenes_montaje"
-    if alt.exists():
-        STEPS_IMG_DIR = alt
-ELEMENTS_IMG_DIR = BASE_DIR / "images"
+# ===================== Precarga =====================
+PREFETCH_RADIUS = 1  # pasos vecinos (±N) cuyas imágenes se preparan en segundo plano; 2 para ±2
+
+# ===================== Galería =====================
+GALLERY_THUMB_W = 240  # px: las miniaturas salen de la variante de 480 px o del derivado reducido en caché
+GALLERY_THUMB_H = 160  # px
+GALLERY_COLUMNS = 5    # miniaturas por fila
 
 # ===================== Utilidades =====================
-@st.cache_data
-def load_steps() -> List[dict]:
-    with open(STEPS_JSON, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data.get("steps", [])  # contiene lista elements por paso para saber cuántas piezas hay [file:34]
-
-@st.cache_data
-def load_elements_catalog() -> Dict[str, dict]:
-    with open(ELEMENTS_JSON, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return {el.get("id"): el for el in data.get("elements", []) if el.get("id")}  # catálogo por id [web:15]
-
-def downscale_for_display(img_path: Path, max_w: int = 1200, max_h: int = 800) -> Image.Image:
-    img = Image.open(img_path)
-    w, h = img.size
-    scale = min(max_w / w, max_h / h, 1.0)
-    if scale < 1.0:
-        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
-    return img  # reducción para rendimiento manteniendo nitidez [web:21]
-
-def first_existing(dir_path: Path, names: List[str]) -> Optional[Path]:
-    for name in names or []:
-        p = dir_path / name
-        if p.exists():
-            return p
-    return None  # primera imagen válida [web:21]
-
-def all_existing(dir_path: Path, names: List[str]) -> List[Path]:
-    return [dir_path / n for n in (names or []) if (dir_path / n).exists()]  # lista de imágenes existentes [web:21]
-
-def topo_sort_steps(steps: List[dict]) -> List[dict]:
-    id_to_step: Dict[str, dict] = {s.get("id"): s for s in steps if s.get("id")}
-    indeg: Dict[str, int] = {sid: 0 for sid in id_to_step.keys()}
-    for s in steps:
-        sid = s.get("id"); deps = s.get("depends_on", []) or []
-        for d in deps:
-            if d in indeg:
-                indeg[sid] += 1
-    queue = [sid for sid, d in indeg.items() if d == 0]
-    seen, ordered = set(queue), []
-    i = 0
-    while i < len(queue):
-        sid = queue[i]; i += 1; ordered.append(sid)
-        for t in steps:
-            tid = t.get("id")
-            if tid and tid != sid:
-                deps = t.get("depends_on", []) or []
-                if sid in deps and tid in indeg:
-                    indeg[tid] -= 1
-                    if indeg[tid] == 0 and tid not in seen:
-                        queue.append(tid); seen.add(tid)
-    for s in steps:
-        sid = s.get("id")
-        if sid and sid not in ordered:
-            ordered.append(sid)
-    return [id_to_step[sid] for sid in ordered if sid in id_to_step]  # orden por dependencias estable [web:1]
-
-def step_images_paths(step: dict) -> List[Path]:
-    return all_existing(STEPS_IMG_DIR, step.get("images", []))  # imágenes del paso [web:21]
-
-def element_info_and_image(element_id: str):
-    cat = load_elements_catalog()
-    el = cat.get(element_id, {})
-    name = el.get("name", element_id or "Desconocido")
-    desc = el.get("description", "")
-    img_path = first_existing(ELEMENTS_IMG_DIR, el.get("images", []))
+# Modelos inmutables (models.py): st.cache_resource los comparte entre sesiones sin copiarlos; con la
+# instantánea compilada (python models.py) llegan ya validados y con el orden de dependencias hecho.
+# Con MOTOR_CATALOG_DB (catalog_db.py) no se cargan: cada paso y cada pieza es una consulta puntual.
+# Una entrada por motor (engines.py): solo se cargan los motores que alguna sesión ha elegido
+@st.cache_resource
+def load_procedure_model(engine_id: str) -> Procedure:
+    return load_engine_procedure(get_engine(engine_id))
+
+def catalog_db(engine: Engine) -> Optional[CatalogDB]:
+    return get_catalog_db() if engine.is_default else None  # la base SQLite es del motor principal
+
+def load_steps(engine: Engine) -> Sequence[Step]:
+    db = catalog_db(engine)
+    if db is not None:
+        return StepSequence(db, "position")
+    return load_procedure_model(engine.id).steps  # contiene lista elements por paso para saber cuántas piezas hay [file:34]
+
+@st.cache_resource
+def load_elements_catalog(engine_id: str) -> Dict[str, Element]:
+    return load_engine_catalog(get_engine(engine_id)).by_id  # catálogo por id [web:15]
+
+def load_ordered_steps(engine: Engine) -> Sequence[Step]:
+    db = catalog_db(engine)
+    if db is not None:
+        return StepSequence(db, "seq")  # orden calculado al importar
+    return load_procedure_model(engine.id).ordered  # orden por dependencias estable (Procedure.ordered)
+
+def find_element(engine: Engine, element_id: str) -> Optional[Element]:
+    db = catalog_db(engine)
+    return db.element(element_id) if db is not None else load_elements_catalog(engine.id).get(element_id)
+
+def step_images_paths(engine: Engine, step: Step) -> List[Path]:
+    return all_existing(engine.steps_img_dir, step.images)  # imágenes del paso [web:21]
+
+def element_info_and_image(engine: Engine, element_id: str):
+    el = find_element(engine, element_id)
+    if el is None:
+        return element_id or "Desconocido", "", None  # id que no está en elementos.json
+    name = el.name or element_id
+    desc = el.description_html  # ya convertida a HTML (en la instantánea, sin trabajo por ejecución)
+    img_path = first_existing(engine.elements_img_dir, el.images)
     return name, desc, img_path  # datos e imagen de pieza del catálogo [web:15]
 
+def neighbour_prefetch_jobs(
+    engine: Engine, ordered_steps: Sequence[Step], sidx: int, tier: str, radius: int = PREFETCH_RADIUS
+) -> List[Job]:
+    """Imágenes de los pasos sidx±1..±radius, de más a menos probable (primero el siguiente), al nivel
+    de calidad de la sesión."""
+    jobs: List[Job] = []
+    n = len(ordered_steps)
+    for d in range(1, radius + 1):
+        for off in (d, -d):
+            step = ordered_steps[(sidx + off) % n]
+            s_paths = step_images_paths(engine, step)
+            paths = s_paths[:1]  # al entrar en un paso la galería muestra en grande su primera imagen
+            paths += [p for p in (element_info_and_image(engine, eid)[2] for eid in step.elements) if p]
+            step_jobs = [(p, DOWNSCALE_MAX_W, DOWNSCALE_MAX_H, tier) for p in paths]
+            if len(s_paths) > 1:  # y el resto solo como miniaturas
+                step_jobs += [(p, GALLERY_THUMB_W, GALLERY_THUMB_H, tier) for p in s_paths]
+            for job in step_jobs:
+                if job not in jobs:
+                    jobs.append(job)
+    return jobs
+
+def select_gallery_image(key: str, i: int) -> None:
+    st.session_state[key] = i  # callback: se aplica antes de re-ejecutar, así la imagen grande ya sale con la nueva
+
+def show_gallery_strip(paths: List[Path], active: int, key: str, tier: str, budget: PageBudget) -> None:
+    """Miniaturas de todas las imágenes del paso; pulsar una la convierte en la imagen grande."""
+    for start in range(0, len(paths), GALLERY_COLUMNS):
+        cols = st.columns(GALLERY_COLUMNS)
+        for i, (col, p) in enumerate(zip(cols, paths[start:start + GALLERY_COLUMNS]), start):
+            with col:
+                try:
+                    st.image(image_for_display(p, GALLERY_THUMB_W, GALLERY_THUMB_H, tier, budget), width="stretch")
+                except Exception:
+                    st.caption(p.name)  # miniatura ilegible: el botón sigue permitiendo intentar verla en grande
+                st.button(
+                    f"Imagen {i + 1}", key=f"{key}_{i}", type="primary" if i == active else "secondary",
+                    on_click=select_gallery_image, args=(key, i), width="stretch",
+                )
+
+def watch_engine(engine: Engine) -> None:
+    """Invalidación selectiva: al editar un JSON solo se vacía la entrada de ese motor en su cargador."""
+    watch_file(engine.steps_json, f"steps.load_steps.{engine.id}", partial(load_procedure_model.clear, engine.id))
+    watch_file(
+        engine.elements_json, f"steps.load_elements_catalog.{engine.id}", partial(load_elements_catalog.clear, engine.id)
+    )
+
 # ===================== App =====================
 def main():
     # Título centrado
     st.markdown("<h1 class='center-title'>Guía de desmontaje</h1>", unsafe_allow_html=True)  # título centrado [web:1]
 
-    steps = load_steps()
+    engine = select_engine(reset_keys=("sidx",))  # el paso actual es de otro procedimiento
+    watch_engine(engine)
+    problem = catalog_db_problem() if engine.is_default else None
+    if problem:
+        st.sidebar.warning(problem)  # base desfasada o ausente: se siguen los JSON
+    serving = image_serving_problem()
+    if serving:
+        st.sidebar.warning(serving)  # modo "server" sin URL o sin servidor: las imágenes van por /app/static/
+    try:
+        steps = load_steps(engine)
+        if catalog_db(engine) is None:
+            load_elements_catalog(engine.id)
+    except ValidationError as e:  # se informa de todos los errores juntos, al cargar
+        st.error(describe_errors(e, engine.steps_json if e.title == "Procedure" else engine.elements_json))
+        return
     if not steps:
         st.error("No se encontraron pasos en steps.json.")
         return  # validación de datos [file:34]
 
-    ordered_steps = topo_sort_steps(steps)
+    ordered_steps = load_ordered_steps(engine)
 
     # Estado de navegación
     if "sidx" not in st.session_state:
         st.session_state.sidx = 0  # índice del paso actual [web:15]
+    st.session_state.sidx %= len(ordered_steps)  # por si steps.json ha cambiado y tiene menos pasos
 
     # Botones Anterior/Siguiente realmente centrados y juntos (sin columnas 50/50)
     st.markdown("<div class='nav-row'>", unsafe_allow_html=True)  # fila flex a la izquierda [web:38]
@@ -153,10 +200,21 @@ def main():
 
     # Paso actual
     step = ordered_steps[st.session_state.sidx]
-    step_id = step.get("id", "")
-    step_title = step.get("title", step_id or "Paso")
-    step_desc = step.get("description", "")
-    step_elements = step.get("elements", []) or []  # para contar piezas y decidir botones [file:34]
+    step_id = step.id
+    step_title = step.title or step_id or "Paso"
+    step_desc = step.description_html
+    step_elements = step.elements  # para contar piezas y decidir botones [file:34]
+
+    # Nivel de calidad del remuestreo para este dispositivo (o ?calidad=fast|balanced|best en la URL)
+    tier = session_quality_tier()
+
+    # Precarga de los pasos vecinos mientras se lee este; lo pedido para otra posición se cancela
+    # (salvo que otra sesión también lo espere)
+    st.session_state.prefetch_jobs = reschedule(
+        st.session_state.get("prefetch_jobs", []),
+        neighbour_prefetch_jobs(engine, ordered_steps, st.session_state.sidx, tier),
+        st.session_state.setdefault("prefetch_owner", uuid.uuid4().hex),
+    )
 
     # Reset del índice de pieza al cambiar de paso
     if "last_step_id" not in st.session_state or st.session_state.last_step_id != step_id:
@@ -168,16 +226,25 @@ def main():
     if step_desc:
         st.markdown(f"<div class='desc-text'>{step_desc}</div>", unsafe_allow_html=True)  # descripción centrada [web:1]
 
-    # Imagen del paso en contenedor centrado y ancho unificado
-    s_paths = step_images_paths(step)
+    # Bytes de imagen del paso: por orden de importancia (foto del paso, galería, pieza) y con tope
+    budget = PageBudget()
+
+    # Imagen del paso en contenedor centrado y ancho unificado; con varias fotos, galería debajo
+    s_paths = step_images_paths(engine, step)
     if s_paths:
+        gkey = f"gidx_{step_id}"
+        gidx = st.session_state.get(gkey, 0) % len(s_paths)
+        active = s_paths[gidx]  # solo esta se carga a tamaño completo
         try:
-            img = downscale_for_display(s_paths[0])
             st.markdown("<div class='img-wrap'><div class='img-inner'>", unsafe_allow_html=True)  # contenedor centrado [web:21]
-            st.image(img, width="stretch")  # ocupar ancho del contenedor común [web:21]
+            show_image(active, tier=tier, budget=budget, width="stretch")  # miniatura de carga al instante; luego la variante o los bytes reducidos
             st.markdown("</div></div>", unsafe_allow_html=True)  # cierre contenedor [web:21]
+            if st.toggle("Ver en detalle (zoom)", key=f"zoom_step_{step_id}"):
+                deep_zoom_viewer(active)  # resolución nativa por teselas, solo las visibles
         except Exception as e:
-            st.warning(f"No se pudo abrir la imagen del paso: {s_paths[0].name}. Error: {e}")  # manejo de error [web:21]
+            st.warning(f"No se pudo abrir la imagen del paso: {active.name}. Error: {e}")  # manejo de error [web:21]
+        if len(s_paths) > 1:
+            show_gallery_strip(s_paths, gidx, gkey, tier, budget)
     else:
         st.info("Este paso no tiene imagen disponible.")  # no hay imagen para el paso [file:34]
 
@@ -201,7 +268,7 @@ def main():
                 st.session_state[ekey] = (eidx + 1) % len(step_elements)  # [web:24]
                 eidx = st.session_state[ekey]  # actualizar índice local  # [web:29]
         current_eid = step_elements[eidx]
-        name, desc, e_img = element_info_and_image(current_eid)
+        name, desc, e_img = element_info_and_image(engine, current_eid)
 
         st.markdown(f"<div class='center-text'><strong>{name}</strong></div>", unsafe_allow_html=True)  # nombre centrado [web:1]
         if desc:
@@ -210,10 +277,11 @@ def main():
         # Imagen de pieza en contenedor centrado y ancho unificado
         if e_img is not None:
             try:
-                img_el = downscale_for_display(e_img)
                 st.markdown("<div class='img-wrap'><div class='img-inner'>", unsafe_allow_html=True)  # contenedor centrado [web:21]
-                st.image(img_el, width="stretch")  # ancho consistente para alinear con la imagen del paso [web:21]
+                show_image(e_img, tier=tier, budget=budget, width="stretch")  # ancho consistente para alinear con la imagen del paso [web:21]
                 st.markdown("</div></div>", unsafe_allow_html=True)  # cierre contenedor [web:21]
+                if st.toggle("Ver pieza en detalle (zoom)", key=f"zoom_piece_{step_id}_{current_eid}"):
+                    deep_zoom_viewer(e_img)
             except Exception as e:
                 st.warning(f"No se pudo abrir la imagen de la pieza: {e_img.name}. Error: {e}")  # manejo de error [web:21]
         else:
@@ -222,6 +290,8 @@ def main():
     else:
         st.info("Sin piezas asociadas en este paso.")  # no hay elementos para este paso [file:34]
 
+    show_cache_stats({"Precarga": get_prefetcher().stats(), "Transferencia del paso": budget.summary()})  # cachés, precarga y bytes enviados
+
 if __name__ == "__main__":
     main()  # ejecutar app [web:1]
 
@@ -0,0 +1,56 @@
+"""Pruebas del <picture> de assets.py: AVIF para quien lo entienda y siempre un WebP de reserva en el <img>."""
+import re
+from pathlib import Path
+
+import pytest
+
+import assets
+
+IMG = Path("images/pieza.jpg")
+
+
+def entry(formats=("webp", "avif"), widths=(480, 960, 1200)):
+    return {
+        "width": 1200, "height": 800, "placeholder": "data:image/jpeg;base64,",
+        "variants": [
+            {"format": f, "width": w, "height": w * 2 // 3, "path": f"static/derivados/images/pieza-{w}.{f}",
+             "bytes": w * 100}
+            for w in widths for f in formats
+        ],
+    }
+
+
+@pytest.fixture
+def manifest(monkeypatch):
+    def use(e):
+        monkeypatch.setattr(assets, "_fresh_entry", lambda src: e)
+    monkeypatch.setattr(assets, "variant_url", lambda v: "/app/static/derivados/images/" + Path(v["path"]).name)
+    return use
+
+
+def sources(out: str):
+    return re.findall(r'<source type="([^"]*)" srcset="([^"]*)"', out)
+
+
+def test_img_en_webp_y_source_avif_antes(manifest):
+    manifest(entry())
+    src = assets.variant_url(assets.pick_variant(IMG, 960, 960))
+    out = assets.picture_html(IMG, src, "100vw")
+    assert re.search(r'<img src="[^"]*pieza-960\.webp"', out)
+    assert [t for t, _ in sources(out)] == ["image/avif", "image/webp"]
+    assert out.index("<source") < out.index("<img")
+    avif = dict(sources(out))["image/avif"]
+    assert "pieza-480.avif 480w" in avif and "pieza-960.avif 960w" in avif
+    assert "1200" not in avif  # nunca más ancha que la elegida: el tope de la página sigue valiendo
+
+
+def test_sin_webp_el_img_usa_lo_que_haya(manifest):
+    manifest(entry(formats=("avif",)))
+    assert assets.pick_variant(IMG, 960, 960)["format"] == "avif"
+
+
+def test_en_linea_solo_img(manifest):
+    manifest(entry())
+    out = assets.picture_html(IMG, "data:image/webp;base64,AAAA", "100vw")
+    assert "<picture" not in out and "<source" not in out
+    assert out.startswith('<img src="data:image/webp;base64,AAAA"')
@@ -0,0 +1,78 @@
+"""Pruebas de markdown_html.py: lo que venga en los JSON nunca llega a la página como HTML activo, y el HTML
+guardado (instantánea y base SQLite) deja de usarse cuando cambia el conversor."""
+import re
+
+import catalog_db
+import models
+from catalog_db import CatalogDB
+from markdown_html import markdown_to_html, render_description
+from models import compile_snapshot, load_catalog, load_procedure, load_snapshot
+
+
+def hrefs(out: str):
+    return re.findall(r'href="([^"]*)"', out)
+
+
+def test_html_crudo_se_muestra_como_texto():
+    out = markdown_to_html('<script>alert(1)</script> <img src=x onerror="alert(2)">')
+    assert "<script" not in out and "<img" not in out
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in out
+    assert "onerror=&quot;alert(2)&quot;" in out
+
+
+def test_html_crudo_dentro_de_codigo_y_encabezados():
+    assert "<code>&lt;b&gt;</code>" in markdown_to_html("`<b>`")
+    assert markdown_to_html("# <i>Junta</i>") == "<h4>&lt;i&gt;Junta&lt;/i&gt;</h4>"
+
+
+def test_solo_enlaces_http_y_https():
+    for url in ("javascript:alert(1)", "JavaScript:alert(1)", "data:text/html,<b>x</b>", "vbscript:msgbox(1)"):
+        out = markdown_to_html(f"[pulsa]({url})")
+        assert "<a " not in out, url
+    assert hrefs(markdown_to_html("[manual](https://example.com/motor)")) == ["https://example.com/motor"]
+
+
+def test_comillas_en_href_no_abren_atributos():
+    out = markdown_to_html('[x](https://example.com/"onmouseover="alert(1))')
+    assert 'onmouseover="' not in out
+    for href in hrefs(out):
+        assert '"' not in href and "<" not in href
+    out = markdown_to_html("[x](https://example.com/'onclick='alert(1))")
+    assert "onclick='" not in out
+
+
+def test_ampersand_en_href_escapado():
+    assert hrefs(markdown_to_html("[x](https://example.com/?a=1&b=2)")) == ["https://example.com/?a=1&amp;b=2"]
+
+
+def test_formato_basico():
+    out = markdown_to_html("**negrita** *cursiva*\n\n- uno\n- dos\n\n1. a\n2. b")
+    assert out == (
+        "<p><strong>negrita</strong> <em>cursiva</em></p>"
+        "<ul><li>uno</li><li>dos</li></ul><ol><li>a</li><li>b</li></ol>"
+    )
+
+
+def test_salida_en_una_linea_y_vacia_sin_texto():
+    assert "\n" not in markdown_to_html("uno\ndos\n\ntres")
+    assert render_description("") == ""
+
+
+def test_otro_conversor_invalida_la_instantanea(tmp_path, monkeypatch):
+    path = tmp_path / "modelo.pkl"
+    compile_snapshot(path)
+    assert load_snapshot(path) is not None
+    monkeypatch.setattr(models, "RENDER_FINGERPRINT", "otra")
+    assert load_snapshot(path) is None  # se vuelve a los JSON y el HTML se convierte de nuevo
+    compile_snapshot(path)
+    assert load_snapshot(path) is not None
+
+
+def test_otro_conversor_invalida_la_base(tmp_path, monkeypatch):
+    path = tmp_path / "catalogo.sqlite3"
+    CatalogDB(path).import_models(load_catalog(), load_procedure())
+    assert CatalogDB(path).stale_reason() is None
+    monkeypatch.setattr(catalog_db, "RENDER_FINGERPRINT", "otra")
+    assert "markdown_html.py" in CatalogDB(path).stale_reason()
+    CatalogDB(path).import_models(load_catalog(), load_procedure())
+    assert CatalogDB(path).stale_reason() is None
@@ -0,0 +1,459 @@
+"""Pirámide de teselas estilo Deep Zoom (DZI) y visor con zoom y desplazamiento.
+
+Cada imagen se descompone en niveles que van de 1x1 px hasta la resolución nativa, dividiendo el
+ancho a la mitad de un nivel al siguiente; cada nivel se corta en teselas de TILE_SIZE px con
+TILE_OVERLAP px de solape. El visor solo pide las teselas visibles al zoom actual, de modo que ver
+de cerca una rosca o una junta no obliga a enviar la foto completa.
+
+Las teselas se guardan en static/teselas/<id>_files/<nivel>/<col>_<fila>.jpg (las rutas que espera
+cualquier visor DZI, p. ej. OpenSeadragon). El identificador de la pirámide deriva del hash del
+contenido y de los parámetros de teselado, así que las URL son inmutables. La carpeta tiene un
+tope en bytes con desalojo LRU por pirámide entera.
+
+Dos formas de servirlas:
+  - por defecto, el propio Streamlit en /app/static/teselas/ (mismo origen que la página, vale
+    detrás de un proxy o con HTTPS): al abrir el visor se genera la pirámide entera que falte,
+    con una sola decodificación de la foto;
+  - con MOTOR_IMAGE_SERVING=server, static_server.py en /teselas/, que genera cada nivel al
+    pedirse su primera tesela (una decodificación por nivel).
+MOTOR_TILES_BASE_URL cambia la URL base en cualquiera de los dos modos (p. ej. una ruta relativa
+que el proxy reenvía a static_server.py). Si el navegador no llega a esa base, el visor lo dice.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from asset_index import EXIF_ORIENTATION, content_id, get_asset_index
+from assets import IMAGE_SERVING, STATIC_BASE_URL, STATIC_DIR
+from bundle import get_bundle, image_source
+from paths import BASE_DIR, ELEMENTS_IMG_DIR, STEPS_IMG_DIR
+
+# ===================== Parámetros (ajustables) =====================
+TILE_SIZE = 256     # px
+TILE_OVERLAP = 1    # px de solape entre teselas vecinas (evita costuras al escalar en el navegador)
+TILE_QUALITY = 85   # JPEG
+TILES_DIR = STATIC_DIR / "teselas"  # publicada por Streamlit en /app/static/teselas/ (no versionada)
+TILES_MAX_BYTES = 512 * 1024 * 1024  # tope total del directorio de teselas
+TILES_URL_PREFIX = "/teselas/"  # bajo la URL base: /app/static de Streamlit o la de static_server.py
+TILES_BASE_URL = os.environ.get("MOTOR_TILES_BASE_URL", "")  # vacío: según MOTOR_IMAGE_SERVING
+VIEWER_HEIGHT = 560  # px del visor en la página
+VIEWER_MAX_ZOOM = 4.0  # px de pantalla por px de la foto como máximo
+
+
+class Pyramid(NamedTuple):
+    tile_id: str
+    source: str
+    width: int   # dimensiones tal como se ve la foto (orientación EXIF ya aplicada)
+    height: int
+    orientation: int = 1
+
+    @property
+    def max_level(self) -> int:
+        return math.ceil(math.log2(max(self.width, self.height, 1)))
+
+    def level_size(self, level: int) -> Tuple[int, int]:
+        scale = 2 ** (self.max_level - level)
+        return max(1, math.ceil(self.width / scale)), max(1, math.ceil(self.height / scale))
+
+    def grid(self, level: int) -> Tuple[int, int]:
+        lw, lh = self.level_size(level)
+        return math.ceil(lw / TILE_SIZE), math.ceil(lh / TILE_SIZE)
+
+    def tile_box(self, level: int, col: int, row: int) -> Tuple[int, int, int, int]:
+        """Recorte de la tesela en coordenadas del nivel, con el solape hacia los vecinos que existan."""
+        lw, lh = self.level_size(level)
+        x0 = col * TILE_SIZE - (TILE_OVERLAP if col else 0)
+        y0 = row * TILE_SIZE - (TILE_OVERLAP if row else 0)
+        x1 = min(lw, (col + 1) * TILE_SIZE + TILE_OVERLAP)
+        y1 = min(lh, (row + 1) * TILE_SIZE + TILE_OVERLAP)
+        return x0, y0, x1, y1
+
+    def descriptor(self) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="jpg" Overlap="{TILE_OVERLAP}" TileSize="{TILE_SIZE}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>'
+        )
+
+
+def tile_id(img_path: Path) -> str:
+    """Identificador estable de la pirámide: cambia si cambia la imagen o el teselado."""
+    raw = f"{content_id(img_path)}|{TILE_SIZE}|{TILE_OVERLAP}|{TILE_QUALITY}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+_pyramids: Dict[str, Pyramid] = {}  # tile_id -> pirámide (registradas por el visor o halladas en el índice)
+_pyramids_lock = threading.Lock()
+
+
+def pyramid_for(img_path: Path) -> Pyramid:
+    info = get_asset_index().by_path(img_path)
+    if info is not None:
+        (width, height), orientation = info.display_size, info.orientation
+    else:
+        with Image.open(image_source(img_path)) as im:  # solo cabecera
+            orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+            width, height = im.size[::-1] if orientation in (5, 6, 7, 8) else im.size
+    pyr = Pyramid(tile_id(img_path), str(img_path), width, height, orientation)
+    with _pyramids_lock:
+        _pyramids[pyr.tile_id] = pyr
+    return pyr
+
+
+def find_pyramid(tid: str) -> Optional[Pyramid]:
+    """Pirámide a partir de su id; un servidor en otro proceso la busca entre las imágenes indexadas."""
+    with _pyramids_lock:
+        pyr = _pyramids.get(tid)
+    if pyr is not None:
+        return pyr
+    for info in get_asset_index().assets():
+        if tile_id(Path(info.path)) == tid:
+            return pyramid_for(Path(info.path))
+    bundle = get_bundle()
+    if bundle is not None:  # despliegue sin las carpetas en disco: las imágenes están en el paquete
+        for d in (ELEMENTS_IMG_DIR, STEPS_IMG_DIR):
+            for name in bundle.names_under(d):
+                if tile_id(BASE_DIR / name) == tid:
+                    return pyramid_for(BASE_DIR / name)
+    return None
+
+
+def tile_path(tid: str, level: int, col: int, row: int) -> Path:
+    return TILES_DIR / f"{tid}_files" / str(level) / f"{col}_{row}.jpg"
+
+
+def _render_level(pyr: Pyramid, level: int) -> Image.Image:
+    lw, lh = pyr.level_size(level)
+    rotated = pyr.orientation in (5, 6, 7, 8)
+    with Image.open(image_source(Path(pyr.source))) as im:
+        im.draft("RGB", (lh, lw) if rotated else (lw, lh))  # los niveles pequeños no necesitan decodificar la foto entera
+        img = ImageOps.exif_transpose(im) if pyr.orientation != 1 else im.copy()  # como en build_assets.normalize()
+        img = img.convert("RGB") if img.mode != "RGB" else img
+    if img.size != (lw, lh):
+        img = img.resize((lw, lh), Image.LANCZOS)
+    return img
+
+
+# ===================== Tope del directorio (LRU por pirámide) =====================
+_usage: "OrderedDict[str, int]" = OrderedDict()  # tile_id -> bytes en disco, de menos a más reciente
+_usage_total = 0
+_usage_scanned = False
+_usage_lock = threading.Lock()
+
+
+def _scan_usage() -> None:
+    """Reconstruye el orden LRU a partir del disco (mtime de la carpeta de la pirámide = último uso)."""
+    global _usage_total, _usage_scanned
+    found = []
+    for d in TILES_DIR.glob("*_files") if TILES_DIR.exists() else ():
+        try:
+            size = sum(p.stat().st_size for p in d.rglob("*.jpg"))
+            found.append((d.stat().st_mtime_ns, d.name[: -len("_files")], size))
+        except OSError:
+            continue
+    for _, tid, size in sorted(found):
+        _usage[tid] = size
+        _usage_total += size
+    _usage_scanned = True
+
+
+def _touch(tid: str, added: int = 0) -> None:
+    """Marca la pirámide como la más reciente (con `added` bytes nuevos) y desaloja las más antiguas."""
+    global _usage_total
+    with _usage_lock:
+        if not _usage_scanned:
+            _scan_usage()  # antes de contar lo nuevo: así no se cuenta dos veces
+        moved = next(reversed(_usage), None) != tid
+        _usage[tid] = _usage.get(tid, 0) + added
+        _usage.move_to_end(tid)
+        _usage_total += added
+        evicted: List[str] = []
+        while _usage_total > TILES_MAX_BYTES and len(_usage) > 1:
+            old, size = _usage.popitem(last=False)  # la menos usada recientemente
+            _usage_total -= size
+            evicted.append(old)
+    if moved:
+        try:
+            os.utime(TILES_DIR / f"{tid}_files")  # orden LRU entre reinicios
+        except OSError:
+            pass
+    for old in evicted:
+        shutil.rmtree(TILES_DIR / f"{old}_files", ignore_errors=True)
+        (TILES_DIR / f"{old}.dzi").unlink(missing_ok=True)
+
+
+def tiles_usage() -> Tuple[int, int]:
+    """(pirámides, bytes) en disco según este proceso."""
+    with _usage_lock:
+        return len(_usage), _usage_total
+
+
+_level_locks: Dict[Tuple[str, int], threading.Lock] = {}  # solo los niveles que se están generando
+
+
+def _build_level(pyr: Pyramid, level: int, img: Optional[Image.Image] = None) -> None:
+    """Genera y guarda todas las teselas de un nivel (una decodificación por nivel, no por tesela)."""
+    if img is None:
+        img = _render_level(pyr, level)
+    cols, rows = pyr.grid(level)
+    written = 0
+    for col in range(cols):
+        for row in range(rows):  # la última tesela del nivel se escribe la última: marca el nivel completo
+            out = tile_path(pyr.tile_id, level, col, row)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            buf = io.BytesIO()
+            img.crop(pyr.tile_box(level, col, row)).save(buf, format="JPEG", quality=TILE_QUALITY)
+            tmp = out.with_name(f"{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(buf.getvalue())
+            os.replace(tmp, out)
+            written += len(buf.getvalue())
+    _touch(pyr.tile_id, written)
+
+
+def _level_done(pyr: Pyramid, level: int) -> bool:
+    cols, rows = pyr.grid(level)
+    return tile_path(pyr.tile_id, level, cols - 1, rows - 1).exists()
+
+
+def _locked_build(pyr: Pyramid, level: int, img: Optional[Image.Image] = None) -> None:
+    """Genera el nivel si falta; varias peticiones del mismo nivel a la vez lo generan una sola vez."""
+    key = (pyr.tile_id, level)
+    with _pyramids_lock:
+        lock = _level_locks.setdefault(key, threading.Lock())
+    with lock:
+        if not _level_done(pyr, level):
+            _build_level(pyr, level, img)
+    with _pyramids_lock:
+        if _level_locks.get(key) is lock:  # el nivel ya está en disco: quien llegue después no espera
+            del _level_locks[key]
+
+
+def ensure_tile(tid: str, level: int, col: int, row: int) -> Optional[Path]:
+    """Ruta de la tesela, generando su nivel si hace falta; None si no existe esa tesela."""
+    out = tile_path(tid, level, col, row)
+    if out.exists():
+        _touch(tid)
+        return out
+    pyr = find_pyramid(tid)
+    if pyr is None or not 0 <= level <= pyr.max_level:
+        return None
+    cols, rows = pyr.grid(level)
+    if not (0 <= col < cols and 0 <= row < rows):
+        return None
+    _touch(tid)
+    _locked_build(pyr, level)
+    return out if out.exists() else None
+
+
+def ensure_pyramid(pyr: Pyramid) -> None:
+    """Genera de una vez los niveles que falten, de mayor a menor, reduciendo cada uno del anterior
+    (una sola decodificación de la foto); las teselas quedan listas para servirse como ficheros."""
+    _touch(pyr.tile_id)
+    img: Optional[Image.Image] = None
+    for level in range(pyr.max_level, -1, -1):
+        if _level_done(pyr, level):
+            continue
+        img = _render_level(pyr, level) if img is None else img.resize(pyr.level_size(level), Image.LANCZOS)
+        _locked_build(pyr, level, img)
+    ensure_descriptor(pyr.tile_id)
+
+
+def ensure_descriptor(tid: str) -> Optional[Path]:
+    out = TILES_DIR / f"{tid}.dzi"
+    if out.exists():
+        return out
+    pyr = find_pyramid(tid)
+    if pyr is None:
+        return None
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(pyr.descriptor(), encoding="utf-8")
+    return out
+
+
+# ===================== Visor =====================
+VIEWER_HTML = """
+<div id="dz" style="position:relative;width:100%;height:__HEIGHT__px;background:#1e1e1e;border-radius:6px;
+     overflow:hidden;touch-action:none;cursor:grab;user-select:none">
+  <canvas id="cv" style="display:block;width:100%;height:100%"></canvas>
+  <div style="position:absolute;right:8px;top:8px;display:flex;gap:4px">
+    <button data-k="1.5" title="Acercar">+</button>
+    <button data-k="0.6667" title="Alejar">&minus;</button>
+    <button data-k="0" title="Ajustar">&#8634;</button>
+  </div>
+  <div id="err" style="display:none;position:absolute;inset:0;padding:24px;color:#f0f0f0;
+       font:14px sans-serif;text-align:center;align-items:center;justify-content:center"></div>
+</div>
+<script>
+(function () {
+  const P = __PARAMS__;
+  const box = document.getElementById("dz"), cv = document.getElementById("cv"), ctx = cv.getContext("2d");
+  const cache = new Map();
+  let dpr = 1, fitScale = 1, scale = 1, ox = 0, oy = 0, fitted = true, queued = false, loaded = false;
+
+  function levelFor(s) {  // nivel más pequeño con al menos un px de la pirámide por px físico de pantalla
+    const L = Math.ceil(P.maxLevel + Math.log2(Math.max(s * dpr, 1e-6)));
+    return Math.min(P.maxLevel, Math.max(0, L));
+  }
+  function fit() {
+    const r = box.getBoundingClientRect();
+    fitScale = Math.min(r.width / P.width, r.height / P.height);
+    scale = fitScale; ox = (r.width - P.width * scale) / 2; oy = (r.height - P.height * scale) / 2;
+    fitted = true;
+  }
+  function tile(L, c, r, fetch) {
+    const key = L + "/" + c + "_" + r;
+    let im = cache.get(key);
+    if (!im && fetch) {
+      im = new Image();
+      im.onload = () => { loaded = true; schedule(); };
+      im.onerror = fail;
+      im.src = P.base + "/" + key + ".jpg";
+      cache.set(key, im);
+      if (cache.size > 600) cache.delete(cache.keys().next().value);
+    }
+    return im;
+  }
+  function drawLevel(L, fetch, w, h) {
+    const f = Math.pow(2, L - P.maxLevel), s = scale / f;  // px de pantalla por px del nivel
+    const lw = Math.ceil(P.width * f), lh = Math.ceil(P.height * f);
+    const c0 = Math.max(0, Math.floor(-ox / s / P.tile)), c1 = Math.min(Math.ceil(lw / P.tile) - 1, Math.floor((w - ox) / s / P.tile));
+    const r0 = Math.max(0, Math.floor(-oy / s / P.tile)), r1 = Math.min(Math.ceil(lh / P.tile) - 1, Math.floor((h - oy) / s / P.tile));
+    for (let c = c0; c <= c1; c++) for (let r = r0; r <= r1; r++) {
+      const im = tile(L, c, r, fetch);
+      if (im && im.complete && im.naturalWidth) {
+        const x = c * P.tile - (c ? P.overlap : 0), y = r * P.tile - (r ? P.overlap : 0);
+        ctx.drawImage(im, ox + x * s, oy + y * s, im.naturalWidth * s, im.naturalHeight * s);
+      }
+    }
+  }
+  function draw() {
+    queued = false;
+    const r = box.getBoundingClientRect();
+    dpr = window.devicePixelRatio || 1;
+    if (cv.width !== Math.round(r.width * dpr) || cv.height !== Math.round(r.height * dpr)) {
+      cv.width = Math.round(r.width * dpr); cv.height = Math.round(r.height * dpr);
+    }
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, r.width, r.height);
+    ctx.imageSmoothingQuality = "high";
+    // Fondo: el nivel que cabe entero en el visor; encima, los niveles intermedios ya cargados y,
+    // por último, el nivel que corresponde al zoom actual (el único que se pide al servidor).
+    const base = levelFor(fitScale), target = levelFor(scale);
+    for (let L = Math.min(base, target); L < target; L++) drawLevel(L, L === base, r.width, r.height);
+    drawLevel(target, true, r.width, r.height);
+  }
+  function fail() {  // la URL base no es accesible desde este navegador: se dice en lugar de un visor vacío
+    if (loaded) return;
+    const err = document.getElementById("err");
+    err.textContent = "No se pueden cargar las teselas desde " + new URL(P.base, document.baseURI).href +
+      ". Revise MOTOR_TILES_BASE_URL / MOTOR_IMAGE_SERVING.";
+    err.style.display = "flex";
+  }
+  function schedule() { if (!queued) { queued = true; requestAnimationFrame(draw); } }
+  function zoomAt(x, y, k) {
+    const ns = Math.min(__MAX_ZOOM__, Math.max(fitScale * 0.5, scale * k));
+    k = ns / scale; ox = x - (x - ox) * k; oy = y - (y - oy) * k; scale = ns; fitted = false;
+    schedule();
+  }
+
+  box.addEventListener("wheel", (e) => {
+    e.preventDefault();
+    const r = box.getBoundingClientRect();
+    zoomAt(e.clientX - r.left, e.clientY - r.top, Math.exp(-e.deltaY * 0.0015));
+  }, { passive: false });
+  box.addEventListener("dblclick", (e) => {
+    const r = box.getBoundingClientRect();
+    zoomAt(e.clientX - r.left, e.clientY - r.top, 2);
+  });
+  const pointers = new Map();
+  let pinch = 0;
+  box.addEventListener("pointerdown", (e) => {
+    if (e.target.tagName === "BUTTON") return;
+    box.setPointerCapture(e.pointerId); pointers.set(e.pointerId, [e.clientX, e.clientY]);
+    box.style.cursor = "grabbing";
+  });
+  box.addEventListener("pointermove", (e) => {
+    const prev = pointers.get(e.pointerId);
+    if (!prev) return;
+    pointers.set(e.pointerId, [e.clientX, e.clientY]);
+    if (pointers.size === 2) {  // pellizco: zoom alrededor del punto medio de los dos dedos
+      const [a, b] = [...pointers.values()], d = Math.hypot(a[0] - b[0], a[1] - b[1]);
+      const r = box.getBoundingClientRect();
+      if (pinch) zoomAt((a[0] + b[0]) / 2 - r.left, (a[1] + b[1]) / 2 - r.top, d / pinch);
+      pinch = d;
+    } else {
+      ox += e.clientX - prev[0]; oy += e.clientY - prev[1]; fitted = false; schedule();
+    }
+  });
+  const release = (e) => { pointers.delete(e.pointerId); pinch = 0; box.style.cursor = "grab"; };
+  box.addEventListener("pointerup", release);
+  box.addEventListener("pointercancel", release);
+  box.querySelectorAll("button").forEach((b) => b.addEventListener("click", () => {
+    const k = parseFloat(b.dataset.k), r = box.getBoundingClientRect();
+    if (k) zoomAt(r.width / 2, r.height / 2, k); else { fit(); schedule(); }
+  }));
+  new ResizeObserver(() => { if (fitted) fit(); schedule(); }).observe(box);
+  fit(); draw();
+})();
+</script>
+"""
+
+
+def viewer_html(pyr: Pyramid, base_url: str, height: int = VIEWER_HEIGHT) -> str:
+    params = {
+        "base": f"{base_url.rstrip('/')}{TILES_URL_PREFIX}{pyr.tile_id}_files",
+        "width": pyr.width,
+        "height": pyr.height,
+        "maxLevel": pyr.max_level,
+        "tile": TILE_SIZE,
+        "overlap": TILE_OVERLAP,
+    }
+    return (
+        VIEWER_HTML.replace("__PARAMS__", json.dumps(params))
+        .replace("__HEIGHT__", str(height))
+        .replace("__MAX_ZOOM__", repr(VIEWER_MAX_ZOOM))
+    )
+
+
+def deep_zoom_viewer(img_path: Path, height: int = VIEWER_HEIGHT) -> None:
+    """Visor de la foto a resolución nativa: rueda o pellizco para el zoom, arrastrar para moverse."""
+    import streamlit as st  # import diferido: static_server.py no necesita Streamlit
+
+    pyr = pyramid_for(img_path)
+    if IMAGE_SERVING == "server":
+        import static_server
+
+        if not static_server.ensure_running():  # genera cada nivel al pedirse su primera tesela
+            st.error(f"El servidor de teselas no responde en el puerto {static_server.STATIC_PORT}.")
+            return
+        base_url = TILES_BASE_URL or STATIC_BASE_URL
+        if not base_url:
+            st.error("MOTOR_IMAGE_SERVING=server necesita MOTOR_STATIC_BASE_URL (o MOTOR_TILES_BASE_URL).")
+            return
+    else:
+        base_url = TILES_BASE_URL
+        if not base_url:
+            if not st.get_option("server.enableStaticServing"):
+                st.error("El visor necesita enableStaticServing = true en .streamlit/config.toml.")
+                return
+            prefix = st.get_option("server.baseUrlPath").strip("/")  # mismo origen y misma ruta que la app
+            base_url = f"/{prefix}/app/static" if prefix else "/app/static"
+        with st.spinner("Preparando teselas…"):
+            ensure_pyramid(pyr)  # Streamlit solo sirve ficheros: la pirámide tiene que estar entera
+    html = viewer_html(pyr, base_url, height)
+    if hasattr(st, "iframe"):
+        st.iframe(html, height=height + 8)
+    else:  # Streamlit < 1.52
+        import streamlit.components.v1 as components
+
+        components.html(html, height=height + 8)
@@ -0,0 +1,91 @@
+"""Calentamiento de la caché de derivados al arrancar el servidor.
+
+Uso:
+    python warmup.py [--jobs N] [--max-w 1200] [--max-h 800] [--tiers fast best]
+
+Lee elementos.json y steps.json, resuelve cada imagen con la misma búsqueda que las apps
+(first_existing / all_existing) y genera en paralelo, con un proceso por núcleo, todos los
+derivados de pantalla que aún no existan (bitmap reducido y bytes ya codificados con
+imaging.DISPLAY_ENCODER), para cada nivel de calidad configurado (el del despliegue y los de cada
+clase de dispositivo). Imprime el tiempo de cada imagen y el total.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from asset_index import refresh_index
+from assets import pick_variant
+from derivative_cache import get_cache
+from imaging import (
+    DEVICE_QUALITY_TIERS, DOWNSCALE_MAX_H, DOWNSCALE_MAX_W, QUALITY_TIER, QUALITY_TIERS, display_bytes,
+)
+from models import load_catalog, load_procedure
+from paths import BASE_DIR, ELEMENTS_IMG_DIR, STEPS_IMG_DIR, all_existing, first_existing
+
+
+def collect_images() -> List[Path]:
+    """Imágenes que pueden llegar a mostrarse, sin repetir y en orden de aparición."""
+    found: Dict[Path, None] = {}
+    for el in load_catalog().elements:
+        p = first_existing(ELEMENTS_IMG_DIR, el.images)  # como get_first_image_path()
+        if p is not None:
+            found[p] = None
+    for step in load_procedure().steps:
+        for p in all_existing(STEPS_IMG_DIR, step.images):  # como step_images_paths()
+            found[p] = None
+    return list(found)
+
+
+def render(path: str, max_w: int, max_h: int, tier: str) -> Tuple[float, str]:
+    """Se ejecuta en un proceso del pool: devuelve (ms, qué se hizo)."""
+    t0 = time.perf_counter()
+    p = Path(path)
+    if pick_variant(p, max_w, max_h) is not None:
+        status = "variante"  # build_assets.py ya la dejó lista: no hay nada que decodificar
+    else:
+        cache = get_cache()
+        hits = cache.hits
+        display_bytes(p, max_w, max_h, tier)
+        status = "en caché" if cache.hits > hits else "generado"
+    return (time.perf_counter() - t0) * 1000.0, status
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="procesos en paralelo")
+    ap.add_argument("--max-w", type=int, default=DOWNSCALE_MAX_W)
+    ap.add_argument("--max-h", type=int, default=DOWNSCALE_MAX_H)
+    ap.add_argument("--tiers", nargs="+", choices=QUALITY_TIERS,
+                    default=sorted({QUALITY_TIER, *DEVICE_QUALITY_TIERS.values()}),
+                    help="niveles de calidad a calentar (por defecto, los configurados)")
+    args = ap.parse_args()
+
+    refresh_index()  # índice de imágenes al día (también detecta originales sobrescritos)
+    images = collect_images()
+    t0 = time.perf_counter()
+    counts: Dict[str, int] = {}
+    cpu_ms = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            (p, tier): pool.submit(render, str(p), args.max_w, args.max_h, tier) for tier in args.tiers for p in images
+        }
+        for (p, tier), fut in futures.items():
+            try:
+                ms, status = fut.result()
+            except Exception as e:  # una imagen corrupta no debe impedir calentar el resto
+                ms, status = 0.0, f"error: {e}"
+            cpu_ms += ms
+            counts[status.split(":")[0]] = counts.get(status.split(":")[0], 0) + 1
+            print(f"{ms:8.1f} ms  {tier:8}  {status:10}  {p.relative_to(BASE_DIR)}")
+
+    wall = time.perf_counter() - t0
+    summary = ", ".join(f"{n} {k}" for k, n in sorted(counts.items()))
+    print(f"\n{len(images)} imágenes x {len(args.tiers)} nivel(es) ({summary}) en {wall:.2f} s "
+          f"({cpu_ms / 1000.0:.2f} s de trabajo, {args.jobs} procesos)")
+
+
+if __name__ == "__main__":
+    main()